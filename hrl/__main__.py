@@ -2,6 +2,7 @@ import time
 import os
 import random
 import argparse
+from functools import partial
 
 import gym
 import d4rl
@@ -9,10 +10,14 @@ import torch
 import seeding
 import numpy as np
 
-from hrl.wrappers.antmaze_wrapper import D4RLAntMazeWrapper
+from hrl.wrappers.antmaze_wrapper import D4RLAntMazeWrapper, make_antmaze_mdp
+from hrl.wrappers.mdp_pool import GoalConditionedMDPPool
+from hrl.agent.td3.async_learner import AsyncTD3Learner
 from hrl.utils import create_log_dir
 from hrl.agent.dsc.dsc import RobustDSC
 from hrl.agent.dsc.dst import RobustDST
+from hrl.agent.dsc.evaluation import EvaluationPool
+from hrl.agent.dsc.classifier_backends import CLASSIFIER_BACKENDS
 
 
 if __name__ == "__main__":
@@ -47,13 +52,74 @@ if __name__ == "__main__":
     parser.add_argument("--lr_a", type=float, help="actor learning rate")
     parser.add_argument("--use_skill_trees", action="store_true", default=False)
     parser.add_argument("--max_num_children", type=int, default=1, help="Max number of children per option in the tree")
+    parser.add_argument("--fused_td3_update", action="store_true", default=False,
+                        help="compute the twin critic in a single pass (bit-identical gradients)")
+    parser.add_argument("--compile_td3_update", action="store_true", default=False,
+                        help="torch.compile the TD3 loss computations (requires torch>=2.0)")
+    parser.add_argument("--use_numpy_actor", action="store_true", default=False,
+                        help="evaluate TD3 actors with a NumPy copy of their weights (model-free, CPU)")
+    parser.add_argument("--prioritized_replay", action="store_true", default=False,
+                        help="sample TD3 minibatches with proportional prioritized replay")
+    parser.add_argument("--value_cache_updates", type=int, default=0,
+                        help="memoize V(s, g) queries, invalidating the cache every _ TD3 updates (0 disables it)")
+    parser.add_argument("--init_raster_resolution", type=float, default=0.,
+                        help="cell size of the grid rasters used for initiation-set lookups (0 uses the exact classifiers)")
+    parser.add_argument("--refit_every", type=int, default=1,
+                        help="refit initiation classifiers after every _ new trajectories, or earlier on detected drift")
+    parser.add_argument("--spill_example_states", action="store_true", default=False,
+                        help="keep the full states of initiation-classifier examples in an on-disk side store")
+    parser.add_argument("--max_classifier_examples", type=int, default=0,
+                        help="cap on the number of examples each initiation classifier is fit on (0 disables the cap)")
+    parser.add_argument("--coreset_method", type=str, default="grid", choices=["grid", "k_center"],
+                        help="how to subsample initiation-classifier examples when they exceed the cap")
+    parser.add_argument("--classifier_backend", type=str, default="thundersvm", choices=list(CLASSIFIER_BACKENDS),
+                        help="library used to fit the initiation classifiers; rff/nystroem fit linear SVMs on "
+                             "approximate kernel features")
+    parser.add_argument("--num_kernel_features", type=int, default=256,
+                        help="dimension of the approximate kernel feature map")
+    parser.add_argument("--classifier_fit_workers", type=int, default=0,
+                        help="fit initiation classifiers in a pool of _ background workers (0 fits them synchronously)")
+    parser.add_argument("--num_warmup_envs", type=int, default=0,
+                        help="collect warmup transitions from _ envs stepped in parallel subprocesses (0 uses the main env)")
+    parser.add_argument("--checkpoint_frequency", type=int, default=0,
+                        help="checkpoint the whole experiment after every _ episodes (0 disables checkpointing)")
+    parser.add_argument("--resume", action="store_true", default=False,
+                        help="resume from the last checkpoint of this experiment and seed, if one exists")
+    parser.add_argument("--async_td3_learner", action="store_true", default=False,
+                        help="run TD3 gradient updates in a learner process, decoupled from acting")
+    parser.add_argument("--learner_publish_every", type=int, default=100,
+                        help="gradient updates between two weight publications of the async TD3 learner")
+    parser.add_argument("--learner_threads", type=int, default=0,
+                        help="torch threads of the async TD3 learner process (0 keeps the torch default)")
+    parser.add_argument("--num_eval_workers", type=int, default=0,
+                        help="run test rollouts in _ worker processes on a snapshot of the agent (0 runs them inline)")
+    parser.add_argument("--num_eval_episodes", type=int, default=1,
+                        help="number of test rollouts per evaluation")
+    parser.add_argument("--nearest_option_index", action="store_true", default=False,
+                        help="find the nearest option with a KD-tree over the option regions (approximate)")
+    parser.add_argument("--max_queued_plots", type=int, default=0,
+                        help="render the logged plots in a background thread, keeping at most _ queued (0 plots synchronously)")
+    parser.add_argument("--num_threads", type=int, default=0,
+                        help="cap on the intra-op threads used by torch (0 keeps the torch default)")
     args = parser.parse_args()
 
+    if args.num_threads > 0:
+        torch.set_num_threads(args.num_threads)
+
     assert args.use_model or args.use_value_function
 
     if not args.use_value_function:
         assert not args.use_global_value_function
 
+    # The learner process owns the optimizer states, which checkpoints don't capture
+    assert not (args.async_td3_learner and args.checkpoint_frequency > 0)
+
+    # Evaluation snapshots are pickled, which rules out thundersvm classifiers
+    assert args.num_eval_workers == 0 or CLASSIFIER_BACKENDS[args.classifier_backend].picklable
+
+    # Background plots classify with the classifiers that training is using, which rules out thundersvm
+    assert args.max_queued_plots == 0 or CLASSIFIER_BACKENDS[args.classifier_backend].thread_safe
+
     if args.use_skill_trees:
         assert args.max_num_children > 1, f"{args.use_skill_trees, args.max_num_children}"
 
@@ -75,6 +141,24 @@ if __name__ == "__main__":
     else:
         raise NotImplementedError("Environment not supported!")
 
+    warmup_mdp_pool = None
+    if args.num_warmup_envs > 0:
+        warmup_mdp_pool = GoalConditionedMDPPool(partial(make_antmaze_mdp, args.environment, goal_state,
+                                                         args.use_dense_rewards),
+                                                 num_envs=args.num_warmup_envs,
+                                                 state_dim=env.state_space_size(),
+                                                 action_dim=env.action_space_size(),
+                                                 seed=args.seed)
+
+    td3_learner = None
+    if args.async_td3_learner:
+        td3_learner = AsyncTD3Learner(publish_every=args.learner_publish_every, num_threads=args.learner_threads)
+
+    evaluator = None
+    if args.num_eval_workers > 0:
+        evaluator = EvaluationPool(partial(make_antmaze_mdp, args.environment, goal_state, args.use_dense_rewards),
+                                   num_workers=args.num_eval_workers, seed=args.seed)
+
     kwargs = {
             "mdp":env,
             "gestation_period": args.gestation_period,
@@ -95,7 +179,28 @@ if __name__ == "__main__":
             "seed": args.seed,
             "lr_c": args.lr_c,
             "lr_a": args.lr_a,
-            "max_num_children": args.max_num_children
+            "max_num_children": args.max_num_children,
+            "fused_td3_update": args.fused_td3_update,
+            "compile_td3_update": args.compile_td3_update,
+            "use_numpy_actor": args.use_numpy_actor,
+            "prioritized_replay": args.prioritized_replay,
+            "checkpoint_freq": args.checkpoint_frequency,
+            "value_cache_updates": args.value_cache_updates,
+            "init_raster_resolution": args.init_raster_resolution,
+            "refit_every": args.refit_every,
+            "spill_example_states": args.spill_example_states,
+            "max_classifier_examples": args.max_classifier_examples,
+            "coreset_method": args.coreset_method,
+            "classifier_backend": args.classifier_backend,
+            "num_kernel_features": args.num_kernel_features,
+            "classifier_fit_workers": args.classifier_fit_workers,
+            "warmup_mdp_pool": warmup_mdp_pool,
+            "td3_learner": td3_learner,
+            "evaluator": evaluator,
+            "num_eval_episodes": args.num_eval_episodes,
+            "nearest_option_index": args.nearest_option_index,
+            "max_queued_plots": args.max_queued_plots,
+            "results_dir": args.results_dir,
     }
 
     exp = RobustDST(**kwargs) if args.use_skill_trees else RobustDSC(**kwargs)
@@ -106,9 +211,18 @@ if __name__ == "__main__":
     create_log_dir(os.path.join(saving_dir, "initiation_set_plots/"))
     create_log_dir(os.path.join(saving_dir, "value_function_plots/"))
 
+    start_episode = exp.resume_from_checkpoint() if args.resume else 0
+
     start_time = time.time()
-    durations = exp.run_loop(args.episodes, args.steps)
+    durations = exp.run_loop(args.episodes - start_episode, args.steps, start_episode=start_episode)
     end_time = time.time()
 
+    if warmup_mdp_pool is not None:
+        warmup_mdp_pool.close()
+    if td3_learner is not None:
+        td3_learner.close()
+    if evaluator is not None:
+        evaluator.shutdown()
+
     print("Time taken: ", end_time - start_time)
 
@@ -1,21 +1,27 @@
+import os
 import random
-import itertools
-from copy import deepcopy
 
-import torch
 import numpy as np
 from scipy.spatial import distance
-from thundersvm import OneClassSVM, SVC
 
 from hrl.agent.dynamics.mpc import MPC
 from hrl.agent.td3.TD3AgentClass import TD3
+from hrl.agent.dsc.example_store import ExampleStore
+from hrl.agent.dsc.trajectory_buffer import TrajectoryBuffer
+from hrl.agent.dsc.classifier_fitting import fit_initiation_classifiers, make_raster
+from hrl.agent.dsc.classifier_backends import make_classifier_backend
 
 
 class ModelBasedOption(object):
     def __init__(self, *, name, parent, mdp, global_solver, global_value_learner, buffer_length, global_init,
                  gestation_period, timeout, max_steps, device, use_vf, use_global_vf, use_model, dense_reward,
                  option_idx, lr_c, lr_a, max_num_children=1, init_salient_event=None, target_salient_event=None,
-                 path_to_model="", multithread_mpc=False):
+                 path_to_model="", multithread_mpc=False, fused_td3_update=False, compile_td3_update=False,
+                 use_numpy_actor=False, prioritized_replay=False, value_cache_updates=0,
+                 init_raster_resolution=0., refit_every=1,
+                 example_state_dir=None, max_classifier_examples=0, coreset_method="grid",
+                 classifier_backend="thundersvm", num_kernel_features=256,
+                 classifier_fitter=None, td3_learner=None):
         self.mdp = mdp
         self.name = name
         self.lr_c = lr_c
@@ -35,6 +41,12 @@ class ModelBasedOption(object):
         self.init_salient_event = init_salient_event
         self.target_salient_event = target_salient_event
         self.multithread_mpc = multithread_mpc
+        self.init_raster_resolution = init_raster_resolution
+        self.refit_every = refit_every
+        self.max_classifier_examples = max_classifier_examples
+        self.coreset_method = coreset_method
+        self.classifier_backend = make_classifier_backend(classifier_backend, num_kernel_features)
+        self.classifier_fitter = classifier_fitter
 
         # TODO
         self.overall_mdp = mdp
@@ -45,24 +57,48 @@ class ModelBasedOption(object):
         self.num_executions = 0
         self.gestation_period = gestation_period
 
-        self.positive_examples = []
-        self.negative_examples = []
+        # Classifier features of the examples; full states are only kept if `example_state_dir` is given
+        self.positive_examples = ExampleStore(self._get_side_store_path(example_state_dir, "positive"))
+        self.negative_examples = ExampleStore(self._get_side_store_path(example_state_dir, "negative"))
         self.optimistic_classifier = None
         self.pessimistic_classifier = None
 
+        # Optional grid rasters of the classifiers, used for O(1) membership queries
+        self.optimistic_raster = None
+        self.pessimistic_raster = None
+
+        # Trajectories added to the example sets since the classifiers were last fit
+        self.num_new_trajectories = 0
+        self.drift_detected = False
+
+        # Bumped whenever the classifiers (or their rasters) change; invalidates classification caches
+        self.classifier_version = 0
+        self._subgoal_cache = None
+        self._pessimistic_region_cache = None
+
+        # Background classifier fit (see `fit_initiation_classifier`), swapped in by `sync_initiation_classifier`
+        self._pending_fit = None
+
         # In the model-free setting, the output norm doesn't seem to work
         # But it seems to stabilize off policy value function learning
         # Therefore, only use output norm if we are using MPC for action selection
         use_output_norm = self.use_model
 
         if not self.use_global_vf or global_init:
-            self.value_learner = TD3(state_dim=self.mdp.state_space_size()+2,
-                                    action_dim=self.mdp.action_space_size(),
-                                    max_action=1.,
-                                    name=f"{name}-td3-agent",
-                                    device=self.device,
-                                    lr_c=lr_c, lr_a=lr_a,
-                                    use_output_normalization=use_output_norm)
+            # With an AsyncTD3Learner, gradient updates happen in the learner process and weights are synced back
+            make_td3 = td3_learner.make_agent if td3_learner is not None else TD3
+            self.value_learner = make_td3(state_dim=self.mdp.state_space_size()+2,
+                                          action_dim=self.mdp.action_space_size(),
+                                          max_action=1.,
+                                          name=f"{name}-td3-agent",
+                                          device=self.device,
+                                          lr_c=lr_c, lr_a=lr_a,
+                                          use_output_normalization=use_output_norm,
+                                          fused_update=fused_td3_update,
+                                          compile_update=compile_td3_update,
+                                          use_numpy_actor=use_numpy_actor,
+                                          prioritized_replay=prioritized_replay,
+                                          value_cache_updates=value_cache_updates)
 
         self.global_value_learner = global_value_learner if not self.global_init else None  # type: TD3
 
@@ -88,6 +124,11 @@ class ModelBasedOption(object):
 
         self.is_last_option = False
 
+    def _get_side_store_path(self, example_state_dir, label):
+        if example_state_dir is None:
+            return None
+        return os.path.join(example_state_dir, f"{self.name}_{label}_states.bin")
+
     def _get_model_based_solver(self):
         assert self.use_model
 
@@ -137,7 +178,7 @@ class ModelBasedOption(object):
             return True
 
         features = self.mdp.extract_features_for_initiation_classifier(state)
-        return self.optimistic_classifier.predict([features])[0] == 1 or self.pessimistic_is_init_true(state)
+        return self.optimistic_predict([features])[0] or self.pessimistic_is_init_true(state)
 
     def is_term_true(self, state):
         if self.parent is None:
@@ -146,12 +187,35 @@ class ModelBasedOption(object):
         # TODO change
         return self.parent.pessimistic_is_init_true(state)
 
+    def batched_is_term_true(self, states):
+        """ `is_term_true` over a (N, D) matrix of states. """
+        if self.parent is None:
+            return self.target_salient_event(states[:, :2])  # batched salient events take positions
+        features = self.mdp.extract_features_for_initiation_classifier(states)
+        return self.parent.batched_pessimistic_is_init_true(features)
+
     def pessimistic_is_init_true(self, state):
         if self.global_init or self.get_training_phase() == "gestation":
             return True
 
         features = self.mdp.extract_features_for_initiation_classifier(state)
-        return self.pessimistic_classifier.predict([features])[0] == 1
+        return self.pessimistic_predict([features])[0]
+
+    def batched_pessimistic_is_init_true(self, features):
+        """ `pessimistic_is_init_true` over a (N, K) matrix of classifier features. """
+        if self.global_init or self.get_training_phase() == "gestation":
+            return np.ones(len(features), dtype=bool)
+        return self.pessimistic_predict(features)
+
+    def optimistic_predict(self, features):
+        """ Batched membership test for the optimistic region; uses the raster when one is available. """
+        classifier = self.optimistic_raster if self.optimistic_raster is not None else self.optimistic_classifier
+        return classifier.predict(features) == 1
+
+    def pessimistic_predict(self, features):
+        """ Batched membership test for the pessimistic region; uses the raster when one is available. """
+        classifier = self.pessimistic_raster if self.pessimistic_raster is not None else self.pessimistic_classifier
+        return classifier.predict(features) == 1
 
     def is_at_local_goal(self, state, goal):
         """ Goal-conditioned termination condition. """
@@ -160,6 +224,11 @@ class ModelBasedOption(object):
         reached_term = self.is_term_true(state)
         return reached_goal and reached_term
 
+    def batched_is_at_local_goal(self, states, goals):
+        """ `is_at_local_goal` over (N, D) states and their (N, G) goals. """
+        reached_goal = self.mdp.sparse_gc_reward_func(states, goals, batched=True)[1]
+        return reached_goal & self.batched_is_term_true(states)
+
     # ------------------------------------------------------------
     # Control Loop Methods
     # ------------------------------------------------------------
@@ -191,6 +260,10 @@ class ModelBasedOption(object):
 
         self.solver.step(state, action, reward, next_state, next_done)
 
+    def batched_update_model(self, states, actions, rewards, next_states, dones):
+        """ `update_model` for a batch of transitions (model-based options only). """
+        self.solver.batched_step(states, actions, rewards, next_states, dones)
+
     def get_goal_for_rollout(self):
         """ Sample goal to pursue for option rollout. """
 
@@ -208,15 +281,14 @@ class ModelBasedOption(object):
     def rollout(self, step_number, rollout_goal=None, eval_mode=False):
         """ Main option control loop. """
 
-        start_state = deepcopy(self.mdp.cur_state)
+        start_state = self.mdp.cur_state
         assert self.is_init_true(start_state)
 
         num_steps = 0
         total_reward = 0
-        visited_states = []
-        option_transitions = []
 
-        state = deepcopy(self.mdp.cur_state)
+        state = self.mdp.cur_state
+        trajectory = TrajectoryBuffer(state, self.mdp.action_space_size(), capacity=self.timeout)
         goal = self.get_goal_for_rollout() if rollout_goal is None else rollout_goal
 
         print(f"[Step: {step_number}] Rolling out {self.name}, from {state[:2]} targeting {goal}")
@@ -236,11 +308,10 @@ class ModelBasedOption(object):
             num_steps += 1
             step_number += 1
             total_reward += reward
-            visited_states.append(state)
-            option_transitions.append((state, action, reward, next_state, next_done))
-            state = deepcopy(self.mdp.cur_state)
+            trajectory.append(action, reward, next_state, next_done)
+            state = self.mdp.cur_state
 
-        visited_states.append(state)
+        visited_states = trajectory.visited_states
         reached_term = self.is_term_true(state)
         self.success_curve.append(reached_term)
 
@@ -249,7 +320,7 @@ class ModelBasedOption(object):
             self.effect_set.append(state)
 
         if self.use_vf and not eval_mode:
-            self.update_value_function(option_transitions,
+            self.update_value_function(trajectory,
                                     pursued_goal=goal,
                                     reached_goal=self.extract_goal_dimensions(state))
 
@@ -259,21 +330,22 @@ class ModelBasedOption(object):
         if not self.global_init and init_update_condition:
             self.derive_positive_and_negative_examples(visited_states)
 
-        # Always be refining your initiation classifier
-        if not self.global_init and not eval_mode:
+        # Keep refining your initiation classifier as new examples come in
+        if not self.global_init and not eval_mode and self.should_refit_initiation_classifier():
             self.fit_initiation_classifier()
+        self.sync_initiation_classifier()
 
-        return option_transitions, total_reward
+        return trajectory, total_reward
 
     # ------------------------------------------------------------
     # Hindsight Experience Replay
     # ------------------------------------------------------------
 
-    def update_value_function(self, option_transitions, reached_goal, pursued_goal):
+    def update_value_function(self, trajectory, reached_goal, pursued_goal):
         """ Update the goal-conditioned option value function. """
 
-        self.experience_replay(option_transitions, pursued_goal)
-        self.experience_replay(option_transitions, reached_goal)
+        self.experience_replay(trajectory, pursued_goal)
+        self.experience_replay(trajectory, reached_goal)
 
     def initialize_value_function_with_global_value_function(self):
         self.value_learner.actor.load_state_dict(self.global_value_learner.actor.state_dict())
@@ -285,7 +357,7 @@ class ModelBasedOption(object):
         assert isinstance(goal, np.ndarray)
         goal_features = goal
         if "ant" in self.mdp.unwrapped.spec.id:
-            return goal_features[:2]
+            return goal_features[..., :2]
         raise NotImplementedError(f"{self.mdp.env_name}")
 
     def get_augmented_state(self, state, goal):
@@ -294,23 +366,35 @@ class ModelBasedOption(object):
         goal_position = self.extract_goal_dimensions(goal)
         return np.concatenate((state, goal_position))
 
+    def get_batched_augmented_states(self, states, goals):
+        assert isinstance(states, np.ndarray) and states.ndim == 2, states
+        assert isinstance(goals, np.ndarray) and goals.shape[0] == states.shape[0], goals
+
+        return np.concatenate((states, self.extract_goal_dimensions(goals)), axis=1)
+
     def experience_replay(self, trajectory, goal_state):
-        for state, action, reward, next_state, next_done in trajectory:
-            augmented_state = self.get_augmented_state(state, goal=goal_state)
-            augmented_next_state = self.get_augmented_state(next_state, goal=goal_state)
-            done = self.is_at_local_goal(next_state, goal_state)
+        """ Relabel the transitions of `trajectory` (a TrajectoryBuffer) with `goal_state` and train on them. """
+        if len(trajectory) == 0:
+            return
 
-            reward_func = self.overall_mdp.dense_gc_reward_func if self.dense_reward \
-                else self.overall_mdp.sparse_gc_reward_func
-            reward, global_done = reward_func(next_state, goal_state)
+        goals = np.broadcast_to(goal_state, (len(trajectory), len(goal_state)))
+        augmented_states = self.get_batched_augmented_states(trajectory.states, goals)
+        augmented_next_states = self.get_batched_augmented_states(trajectory.next_states, goals)
+        dones = self.batched_is_at_local_goal(trajectory.next_states, goals)
 
+        reward_func = self.overall_mdp.dense_gc_reward_func if self.dense_reward \
+            else self.overall_mdp.sparse_gc_reward_func
+        rewards, global_dones = reward_func(trajectory.next_states, goals, batched=True)
+
+        for i, action in enumerate(trajectory.actions):
             if not self.use_global_vf or self.global_init:
-                self.value_learner.step(augmented_state, action, reward, augmented_next_state, done)
+                self.value_learner.step(augmented_states[i], action, rewards[i], augmented_next_states[i], dones[i])
 
             # Off-policy updates to the global option value function
             if not self.global_init:
                 assert self.global_value_learner is not None
-                self.global_value_learner.step(augmented_state, action, reward, augmented_next_state, global_done)
+                self.global_value_learner.step(augmented_states[i], action, rewards[i], augmented_next_states[i],
+                                               global_dones[i])
 
     def value_function(self, states, goals):
         assert isinstance(states, np.ndarray)
@@ -323,7 +407,6 @@ class ModelBasedOption(object):
 
         goal_positions = goals[:, :2]
         augmented_states = np.concatenate((states, goal_positions), axis=1)
-        augmented_states = torch.as_tensor(augmented_states).float().to(self.device)
 
         if self.use_global_vf and not self.global_init:
             values = self.global_value_learner.get_values(augmented_states)
@@ -356,67 +439,116 @@ class ModelBasedOption(object):
 
     def sample_from_initiation_region_fast(self):
         """ Sample from the pessimistic initiation classifier. """
-        num_tries = 0
-        sampled_state = None
-        while sampled_state is None and num_tries < 200:
-            num_tries = num_tries + 1
-            sampled_trajectory_idx = random.choice(range(len(self.positive_examples)))
-            sampled_trajectory = self.positive_examples[sampled_trajectory_idx]
-            sampled_state = self.get_first_state_in_classifier(sampled_trajectory)
-        return sampled_state
+        if len(self.positive_examples) == 0:
+            return None
+
+        if self.global_init or self.get_training_phase() == "gestation":
+            sampled_trajectory_idx = random.randrange(len(self.positive_examples))
+            return self.positive_examples[sampled_trajectory_idx][0]
+
+        _, inside_rows = self.get_subgoal_rows()
+        return self._sample_first_row_of_random_trajectory(inside_rows)
 
     def sample_from_initiation_region_fast_and_epsilon(self):
-        """ Sample from the pessimistic initiation classifier. """
-        def compile_states(s):
-            pos0 = self.mdp.get_position(s)
-            pos1 = np.copy(pos0)
-            pos1[0] -= self.target_salient_event.tolerance
-            pos2 = np.copy(pos0)
-            pos2[0] += self.target_salient_event.tolerance
-            pos3 = np.copy(pos0)
-            pos3[1] -= self.target_salient_event.tolerance
-            pos4 = np.copy(pos0)
-            pos4[1] += self.target_salient_event.tolerance
-            return pos0, pos1, pos2, pos3, pos4
-
-        idxs = [i for i in range(len(self.positive_examples))]
-        random.shuffle(idxs)
-
-        for idx in idxs:
-            sampled_trajectory = self.positive_examples[idx]
-            states = []
-            for s in sampled_trajectory:
-                states.extend(compile_states(s))
-
-            position_matrix = np.vstack(states)
-            # optimistic_predictions = self.optimistic_classifier.predict(position_matrix) == 1
-            # pessimistic_predictions = self.pessimistic_classifier.predict(position_matrix) == 1
-            # predictions = np.logical_or(optimistic_predictions, pessimistic_predictions)
-            predictions = self.pessimistic_classifier.predict(position_matrix) == 1
-            predictions = np.reshape(predictions, (-1, 5))
-            valid = np.all(predictions, axis=1)
-            indices = np.argwhere(valid == True)
-            if len(indices) > 0:
-                return sampled_trajectory[indices[0][0]]
-
-        return self.sample_from_initiation_region_fast()
+        """ Sample from the pessimistic initiation classifier, away from the edges of its region. """
+        if len(self.positive_examples) == 0:
+            return None
+
+        valid_rows, _ = self.get_subgoal_rows()
+        sampled_state = self._sample_first_row_of_random_trajectory(valid_rows)
+
+        if sampled_state is None:
+            return self.sample_from_initiation_region_fast()
+
+        return sampled_state
+
+    def get_subgoal_rows(self):
+        """
+        Classify every stored positive example for subgoal sampling, in one batched predict.
+
+        Returns two boolean masks over the rows of `positive_examples`: `valid_rows` marks the states that
+        are inside the pessimistic region along with all 4 of their neighbors at +/- `tolerance` along x and y,
+        `inside_rows` the states that are inside the pessimistic region. The masks are cached until the
+        classifier or the training phase changes (in gestation, every row is marked); examples added in the
+        meantime are classified incrementally.
+        """
+        feature_matrix = self.positive_examples.feature_matrix()
+
+        cache_key = (self.classifier_version, self.global_init, self.get_training_phase())
+        if self._subgoal_cache is None or self._subgoal_cache[0] != cache_key:
+            self._subgoal_cache = (cache_key, np.zeros(0, dtype=bool), np.zeros(0, dtype=bool))
+
+        cache_key, valid_rows, inside_rows = self._subgoal_cache
+        if len(valid_rows) < feature_matrix.shape[0]:
+            new_valid_rows, new_inside_rows = self._classify_subgoal_candidates(feature_matrix[len(valid_rows):])
+            valid_rows = np.concatenate((valid_rows, new_valid_rows))
+            inside_rows = np.concatenate((inside_rows, new_inside_rows))
+            self._subgoal_cache = (cache_key, valid_rows, inside_rows)
+
+        return valid_rows, inside_rows
+
+    def _classify_subgoal_candidates(self, feature_matrix):
+        if self.global_init or self.get_training_phase() == "gestation":
+            inside = np.ones(feature_matrix.shape[0], dtype=bool)
+            return inside, inside
+
+        # Each position along with its 4 neighbors at +/- tolerance, shape (N, 5, 2)
+        tolerance = self.target_salient_event.tolerance
+        offsets = np.array([[0., 0.], [-tolerance, 0.], [tolerance, 0.], [0., -tolerance], [0., tolerance]])
+        positions = feature_matrix[:, None, :2] + offsets[None, :, :]
+
+        predictions = self.pessimistic_predict(positions.reshape(-1, 2)).reshape(-1, 5)
+        return predictions.all(axis=1), predictions[:, 0]
+
+    def _sample_first_row_of_random_trajectory(self, row_mask):
+        """ First state marked in `row_mask` of a random positive trajectory that has one (None if none does). """
+        marked_rows = np.flatnonzero(row_mask)
+        offsets = np.asarray(self.positive_examples.offsets)
+
+        # First marked row at or after the start of each trajectory; it belongs to that trajectory if it is before the end
+        first_rows = np.searchsorted(marked_rows, offsets[:-1])
+        has_marked_row = first_rows < len(marked_rows)
+        has_marked_row[has_marked_row] = marked_rows[first_rows[has_marked_row]] < offsets[1:][has_marked_row]
+
+        candidates = first_rows[has_marked_row]
+        if len(candidates) == 0:
+            return None
+
+        return self.positive_examples.feature_matrix()[marked_rows[random.choice(candidates)]]
 
     def derive_positive_and_negative_examples(self, visited_states):
+        """ Derive initiation examples from the (N, D) states visited by a rollout. """
         start_state = visited_states[0]
         final_state = visited_states[-1]
 
         if self.is_term_true(final_state):
-            positive_states = [start_state] + visited_states[-self.buffer_length:]
-            self.positive_examples.append(positive_states)
+            positive_states = np.concatenate((visited_states[:1], visited_states[-self.buffer_length:]))
+            self.positive_examples.append(self.construct_feature_matrix([positive_states]), states=positive_states)
+            self.register_new_trajectory(self.positive_examples[-1], is_positive=True)
         else:
             negative_examples = [start_state]
-            self.negative_examples.append(negative_examples)
-
-    def should_change_negative_examples(self):
-        should_change = []
-        for negative_example in self.negative_examples:
-            should_change += [self.does_model_rollout_reach_goal(negative_example[0])]
-        return should_change
+            self.negative_examples.append(self.construct_feature_matrix([negative_examples]), states=negative_examples)
+            self.register_new_trajectory(self.negative_examples[-1], is_positive=False)
+
+    def register_new_trajectory(self, features, is_positive):
+        """ Mark the classifiers as stale and check whether the new examples contradict them. """
+        self.num_new_trajectories += 1
+
+        if self.refit_every > 1 and not self.drift_detected and self.pessimistic_classifier is not None:
+            if is_positive:
+                # Most of a successful trajectory falls outside of the optimistic region
+                self.drift_detected = self.optimistic_predict(features).mean() < 0.5
+            else:
+                # A failed start state lies inside the pessimistic region
+                self.drift_detected = self.pessimistic_predict(features).any()
+
+    def should_refit_initiation_classifier(self):
+        """ Refit only when the examples changed: every `refit_every` new trajectories or on drift. """
+        if self.num_new_trajectories == 0:
+            return False
+        if self.optimistic_classifier is None:
+            return True
+        return self.num_new_trajectories >= self.refit_every or self.drift_detected
 
     def does_model_rollout_reach_goal(self, state):
         sampled_goal = self.get_goal_for_rollout()
@@ -424,54 +556,111 @@ class ModelBasedOption(object):
         farthest_position = final_states[:, :2].max(axis=0)
         return self.is_term_true(farthest_position)
 
-    def fit_initiation_classifier(self):
-        if len(self.negative_examples) > 0 and len(self.positive_examples) > 0:
-            self.train_two_class_classifier()
-        elif len(self.positive_examples) > 0:
-            self.train_one_class_svm()
-
-    def construct_feature_matrix(self, examples):
-        states = list(itertools.chain.from_iterable(examples))
-        positions = [self.mdp.extract_features_for_initiation_classifier(state) for state in states]
-        return np.array(positions)
-
-    def train_one_class_svm(self, nu=0.1):  # TODO: Implement gamma="auto" for thundersvm
-        positive_feature_matrix = self.construct_feature_matrix(self.positive_examples)
-        self.pessimistic_classifier = OneClassSVM(kernel="rbf", nu=nu)
-        self.pessimistic_classifier.fit(positive_feature_matrix)
-
-        self.optimistic_classifier = OneClassSVM(kernel="rbf", nu=nu/10.)
-        self.optimistic_classifier.fit(positive_feature_matrix)
-
-    def train_two_class_classifier(self, nu=0.1):
-        positive_feature_matrix = self.construct_feature_matrix(self.positive_examples)
-        negative_feature_matrix = self.construct_feature_matrix(self.negative_examples)
-        positive_labels = [1] * positive_feature_matrix.shape[0]
-        negative_labels = [0] * negative_feature_matrix.shape[0]
-
-        X = np.concatenate((positive_feature_matrix, negative_feature_matrix))
-        Y = np.concatenate((positive_labels, negative_labels))
-
-        if negative_feature_matrix.shape[0] >= 10:  # TODO: Implement gamma="auto" for thundersvm
-            kwargs = {"kernel": "rbf", "gamma": "auto", "class_weight": "balanced"}
+    def fit_initiation_classifier(self, wait=False):
+        """
+        Refit the initiation classifiers on the current examples. With a `classifier_fitter`, the fit runs in the
+        background and is swapped in by `sync_initiation_classifier` (or right away, if `wait`).
+        """
+        if self._pending_fit is not None:
+            if not wait:
+                # One fit in flight per option: the new examples will be picked up by the next refit
+                return
+            self.sync_initiation_classifier(wait=True)
+
+        self.num_new_trajectories = 0
+        self.drift_detected = False
+
+        job = self.get_classifier_fit_job()
+        if job is None:
+            return
+
+        if self.classifier_fitter is None:
+            self.set_initiation_classifiers(fit_initiation_classifiers(**job))
         else:
-            kwargs = {"kernel": "rbf", "gamma": "auto"}
+            self._pending_fit = self.classifier_fitter.submit(job)
+            if wait:
+                self.sync_initiation_classifier(wait=True)
+
+    def get_classifier_fit_job(self):
+        """ Keyword arguments of `fit_initiation_classifiers`; the feature arrays are copies, safe to ship off. """
+        if len(self.positive_examples) == 0:
+            return None
+
+        positive_features = np.array(self.construct_feature_matrix(self.positive_examples))
+        negative_features = np.array(self.construct_feature_matrix(self.negative_examples))
+        if len(self.negative_examples) == 0:
+            negative_features = np.empty((0, positive_features.shape[1]))
+
+        return {
+            "backend": self.classifier_backend,
+            "positive_features": positive_features,
+            "negative_features": negative_features,
+            "max_examples": self.max_classifier_examples,
+            "coreset_method": self.coreset_method,
+            "raster_extents": self.get_raster_extents(),
+            "raster_resolution": self.init_raster_resolution,
+        }
+
+    def sync_initiation_classifier(self, wait=False):
+        """ Swap in the classifiers of a finished background fit. """
+        if self._pending_fit is None:
+            return
+
+        # An option past gestation needs its classifiers to answer `is_init_true`, so block for its first fit
+        wait = wait or (self.optimistic_classifier is None and self.get_training_phase() != "gestation")
+
+        if wait or self._pending_fit.done():
+            classifiers = self._pending_fit.result()
+            self._pending_fit = None
+            self.set_initiation_classifiers(classifiers)
+
+    def set_initiation_classifiers(self, classifiers):
+        """ Install the output of `fit_initiation_classifiers` in one step. """
+        self.optimistic_classifier = classifiers["optimistic_classifier"]
+        self.optimistic_raster = classifiers["optimistic_raster"]
+
+        # As before, the previous pessimistic classifier is kept if no positive example is left to fit a new one
+        if classifiers["pessimistic_classifier"] is not None:
+            self.pessimistic_classifier = classifiers["pessimistic_classifier"]
+            self.pessimistic_raster = classifiers["pessimistic_raster"]
+
+        self.classifier_version += 1
+
+    def get_raster_extents(self):
+        """ (low, high) of the initiation rasters, or None when rasters are disabled or don't apply. """
+        if self.init_raster_resolution <= 0 or len(self.positive_examples) == 0:
+            return None
+
+        # Rasters are defined over the (x, y) plane only
+        if self.positive_examples.feature_matrix().shape[1] != 2:
+            return None
+
+        return self.mdp.get_x_y_low_lims(), self.mdp.get_x_y_high_lims()
+
+    def update_initiation_rasters(self):
+        """ Bake the current optimistic/pessimistic decision regions into grid rasters over the maze. """
+        raster_extents = self.get_raster_extents()
+        if raster_extents is None:
+            return
+
+        self.optimistic_raster = make_raster(self.optimistic_classifier, raster_extents, self.init_raster_resolution)
+        self.pessimistic_raster = make_raster(self.pessimistic_classifier, raster_extents, self.init_raster_resolution)
+        self.classifier_version += 1
 
-        self.optimistic_classifier = SVC(**kwargs)
-        self.optimistic_classifier.fit(X, Y)
-
-        training_predictions = self.optimistic_classifier.predict(X)
-        positive_training_examples = X[training_predictions == 1]
+    def construct_feature_matrix(self, examples):
+        if isinstance(examples, ExampleStore):
+            return examples.feature_matrix()
 
-        if positive_training_examples.shape[0] > 0:
-            self.pessimistic_classifier = OneClassSVM(kernel="rbf", nu=nu)
-            self.pessimistic_classifier.fit(positive_training_examples)
+        trajectories = [np.asarray(trajectory) for trajectory in examples if len(trajectory) > 0]
+        if len(trajectories) == 0:
+            return np.array([])
+        return np.array(self.mdp.extract_features_for_initiation_classifier(np.concatenate(trajectories)))
 
     def is_valid_init_data(self, state_buffer):
 
         # Use the data if it could complete the chain
         if self.init_salient_event is not None:
-            if any([self.init_salient_event(s) for s in state_buffer]):
+            if self.init_salient_event(np.asarray(state_buffer)[:, :2]).any():
                 return True
 
         length_condition = len(state_buffer) >= (self.buffer_length // 5)
@@ -485,12 +674,11 @@ class ModelBasedOption(object):
         if len(siblings) > 0:
             assert self.parent is not None, "Root option has no siblings"
 
-            sibling_count = 0.
-            for state in state_buffer:
-                for sibling in siblings:
-                    penalize = sibling.pessimistic_is_init_true(state) and not self.parent.pessimistic_is_init_true(
-                        state)
-                    sibling_count += penalize
+            # A state is penalized once for every sibling that contains it, unless the parent contains it too
+            features = self.construct_feature_matrix([state_buffer])
+            outside_parent = ~self.parent.batched_pessimistic_is_init_true(features)
+            sibling_count = sum(np.count_nonzero(sibling.batched_pessimistic_is_init_true(features) & outside_parent)
+                                for sibling in siblings)
 
             return 0 < (sibling_count / len(state_buffer)) <= 0.35
 
@@ -501,12 +689,27 @@ class ModelBasedOption(object):
     # ------------------------------------------------------------
 
     def get_states_inside_pessimistic_classifier_region(self):
-        if self.pessimistic_classifier is not None:
-            point_array = self.construct_feature_matrix(self.positive_examples)
-            point_array_predictions = self.pessimistic_classifier.predict(point_array)
-            positive_point_array = point_array[point_array_predictions == 1]
-            return positive_point_array
-        return []
+        """
+        Positive examples inside the pessimistic region, as a read-only (N, K) feature array. Cached until the
+        classifier changes; examples added in the meantime are classified and appended incrementally.
+        """
+        if self.pessimistic_classifier is None:
+            return []
+
+        feature_matrix = self.construct_feature_matrix(self.positive_examples)
+
+        if self._pessimistic_region_cache is None or self._pessimistic_region_cache[0] != self.classifier_version:
+            self._pessimistic_region_cache = (self.classifier_version, 0, feature_matrix[:0])
+
+        version, num_classified_rows, positive_point_array = self._pessimistic_region_cache
+        if num_classified_rows < feature_matrix.shape[0]:
+            new_points = feature_matrix[num_classified_rows:]
+            new_points = new_points[self.pessimistic_predict(new_points)]
+            positive_point_array = np.concatenate((positive_point_array, new_points))
+            positive_point_array.flags.writeable = False
+            self._pessimistic_region_cache = (version, feature_matrix.shape[0], positive_point_array)
+
+        return positive_point_array
 
     def distance_to_state(self, state, metric="euclidean"):
         """ Compute the distance between the current option and the input `state`. """
@@ -0,0 +1,134 @@
+import numpy as np
+from sklearn.svm import LinearSVC, OneClassSVM
+
+
+class RandomFourierFeatures(object):
+    """ Random Fourier feature map z(x) with z(x) . z(y) ~= exp(-gamma * ||x - y||^2) (Rahimi & Recht). """
+    def __init__(self, num_components=256, gamma="auto", seed=0):
+        self.num_components = num_components
+        self.gamma = gamma
+        self.seed = seed
+
+    def fit(self, X):
+        rng = np.random.RandomState(self.seed)
+        gamma = _get_gamma(self.gamma, X)
+        weights = rng.normal(scale=np.sqrt(2. * gamma), size=(X.shape[1], self.num_components))
+        self.weights = weights.astype(np.float32)
+        self.offsets = rng.uniform(0., 2. * np.pi, size=self.num_components).astype(np.float32)
+        self.scale = np.float32(np.sqrt(2. / self.num_components))
+        return self
+
+    def transform(self, X):
+        return self.scale * np.cos(X.astype(np.float32) @ self.weights + self.offsets)
+
+
+class NystroemFeatures(object):
+    """ Nystroem feature map: exact RBF kernel against `num_components` landmarks drawn from the training data. """
+    def __init__(self, num_components=256, gamma="auto", seed=0):
+        self.num_components = num_components
+        self.gamma = gamma
+        self.seed = seed
+
+    def fit(self, X):
+        rng = np.random.RandomState(self.seed)
+        num_landmarks = min(self.num_components, X.shape[0])
+        self.gamma_ = _get_gamma(self.gamma, X)
+        self.landmarks = X[rng.choice(X.shape[0], size=num_landmarks, replace=False)].astype(np.float32)
+        self.landmark_norms = (self.landmarks ** 2).sum(axis=1)
+
+        # z(x) = k(x, landmarks) K^{-1/2}, with the near-singular directions of K dropped
+        eigenvalues, eigenvectors = np.linalg.eigh(self._kernel(self.landmarks).astype(np.float64))
+        keep = eigenvalues > 1e-6 * eigenvalues.max()
+        self.normalization = (eigenvectors[:, keep] / np.sqrt(eigenvalues[keep])).astype(np.float32)
+        return self
+
+    def transform(self, X):
+        return self._kernel(X.astype(np.float32)) @ self.normalization
+
+    def _kernel(self, X):
+        squared_distances = (X ** 2).sum(axis=1)[:, None] + self.landmark_norms[None, :] - 2. * X @ self.landmarks.T
+        return np.exp(np.float32(-self.gamma_) * np.maximum(squared_distances, 0.))
+
+
+FEATURE_MAPS = {"rff": RandomFourierFeatures, "nystroem": NystroemFeatures}
+
+
+class ApproxOneClassSVM(object):
+    """
+    One-class SVM with an approximate RBF kernel: a linear one-class SVM (same `nu` semantics)
+    fit on an explicit random feature map. Predicting costs one (N, K) x (K, D) matmul, independent of
+    the number of support vectors. Mirrors the thundersvm/sklearn interface (`predict` returns +1/-1).
+    """
+    def __init__(self, nu=0.5, gamma="auto", feature_map="rff", num_components=256, seed=0):
+        assert feature_map in FEATURE_MAPS, feature_map
+
+        self.nu = nu
+        self.feature_map = FEATURE_MAPS[feature_map](num_components, gamma, seed)
+
+    def fit(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        Z = self.feature_map.fit(X).transform(X)
+
+        svm = OneClassSVM(kernel="linear", nu=self.nu)
+        svm.fit(Z)
+
+        # Only the primal weights are kept: the support vectors are not needed at predict time
+        self.coef_ = np.asarray(svm.coef_).ravel().astype(np.float32)
+        self.intercept_ = float(svm.intercept_[0])
+        return self
+
+    def decision_function(self, X):
+        return _linear_decision_function(self.feature_map, self.coef_, self.intercept_, X)
+
+    def predict(self, X):
+        return np.where(self.decision_function(X) > 0, 1, -1)
+
+
+class ApproxSVC(object):
+    """ Two-class counterpart of `ApproxOneClassSVM`: a linear SVM on the random feature map. """
+    def __init__(self, C=1.0, gamma="auto", class_weight=None, feature_map="rff", num_components=256, seed=0):
+        assert feature_map in FEATURE_MAPS, feature_map
+
+        self.C = C
+        self.class_weight = class_weight
+        self.feature_map = FEATURE_MAPS[feature_map](num_components, gamma, seed)
+
+    def fit(self, X, Y):
+        X = np.asarray(X, dtype=np.float64)
+        Z = self.feature_map.fit(X).transform(X)
+
+        svm = LinearSVC(C=self.C, class_weight=self.class_weight)
+        svm.fit(Z, Y)
+
+        self.classes_ = svm.classes_
+        self.coef_ = svm.coef_.ravel().astype(np.float32)
+        self.intercept_ = float(svm.intercept_[0])
+        return self
+
+    def decision_function(self, X):
+        return _linear_decision_function(self.feature_map, self.coef_, self.intercept_, X)
+
+    def predict(self, X):
+        return self.classes_[(self.decision_function(X) > 0).astype(np.int64)]
+
+
+def _linear_decision_function(feature_map, coef, intercept, X, chunk_size=4096):
+    """ z(X) . coef + intercept, computed in row chunks so that the (N, D) feature matrix stays in cache. """
+    X = np.asarray(X, dtype=np.float32)
+    if X.shape[0] <= chunk_size:
+        return feature_map.transform(X) @ coef + intercept
+
+    decisions = np.empty(X.shape[0], dtype=np.float32)
+    for start in range(0, X.shape[0], chunk_size):
+        decisions[start:start + chunk_size] = feature_map.transform(X[start:start + chunk_size]) @ coef
+    return decisions + intercept
+
+
+def _get_gamma(gamma, X):
+    """ Resolve gamma="auto" (1 / num_features, as in thundersvm) and gamma="scale" (as in sklearn). """
+    if gamma == "auto":
+        return 1. / X.shape[1]
+    if gamma == "scale":
+        variance = X.var()
+        return 1. / (X.shape[1] * variance) if variance > 0 else 1.
+    return float(gamma)
@@ -0,0 +1,266 @@
+import os
+import glob
+import copy
+import pickle
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+import numpy as np
+
+from hrl.agent.td3 import utils as td3_utils
+from hrl.agent.td3.replay_buffer import PrioritizedReplayBuffer
+
+
+# Option attributes that are restored verbatim on resume. The example/effect-set lists are only
+# ever appended to (their elements are never mutated in place), so a shallow copy is a valid snapshot.
+OPTION_ATTRIBUTES = ("num_goal_hits", "num_executions", "positive_examples", "negative_examples",
+                     "success_curve", "effect_set", "is_last_option", "num_new_trajectories", "drift_detected")
+
+TD3_BUFFER_FIELDS = ("state", "action", "reward", "next_state", "done")
+MPC_BUFFER_FIELDS = ("obs_buf", "obs2_buf", "act_buf", "rew_buf", "done_buf")
+
+
+class ExperimentCheckpointer(object):
+    """
+    Checkpoints a RobustDSC/RobustDST experiment so that it can be resumed with `run_loop(start_episode=...)`.
+
+    A checkpoint holds every option (counters, examples, classifiers, TD3 learners), the dynamics model,
+    the experiment log and the python/numpy/torch RNG states. The state is snapshotted synchronously in `save`
+    and written to disk by a background thread. Replay buffers are written incrementally: each save only
+    writes the rows added since the previous save as new chunks, at their positions in the ring buffer. Once
+    a buffer has wrapped around, the new rows overwrite the oldest ones, and chunks whose rows have all been
+    overwritten are deleted.
+    """
+    def __init__(self, exp, saving_dir):
+        self.exp = exp
+        self.saving_dir = saving_dir
+        self.replay_dir = os.path.join(saving_dir, "replay")
+        self.checkpoint_path = os.path.join(saving_dir, "checkpoint.pkl")
+
+        self._writer = ThreadPoolExecutor(max_workers=1)
+        self._pending = None
+
+        # buffer key -> (buffer.num_added at the last successful save, list of live chunks). A chunk is a tuple
+        # (offset, start, stop, file_name): row i of the file holds ring position offset + i, and positions
+        # [start, stop) haven't been overwritten since. Chunks are listed from the oldest to the newest.
+        self._buffer_progress = {}
+
+    # ------------------------------------------------------------
+    # Saving
+    # ------------------------------------------------------------
+
+    def save(self, episode):
+        """ Snapshot the experiment at the end of `episode` and write it out in the background. """
+        self.wait()
+
+        # Background classifier fits have already reset the refit counters: land them before snapshotting
+        for option in self._get_all_options():
+            option.sync_initiation_classifier(wait=True)
+
+        buffer_chunks, buffer_progress = [], {}
+        payload = {
+            "episode": episode,
+            "log": copy.deepcopy(self.exp.log),
+            "option_graph": self.exp.get_option_graph(),
+            "options": {},
+            "buffers": {},
+            "rng": self._get_rng_states(),
+        }
+
+        for option in self._get_all_options():
+            payload["options"][option.name] = self._snapshot_option(option)
+
+            if hasattr(option, "value_learner"):
+                buffer = option.value_learner.replay_buffer
+                key = f"{option.name}-td3"
+                payload["buffers"][key] = self._snapshot_buffer(key, buffer, TD3_BUFFER_FIELDS,
+                                                                buffer_chunks, buffer_progress)
+
+                if isinstance(buffer, PrioritizedReplayBuffer):
+                    payload["buffers"][key]["priorities"] = {"tree": buffer.tree.tree.copy(),
+                                                             "max_priority": buffer.max_priority,
+                                                             "beta": buffer.beta}
+
+        if self.exp.use_model:
+            solver = self.exp.global_option.solver
+            payload["dynamics"] = {
+                "is_trained": solver.is_trained,
+                "model": td3_utils.to_cpu(solver.model.__getstate__()) if solver.is_trained else None,
+            }
+            payload["buffers"]["global-option-mpc"] = self._snapshot_buffer("global-option-mpc",
+                                                                           solver.replay_buffer,
+                                                                           MPC_BUFFER_FIELDS,
+                                                                           buffer_chunks,
+                                                                           buffer_progress)
+
+        self._pending = self._writer.submit(self._write, payload, buffer_chunks, buffer_progress)
+
+    def wait(self):
+        """ Block until the last submitted checkpoint has been written to disk; re-raise its write error. """
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            pending.result()
+
+    def _write(self, payload, buffer_chunks, buffer_progress):
+        os.makedirs(self.replay_dir, exist_ok=True)
+
+        # Chunks go first so that the checkpoint never points at data that isn't on disk yet
+        for file_name, arrays in buffer_chunks:
+            np.savez(os.path.join(self.replay_dir, file_name), **arrays)
+
+        temp_path = self.checkpoint_path + ".tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump(payload, f)
+        os.replace(temp_path, self.checkpoint_path)
+
+        # Only now are the rows on disk: if the write failed, the next save writes them again
+        self._buffer_progress.update(buffer_progress)
+        self._remove_stale_chunks(payload)
+
+    def _remove_stale_chunks(self, payload):
+        live_chunks = {chunk[-1] for buffer in payload["buffers"].values() for chunk in buffer["chunks"]}
+        for path in glob.glob(os.path.join(self.replay_dir, "*.npz")):
+            if os.path.basename(path) not in live_chunks:
+                os.remove(path)
+
+    def _get_all_options(self):
+        return [self.exp.global_option] + self.exp.get_options()
+
+    def _snapshot_option(self, option):
+        state = {attr: copy.copy(getattr(option, attr)) for attr in OPTION_ATTRIBUTES}
+        state["optimistic_classifier"] = _picklable_or_none(option.optimistic_classifier)
+        state["pessimistic_classifier"] = _picklable_or_none(option.pessimistic_classifier)
+
+        if hasattr(option, "value_learner"):
+            state["value_learner"] = td3_utils.get_state(option.value_learner)
+
+        return state
+
+    def _snapshot_buffer(self, key, buffer, fields, buffer_chunks, buffer_progress):
+        num_saved, chunks = self._buffer_progress.get(key, (0, []))
+        num_new = min(buffer.num_added - num_saved, buffer.max_size)
+        num_on_disk = sum(stop - start for _, start, stop, _ in chunks)
+
+        # The buffer was cleared since the last save: rewrite it from scratch
+        if num_new < 0 or buffer.size != min(num_on_disk + num_new, buffer.max_size):
+            num_new, num_on_disk, chunks = buffer.size, 0, []
+
+        # The new rows overwrite the oldest ones on disk, ie the front of the (oldest first) chunk list
+        num_overwritten = max(0, num_on_disk + num_new - buffer.max_size)
+        live_chunks = []
+        for offset, start, stop, file_name in chunks:
+            num_trimmed = min(num_overwritten, stop - start)
+            num_overwritten -= num_trimmed
+            if start + num_trimmed < stop:
+                live_chunks.append((offset, start + num_trimmed, stop, file_name))
+
+        # The new rows end at `ptr`: one chunk, or two if they wrap around the end of the ring
+        first_row = buffer.num_added - num_new
+        start = (buffer.ptr - num_new) % buffer.max_size
+        while num_new > 0:
+            stop = min(start + num_new, buffer.max_size)
+            file_name = f"{key}_{first_row}_{first_row + stop - start}.npz"
+            arrays = {field: getattr(buffer, field)[start:stop].copy() for field in fields}
+            buffer_chunks.append((file_name, arrays))
+            live_chunks.append((start, start, stop, file_name))
+
+            first_row += stop - start
+            num_new -= stop - start
+            start = 0
+
+        buffer_progress[key] = (buffer.num_added, live_chunks)
+        return {"ptr": buffer.ptr, "size": buffer.size, "num_added": buffer.num_added, "chunks": live_chunks}
+
+    @staticmethod
+    def _get_rng_states():
+        rng = {"random": random.getstate(), "numpy": np.random.get_state(), "torch": torch.get_rng_state()}
+        if torch.cuda.is_available():
+            rng["cuda"] = torch.cuda.get_rng_state_all()
+        return rng
+
+    # ------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------
+
+    def exists(self):
+        return os.path.isfile(self.checkpoint_path)
+
+    def load(self):
+        """ Restore the experiment from disk and return the last completed episode. """
+        with open(self.checkpoint_path, "rb") as f:
+            payload = pickle.load(f)
+
+        self.exp.restore_option_graph(payload["option_graph"])
+        self.exp.log = payload["log"]
+
+        for option in self._get_all_options():
+            self._restore_option(option, payload["options"][option.name])
+
+            if hasattr(option, "value_learner"):
+                key = f"{option.name}-td3"
+                buffer = option.value_learner.replay_buffer
+                self._restore_buffer(key, buffer, payload["buffers"][key])
+
+                if isinstance(buffer, PrioritizedReplayBuffer):
+                    priorities = payload["buffers"][key]["priorities"]
+                    buffer.tree.tree[:] = priorities["tree"]
+                    buffer.max_priority = priorities["max_priority"]
+                    buffer.beta = priorities["beta"]
+
+        if self.exp.use_model:
+            solver = self.exp.global_option.solver
+            self._restore_buffer("global-option-mpc", solver.replay_buffer, payload["buffers"]["global-option-mpc"])
+
+            if payload["dynamics"]["is_trained"]:
+                solver.is_trained = True
+                solver.load_data()
+                solver.model.__setstate__(payload["dynamics"]["model"])
+
+        self._set_rng_states(payload["rng"])
+
+        return payload["episode"]
+
+    def _restore_option(self, option, state):
+        for attr in OPTION_ATTRIBUTES:
+            setattr(option, attr, state[attr])
+
+        option.optimistic_classifier = state["optimistic_classifier"]
+        option.pessimistic_classifier = state["pessimistic_classifier"]
+        option.classifier_version += 1
+
+        # Classifiers that can't be pickled (eg, thundersvm) are refit from the restored examples
+        if not option.global_init and option.pessimistic_classifier is None:
+            option.fit_initiation_classifier(wait=True)
+        elif option.init_raster_resolution > 0:
+            option.update_initiation_rasters()
+
+        if "value_learner" in state:
+            td3_utils.set_state(option.value_learner, state["value_learner"])
+
+    def _restore_buffer(self, key, buffer, state):
+        for offset, start, stop, file_name in state["chunks"]:
+            with np.load(os.path.join(self.replay_dir, file_name)) as arrays:
+                for field in arrays.files:
+                    getattr(buffer, field)[start:stop] = arrays[field][start - offset:stop - offset]
+
+        buffer.ptr = state["ptr"]
+        buffer.size = state["size"]
+        buffer.num_added = state["num_added"]
+        self._buffer_progress[key] = (state["num_added"], state["chunks"])
+
+    @staticmethod
+    def _set_rng_states(rng):
+        random.setstate(rng["random"])
+        np.random.set_state(rng["numpy"])
+        torch.set_rng_state(rng["torch"])
+        if "cuda" in rng and torch.cuda.is_available():
+            torch.cuda.set_rng_state_all(rng["cuda"])
+
+
+def _picklable_or_none(obj):
+    try:
+        pickle.dumps(obj)
+    except Exception:
+        return None
+    return obj
@@ -0,0 +1,97 @@
+from hrl.agent.dsc.approx_classifier import ApproxOneClassSVM, ApproxSVC
+
+
+CLASSIFIER_BACKENDS = {}
+
+
+def register_classifier_backend(name):
+    """ Class decorator that makes a `ClassifierBackend` selectable by `name` (eg, via --classifier_backend). """
+    def register(backend_class):
+        CLASSIFIER_BACKENDS[name] = backend_class
+        return backend_class
+    return register
+
+
+def make_classifier_backend(name, num_kernel_features=256):
+    assert name in CLASSIFIER_BACKENDS, f"Unknown classifier backend {name}, expected one of {list(CLASSIFIER_BACKENDS)}"
+    return CLASSIFIER_BACKENDS[name](num_kernel_features=num_kernel_features)
+
+
+class ClassifierBackend(object):
+    """
+    Factory for unfitted initiation classifiers. Every classifier follows the thundersvm/sklearn interface:
+    `fit`, `decision_function` and `predict`, where one-class models predict +1 inside the region and two-class
+    models predict the class label.
+    """
+    # Whether fitted models can be pickled, ie, fit in a worker process (see `ClassifierFitPool`)
+    picklable = True
+
+    # Whether a fitted model can predict in two threads at once, ie, be plotted off-thread (see `PlottingWorker`)
+    thread_safe = True
+
+    def __init__(self, num_kernel_features=256):
+        self.num_kernel_features = num_kernel_features
+
+    def one_class(self, nu, gamma="auto"):
+        raise NotImplementedError
+
+    def two_class(self, gamma="auto", class_weight=None):
+        raise NotImplementedError
+
+
+@register_classifier_backend("thundersvm")
+class ThunderSVMBackend(ClassifierBackend):
+    """ GPU/CPU libsvm port; imported lazily so that the other backends work on hosts without thundersvm. """
+    picklable = False
+
+    # Predictions are written to a buffer held by the model, outside of the GIL
+    thread_safe = False
+
+    def one_class(self, nu, gamma="auto"):
+        from thundersvm import OneClassSVM
+        return OneClassSVM(kernel="rbf", nu=nu, gamma=gamma)
+
+    def two_class(self, gamma="auto", class_weight=None):
+        from thundersvm import SVC
+        return SVC(**_svc_kwargs(gamma, class_weight))
+
+
+@register_classifier_backend("sklearn")
+class SklearnBackend(ClassifierBackend):
+    def one_class(self, nu, gamma="auto"):
+        from sklearn.svm import OneClassSVM
+        return OneClassSVM(kernel="rbf", nu=nu, gamma=gamma)
+
+    def two_class(self, gamma="auto", class_weight=None):
+        from sklearn.svm import SVC
+        return SVC(**_svc_kwargs(gamma, class_weight))
+
+
+class ApproxKernelBackend(ClassifierBackend):
+    """ Linear SVMs on an explicit approximate RBF feature map (see `approx_classifier.py`). """
+    feature_map = None
+
+    def one_class(self, nu, gamma="auto"):
+        return ApproxOneClassSVM(nu=nu, gamma=gamma, feature_map=self.feature_map,
+                                 num_components=self.num_kernel_features)
+
+    def two_class(self, gamma="auto", class_weight=None):
+        return ApproxSVC(gamma=gamma, class_weight=class_weight, feature_map=self.feature_map,
+                         num_components=self.num_kernel_features)
+
+
+@register_classifier_backend("rff")
+class RandomFourierBackend(ApproxKernelBackend):
+    feature_map = "rff"
+
+
+@register_classifier_backend("nystroem")
+class NystroemBackend(ApproxKernelBackend):
+    feature_map = "nystroem"
+
+
+def _svc_kwargs(gamma, class_weight):
+    kwargs = {"kernel": "rbf", "gamma": gamma}
+    if class_weight is not None:
+        kwargs["class_weight"] = class_weight
+    return kwargs
@@ -0,0 +1,122 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from hrl.utils import get_worker_context
+from hrl.agent.dsc.coreset import select_coreset
+from hrl.agent.dsc.initiation_raster import InitiationRaster
+
+
+def fit_initiation_classifiers(backend, positive_features, negative_features, nu=0.1, max_examples=0,
+                               coreset_method="grid", raster_extents=None, raster_resolution=0.):
+    """
+    Fit the optimistic and pessimistic initiation classifiers of an option.
+
+    Only depends on its (picklable) arguments, so that it can run in a worker process.
+
+    Args:
+        backend (ClassifierBackend)
+        positive_features (np.ndarray): classifier features of the positive examples
+        negative_features (np.ndarray): classifier features of the negative examples (possibly empty)
+        nu (float): nu of the pessimistic one-class SVM
+        max_examples (int): cap on the number of positive and of negative examples (0 disables the cap)
+        coreset_method (str): how to subsample the examples when they exceed the cap
+        raster_extents (tuple): (low, high) of the rasters, or None to skip rasterization
+        raster_resolution (float): cell size of the rasters
+
+    Returns:
+        classifiers (dict): optimistic/pessimistic classifiers and rasters. The pessimistic entries are
+                            None if no training example ended up on the positive side of the optimistic classifier.
+    """
+    positive_features = subsample_feature_matrix(positive_features, max_examples, coreset_method)
+    negative_features = subsample_feature_matrix(negative_features, max_examples, coreset_method)
+
+    if negative_features.shape[0] > 0:
+        optimistic_classifier, pessimistic_classifier = train_two_class_classifier(backend, positive_features,
+                                                                                   negative_features, nu)
+    else:
+        optimistic_classifier, pessimistic_classifier = train_one_class_svm(backend, positive_features, nu)
+
+    classifiers = {
+        "optimistic_classifier": optimistic_classifier,
+        "pessimistic_classifier": pessimistic_classifier,
+        "optimistic_raster": None,
+        "pessimistic_raster": None,
+    }
+
+    if raster_extents is not None:
+        classifiers["optimistic_raster"] = make_raster(optimistic_classifier, raster_extents, raster_resolution)
+        classifiers["pessimistic_raster"] = make_raster(pessimistic_classifier, raster_extents, raster_resolution)
+
+    return classifiers
+
+
+def subsample_feature_matrix(feature_matrix, max_examples, coreset_method):
+    """ Cap the number of SVM training examples at `max_examples` (0 means no cap). """
+    if max_examples <= 0 or feature_matrix.shape[0] <= max_examples:
+        return feature_matrix
+    return feature_matrix[select_coreset(feature_matrix, max_examples, coreset_method)]
+
+
+def train_one_class_svm(backend, positive_feature_matrix, nu=0.1):  # TODO: Implement gamma="auto" for thundersvm
+    pessimistic_classifier = backend.one_class(nu=nu)
+    pessimistic_classifier.fit(positive_feature_matrix)
+
+    optimistic_classifier = backend.one_class(nu=nu/10.)
+    optimistic_classifier.fit(positive_feature_matrix)
+
+    return optimistic_classifier, pessimistic_classifier
+
+
+def train_two_class_classifier(backend, positive_feature_matrix, negative_feature_matrix, nu=0.1):
+    positive_labels = [1] * positive_feature_matrix.shape[0]
+    negative_labels = [0] * negative_feature_matrix.shape[0]
+
+    X = np.concatenate((positive_feature_matrix, negative_feature_matrix))
+    Y = np.concatenate((positive_labels, negative_labels))
+
+    if negative_feature_matrix.shape[0] >= 10:  # TODO: Implement gamma="auto" for thundersvm
+        class_weight = "balanced"
+    else:
+        class_weight = None
+
+    optimistic_classifier = backend.two_class(class_weight=class_weight)
+    optimistic_classifier.fit(X, Y)
+
+    training_predictions = optimistic_classifier.predict(X)
+    positive_training_examples = X[training_predictions == 1]
+
+    pessimistic_classifier = None
+    if positive_training_examples.shape[0] > 0:
+        pessimistic_classifier = backend.one_class(nu=nu)
+        pessimistic_classifier.fit(positive_training_examples)
+
+    return optimistic_classifier, pessimistic_classifier
+
+
+def make_raster(classifier, raster_extents, raster_resolution):
+    if classifier is None:
+        return None
+    low, high = raster_extents
+    return InitiationRaster(classifier, low, high, resolution=raster_resolution)
+
+
+class ClassifierFitPool(object):
+    """
+    Fits initiation classifiers off the control loop.
+
+    Jobs are the keyword arguments of `fit_initiation_classifiers`; `submit` returns a future holding its result.
+    Backends whose models can be pickled run in a pool of worker processes, the others (eg, thundersvm) in a
+    pool of threads, which still overlaps with the environment loop since they fit outside of the GIL.
+    """
+    def __init__(self, num_workers, use_processes=True):
+        if use_processes:
+            self._executor = ProcessPoolExecutor(max_workers=num_workers, mp_context=get_worker_context())
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=num_workers)
+
+    def submit(self, job):
+        return self._executor.submit(fit_initiation_classifiers, **job)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,72 @@
+import numpy as np
+
+
+def select_coreset(X, max_size, method="grid", seed=0):
+    """
+    Return the indices of a spatially stratified subset of the rows of `X` with at most `max_size` rows.
+
+    Args:
+        X (np.ndarray): feature matrix of shape (N, K)
+        max_size (int): cap on the size of the coreset; a non-positive cap keeps every row
+        method (str): "grid" keeps one random point per occupied grid cell, with the cell size chosen
+                      so that there are at most `max_size` occupied cells; "k_center" greedily picks
+                      the point farthest from the current coreset (farthest-point traversal)
+        seed (int): seed for the random choices, so that refits on the same data are reproducible
+
+    Returns:
+        indices (np.ndarray)
+    """
+    assert method in ("grid", "k_center"), method
+
+    if max_size <= 0 or X.shape[0] <= max_size:
+        return np.arange(X.shape[0])
+
+    rng = np.random.RandomState(seed)
+    if method == "grid":
+        return _grid_coreset(X, max_size, rng)
+    return _k_center_coreset(X, max_size, rng)
+
+
+def _grid_coreset(X, max_size, rng, num_iterations=20):
+    low = X.min(axis=0)
+    extent = max(float((X.max(axis=0) - low).max()), 1e-8)
+
+    # Bisect on the cell size: the largest grid resolution with at most `max_size` occupied cells
+    small, large = extent / X.shape[0], extent
+    cell_ids = _get_cell_ids(X, low, large)
+    for _ in range(num_iterations):
+        cell_size = 0.5 * (small + large)
+        candidate_ids = _get_cell_ids(X, low, cell_size)
+        if len(np.unique(candidate_ids)) <= max_size:
+            large, cell_ids = cell_size, candidate_ids
+        else:
+            small = cell_size
+
+    # One random representative per occupied cell
+    permutation = rng.permutation(X.shape[0])
+    _, first_occurrences = np.unique(cell_ids[permutation], return_index=True)
+    return np.sort(permutation[first_occurrences])
+
+
+def _get_cell_ids(X, low, cell_size):
+    cells = np.floor((X - low) / cell_size).astype(np.int64)
+    dims = cells.max(axis=0) + 1
+
+    # Flatten the cell coordinates into one integer id when that can't overflow
+    if np.prod(dims.astype(np.float64)) < 2 ** 62:
+        return np.ravel_multi_index(cells.T, dims)
+
+    cells = np.ascontiguousarray(cells)
+    return cells.view(np.dtype((np.void, cells.dtype.itemsize * cells.shape[1]))).ravel()
+
+
+def _k_center_coreset(X, max_size, rng):
+    indices = np.empty(max_size, dtype=np.int64)
+    indices[0] = rng.randint(X.shape[0])
+    distances = np.linalg.norm(X - X[indices[0]], axis=1)
+
+    for i in range(1, max_size):
+        indices[i] = np.argmax(distances)
+        distances = np.minimum(distances, np.linalg.norm(X - X[indices[i]], axis=1))
+
+    return np.sort(indices)
@@ -1,15 +1,20 @@
 import os
+import time
 import ipdb
 import torch
-import pickle
 import argparse
 import numpy as np
-from copy import deepcopy
 from functools import reduce
 from collections import deque
 
+from hrl.metrics_log import MetricsLog
 from hrl.agent.dsc.utils import *
 from hrl.agent.dsc.MBOptionClass import ModelBasedOption
+from hrl.agent.dsc.checkpoint import ExperimentCheckpointer
+from hrl.agent.dsc.classifier_backends import CLASSIFIER_BACKENDS
+from hrl.agent.dsc.classifier_fitting import ClassifierFitPool
+from hrl.agent.dsc.option_index import NearestOptionIndex
+from hrl.agent.dsc.plotting import PlottingWorker
 
 
 class RobustDST(object):
@@ -17,7 +22,15 @@ class RobustDST(object):
                  use_vf, use_global_vf, use_model, lr_a, lr_c,
                  max_steps, use_diverse_starts, use_dense_rewards, experiment_name,
                  logging_freq, evaluation_freq, device, seed, multithread_mpc,
-                 generate_init_gif, max_num_children):
+                 generate_init_gif, max_num_children, fused_td3_update=False, compile_td3_update=False,
+                 use_numpy_actor=False, prioritized_replay=False,
+                 checkpoint_freq=0, value_cache_updates=0, init_raster_resolution=0.,
+                 refit_every=1, spill_example_states=False,
+                 max_classifier_examples=0, coreset_method="grid",
+                 classifier_backend="thundersvm", num_kernel_features=256,
+                 classifier_fit_workers=0, warmup_mdp_pool=None, td3_learner=None,
+                 evaluator=None, num_eval_episodes=1, nearest_option_index=False,
+                 max_queued_plots=0, results_dir="results"):
         self.seed = seed
         self.device = device
         self.use_vf = use_vf
@@ -28,11 +41,43 @@ class RobustDST(object):
         self.logging_freq = logging_freq
         self.evaluation_freq = evaluation_freq
         self.experiment_name = experiment_name
+        self.results_dir = results_dir
         self.warmup_episodes = warmup_episodes
         self.use_diverse_starts = use_diverse_starts
         self.use_dense_rewards = use_dense_rewards
         self.generate_init_gif = generate_init_gif
         self.max_num_children = max_num_children
+        self.fused_td3_update = fused_td3_update
+        self.compile_td3_update = compile_td3_update
+        self.use_numpy_actor = use_numpy_actor
+        self.prioritized_replay = prioritized_replay
+        self.value_cache_updates = value_cache_updates
+        self.init_raster_resolution = init_raster_resolution
+        self.refit_every = refit_every
+        self.spill_example_states = spill_example_states
+        self.max_classifier_examples = max_classifier_examples
+        self.coreset_method = coreset_method
+        self.classifier_backend = classifier_backend
+        self.num_kernel_features = num_kernel_features
+
+        # Optional GoalConditionedMDPPool: warmup episodes then collect random transitions from all of its envs at once
+        self.warmup_mdp_pool = warmup_mdp_pool
+
+        # Optional AsyncTD3Learner: TD3 gradient updates then run in a learner process, decoupled from acting
+        self.td3_learner = td3_learner
+
+        # Optional EvaluationPool: test rollouts then run in worker processes and are posted to the log when done
+        self.evaluator = evaluator
+        self.num_eval_episodes = num_eval_episodes
+
+        # Optional PlottingWorker: the plots of `log_status` are then rendered in a background thread
+        self.plotter = PlottingWorker(max_queued_plots) if max_queued_plots > 0 else None
+
+        # Initiation classifiers are fit in the background by a worker pool, or synchronously (reproducible) without one
+        self.classifier_fitter = None
+        if classifier_fit_workers > 0:
+            self.classifier_fitter = ClassifierFitPool(classifier_fit_workers,
+                                                       use_processes=CLASSIFIER_BACKENDS[classifier_backend].picklable)
 
         self.gestation_period = gestation_period
 
@@ -43,6 +88,38 @@ class RobustDST(object):
         self.init_salient_event = self.mdp.get_start_state_salient_event()
         self.target_salient_event = self.mdp.get_original_target_events()[0]
 
+        # Optional KD-tree over the option regions: approximate nearest-option queries in logarithmic time
+        self.option_index = NearestOptionIndex(self.mdp) if nearest_option_index else None
+
+        # Keyword arguments shared by every ModelBasedOption of the experiment
+        self.option_kwargs = dict(mdp=self.mdp,
+                                  buffer_length=self.buffer_length,
+                                  gestation_period=self.gestation_period,
+                                  max_steps=self.max_steps, device=self.device,
+                                  init_salient_event=self.init_salient_event,
+                                  target_salient_event=self.target_salient_event,
+                                  path_to_model="",
+                                  use_vf=self.use_vf,
+                                  dense_reward=self.use_dense_rewards,
+                                  use_model=self.use_model,
+                                  use_global_vf=self.use_global_vf,
+                                  lr_c=self.lr_c, lr_a=self.lr_a,
+                                  max_num_children=self.max_num_children,
+                                  fused_td3_update=self.fused_td3_update,
+                                  compile_td3_update=self.compile_td3_update,
+                                  use_numpy_actor=self.use_numpy_actor,
+                                  prioritized_replay=self.prioritized_replay,
+                                  value_cache_updates=self.value_cache_updates,
+                                  init_raster_resolution=self.init_raster_resolution,
+                                  refit_every=self.refit_every,
+                                  example_state_dir=self._get_example_state_dir(),
+                                  max_classifier_examples=self.max_classifier_examples,
+                                  coreset_method=self.coreset_method,
+                                  classifier_backend=self.classifier_backend,
+                                  num_kernel_features=self.num_kernel_features,
+                                  classifier_fitter=self.classifier_fitter,
+                                  td3_learner=self.td3_learner)
+
         self.global_option = self.create_global_model_based_option()
         self.goal_option = self.create_model_based_option(name="goal-option", parent=None)
 
@@ -51,18 +128,19 @@ class RobustDST(object):
         self.mature_options = []
 
         self.log = {}
+        self.metrics_log = MetricsLog(os.path.join(self.results_dir, self.experiment_name, f"log_file_{self.seed}.jsonl"))
 
-    def act(self, state):
-        option_names = self.skill_tree.traverse()
-        options = [self.skill_tree.get_option(name) for name in option_names]
+        self.checkpoint_freq = checkpoint_freq
+        self.checkpointer = ExperimentCheckpointer(self, os.path.join(self.results_dir, self.experiment_name,
+                                                                      f"checkpoint_{self.seed}"))
 
-        # Use this list rather than `self.mature_options` to take advantage of the tree.bfs() traversal order
-        # Checking if classifiers exist because it is possible that you are at init-done, but don't have clf yet
-        cond = lambda o: o.get_training_phase() == "initiation_done" \
-                         and o.optimistic_classifier is not None \
-                         and o.pessimistic_classifier is not None
+    def act(self, state):
+        self.sync_initiation_classifiers()
+        if self.td3_learner is not None:
+            self.td3_learner.sync()
 
-        options_in_maturation = [option for option in options if cond(option)]
+        # Use the tree's BFS order rather than `self.mature_options` to take advantage of the tree structure
+        options_in_maturation = self.skill_tree.get_options_in_phase("initiation_done")
         selected_option_and_subgoal = self._pick_among_mature_options(options_in_maturation, state)
 
         if selected_option_and_subgoal is not None:
@@ -73,9 +151,8 @@ class RobustDST(object):
         if self.goal_option.get_training_phase() == "gestation" and self.goal_option.is_init_true(state):
             return self.goal_option, self.goal_option.get_goal_for_rollout()
 
-        options_in_gestation = [option for option in options if option.get_training_phase() == "gestation"]
-        if len(options_in_gestation) > 0:
-            selected_option_and_subgoal = self._pick_among_options_in_gestation(options_in_gestation, state)
+        if len(self.skill_tree.get_options_in_phase("gestation")) > 0:
+            selected_option_and_subgoal = self._pick_among_options_in_gestation(state)
             if selected_option_and_subgoal is not None:
                 selected_option = selected_option_and_subgoal[0]
                 print(f"Skill-Trees::Act() chose {selected_option} (parent={selected_option.parent}) in gestation")
@@ -87,15 +164,18 @@ class RobustDST(object):
 
         return self.global_option, self.pick_subgoal_for_global_option(state)
 
-    def _pick_among_options_in_gestation(self, options_in_gestation, state):
+    def _pick_among_options_in_gestation(self, state):
         nearest_option = self.find_nearest_option_in_tree(state)
         for child_option in nearest_option.children:  # type: ModelBasedOption
-            if child_option in options_in_gestation:
+            if child_option.get_training_phase() == "gestation":
                 return child_option, child_option.get_goal_for_rollout()
 
     @staticmethod
     def _pick_among_mature_options(options_in_maturation, state):
         for option in options_in_maturation:  # type: ModelBasedOption
+            # It is possible to be at init-done without having the classifiers yet
+            if option.optimistic_classifier is None or option.pessimistic_classifier is None:
+                continue
             if option.is_init_true(state):
                 subgoal = option.get_goal_for_rollout()
                 if not option.is_at_local_goal(state, subgoal):
@@ -109,9 +189,12 @@ class RobustDST(object):
             return new_option
 
     def random_rollout(self, num_steps):
+        if self.warmup_mdp_pool is not None:
+            return self.pooled_random_rollout(num_steps)
+
         step_number = 0
         while step_number < num_steps and not self.mdp.cur_done:
-            state = deepcopy(self.mdp.cur_state)
+            state = self.mdp.cur_state
             action = self.mdp.action_space.sample()
             next_state, reward, done, _ = self.mdp.step(action)
             if self.use_model:
@@ -119,10 +202,28 @@ class RobustDST(object):
             step_number += 1
         return step_number
 
+    def pooled_random_rollout(self, num_steps):
+        """ `random_rollout` in every env of the warmup pool; returns the length of the longest episode. """
+        pool = self.warmup_mdp_pool
+        states = pool.reset()
+        active = np.ones(pool.num_envs, dtype=bool)
+
+        step_number = 0
+        while step_number < num_steps and active.any():
+            actions = pool.sample_actions()
+            next_states, rewards, dones, _ = pool.step(actions, mask=active)
+            if self.use_model:
+                self.global_option.batched_update_model(states[active], actions[active], rewards[active],
+                                                        next_states[active], dones[active])
+            states = next_states
+            active = active & ~dones
+            step_number += 1
+        return step_number
+
     def dsc_rollout(self, num_steps):
         step_number = 0
         while step_number < num_steps and not self.mdp.cur_done:
-            state = deepcopy(self.mdp.cur_state)
+            state = self.mdp.cur_state
 
             selected_option, subgoal = self.act(state)
 
@@ -139,7 +240,9 @@ class RobustDST(object):
         for episode in range(start_episode, start_episode + num_episodes):
             self.reset(episode)
 
+            start_time = time.time()
             step = self.dsc_rollout(num_steps) if episode > self.warmup_episodes else self.random_rollout(num_steps)
+            acting_time = time.time() - start_time
 
             last_10_durations.append(step)
             per_episode_durations.append(step)
@@ -152,8 +255,34 @@ class RobustDST(object):
 
             self.log_success_metrics(episode)
 
+            if self.td3_learner is not None:
+                self.log_throughput(episode, step / acting_time)
+
+            if self.checkpoint_freq > 0 and episode % self.checkpoint_freq == 0:
+                self.metrics_log.flush()
+                self.checkpointer.save(episode)
+
+        if self.evaluator is not None:
+            self.post_evaluations(wait=True)
+
+        if self.plotter is not None:
+            self.plotter.wait()
+
+        self.checkpointer.wait()
+        self.metrics_log.close()
+
         return per_episode_durations
 
+    def resume_from_checkpoint(self):
+        """ Restore the last checkpoint, if any, and return the episode to resume `run_loop` from. """
+        if not self.checkpointer.exists():
+            return 0
+        episode = self.checkpointer.load()
+        self.metrics_log.rewrite(self.log)
+        self.skill_tree.update_training_phases()
+        print(f"Resuming {self.experiment_name} (seed={self.seed}) after episode {episode}")
+        return episode + 1
+
     def learn_dynamics_model(self, epochs):
         self.global_option.solver.load_data()
         self.global_option.solver.train(epochs=epochs, batch_size=1024)
@@ -185,6 +314,7 @@ class RobustDST(object):
         return new_option
 
     def manage_chain_after_rollout(self, executed_option):
+        self.skill_tree.update_training_phase(executed_option)
 
         if executed_option in self.new_options and executed_option.get_training_phase() != "gestation":
             self.new_options.remove(executed_option)
@@ -195,6 +325,10 @@ class RobustDST(object):
             return self.mature_options[0]
 
         if len(self.mature_options) > 1:
+            nearest_option = self.find_nearest_option_in_index(state)
+            if nearest_option is not None:
+                return nearest_option
+
             samples = [option.sample_from_termination_region() for option in self.mature_options]
             states = np.repeat(state[None, ...], len(samples), axis=0)
             goals = np.array(samples)
@@ -203,6 +337,11 @@ class RobustDST(object):
             nearest_option = sorted(distances, key=lambda x: x[1])[0][0]  # type: ModelBasedOption
             return nearest_option
 
+    def find_nearest_option_in_index(self, state):
+        """ Approximate nearest mature option according to `self.option_index`, None without an index. """
+        if self.option_index is not None:
+            return self.option_index.nearest(self.mature_options, state)
+
     def pick_subgoal_for_global_option(self, state):
         nearest_option = self.find_nearest_option_in_tree(state)
         sampled_goal = nearest_option.sample_from_initiation_region_fast_and_epsilon()
@@ -218,20 +357,76 @@ class RobustDST(object):
                 self.new_options.append(new_option)
                 self.skill_tree.add_node(new_option)
 
+    def sync_initiation_classifiers(self):
+        """ Swap in the initiation classifiers whose background fits have finished. """
+        for option in self.get_options():
+            option.sync_initiation_classifier()
+
+    def get_options(self):
+        return self.skill_tree.options
+
+    def get_option_graph(self):
+        """ Names of all options (in creation order) and their parents, used for checkpointing. """
+        return {
+            "options": [(option.name, option.parent.name if option.parent is not None else None)
+                        for option in self.skill_tree.options],
+            "new_options": [option.name for option in self.new_options],
+            "mature_options": [option.name for option in self.mature_options],
+        }
+
+    def restore_option_graph(self, option_graph):
+        """ Re-create the options listed in `option_graph` (see `get_option_graph`). """
+        for name, parent_name in option_graph["options"]:
+            if self.skill_tree.get_option(name) is None:
+                parent_option = self.skill_tree.get_option(parent_name)
+                new_option = self.create_model_based_option(name, parent=parent_option)
+                parent_option.children.append(new_option)
+                self.skill_tree.add_node(new_option)
+
+        self.new_options = [self.skill_tree.get_option(name) for name in option_graph["new_options"]]
+        self.mature_options = [self.skill_tree.get_option(name) for name in option_graph["mature_options"]]
+
     def log_success_metrics(self, episode):
         options = self.mature_options + self.new_options
         individual_option_data = {option.name: option.get_option_success_rate() for option in options}
         overall_success = reduce(lambda x,y: x*y, individual_option_data.values())
-        self.log[episode] = {"individual_option_data": individual_option_data, "success_rate": overall_success}
+        self.log_metrics(episode, {"individual_option_data": individual_option_data, "success_rate": overall_success})
 
-        if episode % self.evaluation_freq == 0 and episode > self.warmup_episodes:
-            success, step_count, _ = test_agent(self, 1, self.max_steps, get_trajectories=False)
-
-            self.log[episode]["success"] = success
-            self.log[episode]["step-count"] = step_count[0]
+        if self.evaluator is not None:
+            self.post_evaluations()
 
-            with open(f"results/{self.experiment_name}/log_file_{self.seed}.pkl", "wb+") as log_file:
-                pickle.dump(self.log, log_file)
+        if episode % self.evaluation_freq == 0 and episode > self.warmup_episodes:
+            if self.evaluator is not None:
+                # The snapshot must not miss classifiers that are still being fit
+                for option in self.get_options():
+                    option.sync_initiation_classifier(wait=True)
+                self.evaluator.submit(self, episode, self.num_eval_episodes)
+            else:
+                self.post_evaluation(episode, *self.evaluate(self.num_eval_episodes))
+
+    def evaluate(self, num_episodes):
+        """ Test rollouts from the start state; returns the success rate and the step count of every rollout. """
+        success, step_counts, _ = test_agent(self, num_episodes, self.max_steps, get_trajectories=False)
+        return success, step_counts
+
+    def post_evaluation(self, episode, success, step_counts):
+        self.log_metrics(episode, {"success": success, "step-count": np.mean(step_counts)})
+
+    def post_evaluations(self, wait=False):
+        """ Log the evaluations of the `evaluator` that have finished (all of them, if `wait`). """
+        for episode, success, step_counts in self.evaluator.collect(wait=wait):
+            self.post_evaluation(episode, success, step_counts)
+
+    def log_metrics(self, episode, metrics):
+        """ Add `metrics` to the log of `episode`, and append them to the metrics log file. """
+        self.log.setdefault(episode, {}).update(metrics)
+        self.metrics_log.write(episode, metrics)
+
+    def log_throughput(self, episode, acting_throughput):
+        """ Acting (env steps/s) and learning (TD3 updates/s) throughput when they are decoupled. """
+        learning_throughput = self.td3_learner.get_learning_throughput()
+        self.log_metrics(episode, {"acting_throughput": acting_throughput, "learning_throughput": learning_throughput})
+        print(f"Episode {episode} \t Acting: {acting_throughput:.1f} steps/s \t Learning: {learning_throughput:.1f} updates/s")
 
     def log_status(self, episode, last_10_durations):
         print(f"Episode {episode} \t Mean Duration: {np.mean(last_10_durations)}")
@@ -241,62 +436,44 @@ class RobustDST(object):
 
             for option in self.mature_options:
                 episode_label = episode if self.generate_init_gif else -1
-                plot_two_class_classifier(option, episode_label, self.experiment_name, plot_examples=True)
+                self.plot(*snapshot_two_class_classifier_plot(option, episode_label, self.experiment_name, plot_examples=True))
 
             for option in options:
                 if self.use_global_vf:
-                    make_chunked_goal_conditioned_value_function_plot(option.global_value_learner,
-                                                                      goal=option.get_goal_for_rollout(),
-                                                                      episode=episode, seed=self.seed,
-                                                                      experiment_name=self.experiment_name,
-                                                                      option_idx=option.option_idx)
+                    self.plot(*snapshot_value_function_plot(option.global_value_learner,
+                                                            goal=option.get_goal_for_rollout(),
+                                                            episode=episode, seed=self.seed,
+                                                            experiment_name=self.experiment_name,
+                                                            option_idx=option.option_idx))
                 else:
-                    make_chunked_goal_conditioned_value_function_plot(option.value_learner,
-                                                                      goal=option.get_goal_for_rollout(),
-                                                                      episode=episode, seed=self.seed,
-                                                                      experiment_name=self.experiment_name)
+                    self.plot(*snapshot_value_function_plot(option.value_learner,
+                                                            goal=option.get_goal_for_rollout(),
+                                                            episode=episode, seed=self.seed,
+                                                            experiment_name=self.experiment_name))
+
+    def plot(self, saving_path, plot_job):
+        """ Render a plot snapshot (see `snapshot_*_plot`) in the background with a `plotter`, right away otherwise. """
+        if self.plotter is not None:
+            self.plotter.submit(saving_path, plot_job)
+        else:
+            plot_job()
+
+    def _get_example_state_dir(self):
+        if self.spill_example_states:
+            return os.path.join(self.results_dir, self.experiment_name, f"example_states_{self.seed}")
 
     def create_model_based_option(self, name, parent=None):
         option_idx = len(self.skill_tree.options) + 1 if parent is not None else 1
-        option = ModelBasedOption(parent=parent, mdp=self.mdp,
-                                  buffer_length=self.buffer_length,
-                                  global_init=False,
-                                  gestation_period=self.gestation_period,
-                                  timeout=200, max_steps=self.max_steps, device=self.device,
-                                  init_salient_event=self.init_salient_event,
-                                  target_salient_event=self.target_salient_event,
-                                  name=name,
-                                  path_to_model="",
+        option = ModelBasedOption(parent=parent, global_init=False, timeout=200, name=name,
                                   global_solver=self.global_option.solver,
-                                  use_vf=self.use_vf,
-                                  dense_reward=self.use_dense_rewards,
                                   global_value_learner=self.global_option.value_learner,
-                                  use_model=self.use_model,
-                                  use_global_vf=self.use_global_vf,
-                                  lr_c=self.lr_c, lr_a=self.lr_a,
-                                  option_idx=option_idx,
-                                  max_num_children=self.max_num_children)
+                                  option_idx=option_idx, **self.option_kwargs)
         return option
 
     def create_global_model_based_option(self):  # TODO: what should the timeout be for this option?
-        option = ModelBasedOption(parent=None, mdp=self.mdp,
-                                  buffer_length=self.buffer_length,
-                                  global_init=True,
-                                  gestation_period=self.gestation_period,
-                                  timeout=100, max_steps=self.max_steps, device=self.device,
-                                  init_salient_event=self.init_salient_event,
-                                  target_salient_event=self.target_salient_event,
-                                  name="global-option",
-                                  path_to_model="",
-                                  global_solver=None,
-                                  use_vf=self.use_vf,
-                                  dense_reward=self.use_dense_rewards,
-                                  global_value_learner=None,
-                                  use_model=self.use_model,
-                                  use_global_vf=self.use_global_vf,
-                                  lr_c=self.lr_c, lr_a=self.lr_a,
-                                  option_idx=0,
-                                  max_num_children=self.max_num_children)
+        option = ModelBasedOption(parent=None, global_init=True, timeout=100, name="global-option",
+                                  global_solver=None, global_value_learner=None, option_idx=0,
+                                  **self.option_kwargs)
         return option
 
     def reset(self, episode):
@@ -316,10 +493,11 @@ def test_agent(exp, num_experiments, num_steps, get_trajectories=False):
         episodic_trajectory = []
         while step_number < num_steps and not \
         exp.mdp.sparse_gc_reward_func(exp.mdp.cur_state, exp.mdp.goal_state, {})[1]:
-            state = deepcopy(exp.mdp.cur_state)
+            state = exp.mdp.cur_state
             selected_option, subgoal = exp.act(state)
             transitions, reward = selected_option.rollout(step_number=step_number, rollout_goal=subgoal,
                                                           eval_mode=True)
+            exp.skill_tree.update_training_phase(selected_option)
             if get_trajectories:
                 episodic_trajectory.append((selected_option.option_idx, transitions))
 
@@ -0,0 +1,170 @@
+import io
+import random
+import pickle
+import copyreg
+import itertools
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+
+import torch
+import numpy as np
+
+from hrl.utils import get_worker_context
+from hrl.agent.dynamics.mpc import RolloutDataset
+from hrl.agent.dynamics.dynamics_model import DynamicsModel
+from hrl.agent.dsc.example_store import StateSideStore
+from hrl.agent.dsc.checkpoint import ExperimentCheckpointer
+from hrl.agent.dsc.classifier_fitting import ClassifierFitPool
+from hrl.agent.td3.async_learner import AsyncTD3Learner
+from hrl.agent.td3.replay_buffer import ReplayBuffer as TD3ReplayBuffer, PrioritizedReplayBuffer
+from hrl.agent.dynamics.replay_buffer import ReplayBuffer as DynamicsReplayBuffer
+from hrl.wrappers.mdp_pool import GoalConditionedMDPPool
+from hrl.metrics_log import MetricsLog
+from hrl.agent.dsc.plotting import PlottingWorker
+
+
+# Not needed to act in eval mode (training data) or not transferable (pools, futures, files)
+SNAPSHOT_DROPPED_TYPES = (RolloutDataset, StateSideStore, Executor, Future, AsyncTD3Learner,
+                          GoalConditionedMDPPool, ExperimentCheckpointer, ClassifierFitPool, MetricsLog,
+                          PlottingWorker)
+
+# Replay buffers are replaced by small empty ones: eval rollouts still store into them, but nothing samples them
+SNAPSHOT_REPLAY_BUFFER_SIZE = 10000
+
+_MDP_ID, _DROPPED_ID = "mdp", "dropped"
+
+
+def snapshot_experiment(exp):
+    """ Pickle `exp` (a RobustDSC/RobustDST) for evaluation: its mdp is replaced by the evaluator's own env. """
+    buffer = io.BytesIO()
+    _SnapshotPickler(buffer, exp.mdp).dump(exp)
+    return buffer.getvalue()
+
+
+def load_experiment_snapshot(snapshot, mdp):
+    return _SnapshotUnpickler(io.BytesIO(snapshot), mdp).load()
+
+
+class _SnapshotPickler(pickle.Pickler):
+    def __init__(self, file, mdp):
+        super(_SnapshotPickler, self).__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.mdp = mdp
+
+        # DynamicsModel overrides __getstate__/__setstate__ to save/load weights in place, so rebuild it instead
+        self.dispatch_table = copyreg.dispatch_table.copy()
+        self.dispatch_table[DynamicsModel] = _reduce_dynamics_model
+        self.dispatch_table[TD3ReplayBuffer] = _reduce_td3_replay_buffer
+        self.dispatch_table[PrioritizedReplayBuffer] = _reduce_td3_replay_buffer
+        self.dispatch_table[DynamicsReplayBuffer] = _reduce_dynamics_replay_buffer
+
+    def persistent_id(self, obj):
+        if obj is self.mdp:
+            return _MDP_ID
+        if isinstance(obj, SNAPSHOT_DROPPED_TYPES + (EvaluationPool,)):
+            return _DROPPED_ID
+        return None
+
+
+def _reduce_td3_replay_buffer(buffer):
+    return TD3ReplayBuffer, (buffer.state_dim, buffer.action_dim, SNAPSHOT_REPLAY_BUFFER_SIZE, buffer.device)
+
+
+def _reduce_dynamics_replay_buffer(buffer):
+    return DynamicsReplayBuffer, (buffer.obs_buf.shape[1], buffer.act_buf.shape[1], SNAPSHOT_REPLAY_BUFFER_SIZE)
+
+
+def _reduce_dynamics_model(model):
+    action_size = model.model[0].in_features - model.model[-1].out_features
+    standardization_vars = [getattr(model, name, None) for name in ("mean_x", "mean_y", "mean_z",
+                                                                     "std_x", "std_y", "std_z")]
+    return _rebuild_dynamics_model, (model.model[-1].out_features, action_size, model.device,
+                                     model.model.state_dict(), standardization_vars)
+
+
+def _rebuild_dynamics_model(state_size, action_size, device, weights, standardization_vars):
+    model = DynamicsModel(state_size, action_size, device)
+    model.model.load_state_dict(weights)
+    model.to(device)
+    for name, value in zip(("mean_x", "mean_y", "mean_z", "std_x", "std_y", "std_z"), standardization_vars):
+        if value is not None:
+            setattr(model, name, value)
+    return model
+
+
+class _SnapshotUnpickler(pickle.Unpickler):
+    def __init__(self, file, mdp):
+        super(_SnapshotUnpickler, self).__init__(file)
+        self.mdp = mdp
+
+    def persistent_load(self, persistent_id):
+        return self.mdp if persistent_id == _MDP_ID else None
+
+
+class EvaluationPool(object):
+    """
+    Runs the test rollouts of an experiment in worker processes, each with its own env, against a frozen
+    snapshot of the options, classifiers, value functions and dynamics model.
+
+    `submit` splits the test episodes over the workers and returns right away; `collect` hands back the
+    evaluations that have finished, so that training never waits on them. Rollouts in the workers can't
+    touch the learner's state: whatever they change is discarded with the snapshot.
+
+    Args:
+        env_fn (callable): picklable function that builds one seeded GoalConditionedMDPWrapper, `env_fn(seed)`
+        num_workers (int)
+        seed (int): worker i builds its env with seed `seed + i`
+    """
+    def __init__(self, env_fn, num_workers, seed=0):
+        self.num_workers = num_workers
+        self.seed = seed
+
+        context = get_worker_context()
+        self._executor = ProcessPoolExecutor(max_workers=num_workers, mp_context=context,
+                                             initializer=_init_worker,
+                                             initargs=(env_fn, seed, context.Value("i", 0)))
+
+        # (episode, futures) of the submitted evaluations, oldest first
+        self._pending = []
+
+    def submit(self, exp, episode, num_episodes):
+        snapshot = snapshot_experiment(exp)
+        shares = np.array_split(np.arange(num_episodes), min(self.num_workers, num_episodes))
+        futures = [self._executor.submit(_evaluate_snapshot, snapshot, len(share),
+                                         seed=self.seed + num_episodes * episode + int(share[0]))
+                   for share in shares]
+        self._pending.append((episode, futures))
+
+    def collect(self, wait=False):
+        """ Finished evaluations as a list of (episode, success rate, step counts), in submission order. """
+        results = []
+        while len(self._pending) > 0 and (wait or all(future.done() for future in self._pending[0][1])):
+            episode, futures = self._pending.pop(0)
+            evaluations = [future.result() for future in futures]
+            step_counts = list(itertools.chain.from_iterable(counts for _, counts in evaluations))
+            num_successes = sum(success_rate * len(counts) for success_rate, counts in evaluations)
+            results.append((episode, num_successes / len(step_counts), step_counts))
+        return results
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+_worker_mdp = None
+
+
+def _init_worker(env_fn, seed, worker_counter):
+    global _worker_mdp
+
+    with worker_counter.get_lock():
+        worker_idx = worker_counter.value
+        worker_counter.value += 1
+
+    _worker_mdp = env_fn(seed + worker_idx)
+
+
+def _evaluate_snapshot(snapshot, num_episodes, seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+    exp = load_experiment_snapshot(snapshot, _worker_mdp)
+    return exp.evaluate(num_episodes)
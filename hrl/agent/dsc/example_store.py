@@ -0,0 +1,103 @@
+import os
+
+import numpy as np
+
+
+class ExampleStore(object):
+    """
+    Append-only columnar store of initiation-classifier examples.
+
+    Only the classifier features of each state are kept in memory, in one contiguous array that grows
+    by doubling; `offsets` marks where each trajectory starts. Indexing the store with a trajectory index
+    returns a read-only view of that trajectory's feature rows, so it can be used wherever a list of
+    trajectories was used before. Full states can optionally be spilled to an on-disk side store.
+    """
+    def __init__(self, side_store_path=None, initial_capacity=1024):
+        self.features = None
+        self.num_rows = 0
+        self.offsets = [0]
+        self.initial_capacity = initial_capacity
+        self.side_store = StateSideStore(side_store_path) if side_store_path is not None else None
+
+    def append(self, features, states=None):
+        """ Add one trajectory given the features of its states (and the full states, for the side store). """
+        features = np.asarray(features, dtype=np.float64)
+        self._reserve(self.num_rows + len(features), features.shape[1])
+        self.features[self.num_rows:self.num_rows + len(features)] = features
+
+        if self.side_store is not None:
+            assert states is not None and len(states) == len(features)
+            self.side_store.write(self.num_rows, np.array(states, dtype=np.float64))
+
+        self.num_rows += len(features)
+        self.offsets.append(self.num_rows)
+
+    def _reserve(self, num_rows, num_features):
+        if self.features is None:
+            self.features = np.empty((max(self.initial_capacity, num_rows), num_features))
+        elif num_rows > self.features.shape[0]:
+            features = np.empty((max(2 * self.features.shape[0], num_rows), num_features))
+            features[:self.num_rows] = self.features[:self.num_rows]
+            self.features = features
+
+    def feature_matrix(self):
+        """ All feature rows, shape (num_states, num_features). The returned array is a read-only view. """
+        if self.features is None:
+            return np.empty((0, 0))
+        return self._read_only(self.features[:self.num_rows])
+
+    def trajectory_slice(self, idx):
+        idx = range(len(self))[idx]
+        return slice(self.offsets[idx], self.offsets[idx + 1])
+
+    def get_states(self, idx):
+        """ Full states of trajectory `idx`, read back from the side store. """
+        assert self.side_store is not None, "Full states are only available with a side store"
+        return self.side_store.read(self.trajectory_slice(idx), self.num_rows)
+
+    def __getitem__(self, idx):
+        return self._read_only(self.features[self.trajectory_slice(idx)])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def __copy__(self):
+        """ Compact, independent snapshot (used for checkpointing). """
+        snapshot = ExampleStore.__new__(ExampleStore)
+        snapshot.__dict__.update(self.__dict__)
+        snapshot.features = None if self.features is None else self.features[:self.num_rows].copy()
+        snapshot.offsets = list(self.offsets)
+        return snapshot
+
+    @staticmethod
+    def _read_only(array):
+        view = array.view()
+        view.flags.writeable = False
+        return view
+
+
+class StateSideStore(object):
+    """ Flat float64 file holding the full states of an `ExampleStore`, one row per state. """
+    def __init__(self, path):
+        self.path = path
+        self.num_features = None
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def write(self, start_row, states):
+        self.num_features = states.shape[1]
+        mode = "r+b" if os.path.exists(self.path) else "wb"
+        with open(self.path, mode) as f:
+            # Writing at the row offset (and truncating after it) keeps the file consistent with the
+            # store even if it holds rows that were appended after the store was last checkpointed
+            f.seek(start_row * self.num_features * 8)
+            states.tofile(f)
+            f.truncate()
+
+    def read(self, rows, num_rows):
+        states = np.memmap(self.path, dtype=np.float64, mode="r", shape=(num_rows, self.num_features))
+        return np.array(states[rows])
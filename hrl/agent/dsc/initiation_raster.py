@@ -0,0 +1,39 @@
+import numpy as np
+
+
+class InitiationRaster(object):
+    """
+    Grid rasterization of a fitted initiation classifier over the maze extents.
+
+    The classifier is evaluated once at every cell center when the raster is built; afterwards
+    membership queries are an array lookup at the nearest cell center. Queries outside of the
+    rasterized extents fall back to the exact classifier. Exposes the same `predict` interface
+    as the underlying classifier (1 inside the region, 0 outside).
+    """
+    def __init__(self, classifier, low, high, resolution):
+        self.classifier = classifier
+        self.resolution = resolution
+        self.low = np.asarray(low, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+
+        xs = np.arange(self.low[0], self.high[0] + resolution, resolution)
+        ys = np.arange(self.low[1], self.high[1] + resolution, resolution)
+        self.shape = np.array((len(xs), len(ys)))
+
+        grid = np.stack(np.meshgrid(xs, ys, indexing="ij"), axis=-1).reshape(-1, 2)
+        self.mask = (classifier.predict(grid) == 1).reshape(len(xs), len(ys))
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        assert X.ndim == 2 and X.shape[1] == 2, f"Rasters only support 2-D features, got {X.shape}"
+
+        idx = np.rint((X - self.low) / self.resolution).astype(np.int64)
+        inside = np.all((idx >= 0) & (idx < self.shape), axis=1)
+
+        predictions = np.zeros(X.shape[0], dtype=np.int64)
+        predictions[inside] = self.mask[idx[inside, 0], idx[inside, 1]]
+
+        if not inside.all():
+            predictions[~inside] = self.classifier.predict(X[~inside]) == 1
+
+        return predictions
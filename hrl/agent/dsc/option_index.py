@@ -0,0 +1,59 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class NearestOptionIndex(object):
+    """
+    KD-tree over the initiation-classifier features of the points of every option's pessimistic region (the
+    region `sample_from_termination_region` samples from; the effect set for options that have none yet).
+
+    `nearest` answers which option owns the point closest to a state in logarithmic time. This approximates
+    the exhaustive searches of the chain (median distance to every region) and of the tree (value of a sampled
+    termination point of every option). The KD-tree is rebuilt lazily when the options or any of their
+    classifiers change (see `classifier_version`); examples added in between are picked up at the next refit.
+    """
+    def __init__(self, mdp):
+        self.mdp = mdp
+
+        self._key = None
+        self._kd_tree = None
+        self._options = []
+        self._owners = np.zeros(0, dtype=int)
+
+    def nearest(self, options, state):
+        """ The option in `options` closest to `state`, or None if none of them has any points yet. """
+        self._maybe_rebuild(options)
+
+        if self._kd_tree is None:
+            return None
+
+        features = self.mdp.extract_features_for_initiation_classifier(state)
+        _, point_idx = self._kd_tree.query(features)
+        return self._options[self._owners[point_idx]]
+
+    def _maybe_rebuild(self, options):
+        key = tuple((option.name, option.classifier_version, len(option.effect_set)) for option in options)
+        if key == self._key:
+            return
+
+        points, owners = [], []
+        for option_idx, option in enumerate(options):
+            option_points = self._get_points(option)
+            if len(option_points) > 0:
+                points.append(option_points)
+                owners.append(np.full(len(option_points), option_idx))
+
+        self._key = key
+        self._options = list(options)
+        self._kd_tree = cKDTree(np.concatenate(points)) if len(points) > 0 else None
+        self._owners = np.concatenate(owners) if len(owners) > 0 else np.zeros(0, dtype=int)
+
+    def _get_points(self, option):
+        points = option.get_states_inside_pessimistic_classifier_region()
+        if len(points) > 0:
+            return points
+
+        if len(option.effect_set) > 0:
+            return self.mdp.extract_features_for_initiation_classifier(np.array(option.effect_set))
+
+        return []
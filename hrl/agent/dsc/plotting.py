@@ -0,0 +1,69 @@
+import threading
+from collections import OrderedDict
+
+
+class PlottingWorker(object):
+    """
+    Renders the plots of `log_status` in a background thread, so that training doesn't wait on them.
+
+    Jobs are the closures returned by the `snapshot_*_plot` functions of `hrl.agent.dsc.utils`: they only hold
+    copies of the arrays, classifiers and critics they need, so they can render while training goes on. At most
+    `max_queued_jobs` jobs wait to be rendered; beyond that the oldest one is dropped, and a job replaces any
+    queued job that would write the same file (eg, the initiation-set plot of an option without a GIF).
+    Errors raised by a job are re-raised in the training thread by the next call to `submit` or `wait`.
+    Jobs predict with the classifiers that training keeps using, so they need a `thread_safe` classifier backend.
+    """
+    def __init__(self, max_queued_jobs):
+        assert max_queued_jobs > 0, max_queued_jobs
+        self.max_queued_jobs = max_queued_jobs
+        self.num_dropped_jobs = 0
+
+        self._jobs = OrderedDict()
+        self._num_running = 0
+        self._error = None
+        self._condition = threading.Condition()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, saving_path, plot_job):
+        with self._condition:
+            self._raise_error()
+
+            if saving_path in self._jobs:
+                del self._jobs[saving_path]
+                self.num_dropped_jobs += 1
+            elif len(self._jobs) >= self.max_queued_jobs:
+                self._jobs.popitem(last=False)
+                self.num_dropped_jobs += 1
+
+            self._jobs[saving_path] = plot_job
+            self._condition.notify_all()
+
+    def wait(self):
+        """ Block until every queued job has been rendered. """
+        with self._condition:
+            self._condition.wait_for(lambda: len(self._jobs) == 0 and self._num_running == 0)
+            self._raise_error()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: len(self._jobs) > 0)
+                _, plot_job = self._jobs.popitem(last=False)
+                self._num_running = 1
+
+            try:
+                plot_job()
+            except Exception as error:
+                with self._condition:
+                    self._error = self._error or error
+
+            with self._condition:
+                self._num_running = 0
+                self._condition.notify_all()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
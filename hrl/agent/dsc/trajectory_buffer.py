@@ -0,0 +1,69 @@
+import numpy as np
+
+
+class TrajectoryBuffer(object):
+    """
+    Columnar buffer of the transitions of one option rollout, preallocated to the option's timeout.
+
+    Visited states are stored once, in a (capacity + 1, D) array: transition i goes from row i to row i + 1,
+    so `states` and `next_states` are both views into it. All accessors return read-only views, which the
+    consumers of a rollout (hindsight replay, example derivation, data validity checks) process in batch.
+    Iterating over the buffer yields (state, action, reward, next_state, done) tuples, like the list of
+    transitions it replaces.
+    """
+    def __init__(self, start_state, action_dim, capacity):
+        self.capacity = capacity
+        self.num_transitions = 0
+
+        self._states = np.empty((capacity + 1, len(start_state)))
+        self._actions = np.empty((capacity, action_dim))
+        self._rewards = np.empty(capacity)
+        self._dones = np.empty(capacity, dtype=bool)
+
+        self._states[0] = start_state
+
+    def append(self, action, reward, next_state, done):
+        assert self.num_transitions < self.capacity, f"Trajectory longer than its capacity {self.capacity}"
+        i = self.num_transitions
+        self._actions[i] = action
+        self._rewards[i] = reward
+        self._states[i + 1] = next_state
+        self._dones[i] = done
+        self.num_transitions += 1
+
+    @property
+    def visited_states(self):
+        """ Start state followed by the next state of every transition, shape (N + 1, D). """
+        return self._read_only(self._states[:self.num_transitions + 1])
+
+    @property
+    def states(self):
+        return self._read_only(self._states[:self.num_transitions])
+
+    @property
+    def next_states(self):
+        return self._read_only(self._states[1:self.num_transitions + 1])
+
+    @property
+    def actions(self):
+        return self._read_only(self._actions[:self.num_transitions])
+
+    @property
+    def rewards(self):
+        return self._read_only(self._rewards[:self.num_transitions])
+
+    @property
+    def dones(self):
+        return self._read_only(self._dones[:self.num_transitions])
+
+    def __len__(self):
+        return self.num_transitions
+
+    def __iter__(self):
+        return zip(self.states, self.actions, self.rewards, self.next_states, self.dones)
+
+    @staticmethod
+    def _read_only(array):
+        view = array.view()
+        view.flags.writeable = False
+        return view
@@ -1,17 +1,31 @@
 import os
+from copy import deepcopy
+from functools import partial
 
 import torch
 import scipy
 import numpy as np
 from tqdm import tqdm
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from treelib import Tree, Node
 
 class SkillTree(object):
+    """
+    Options indexed by name and by parent. `act` reads the BFS order and the options in each training phase
+    on every decision, so they are cached: the BFS order is updated when an option is added, the phase lists
+    when `update_training_phase` sees an option leave gestation. Callers must not mutate the cached lists.
+    """
+    TRAINING_PHASES = ("gestation", "initiation_done")
+
     def __init__(self, options):
         self._tree = Tree()
         self.options = options
 
+        self._bfs_order = []
+        self._phases = {}
+        self._options_by_phase = {phase: [] for phase in self.TRAINING_PHASES}
+
         if len(options) > 0:
             [self.add_node(option) for option in options]
 
@@ -22,6 +36,10 @@ class SkillTree(object):
             parent = option.parent.name if option.parent is not None else None
             self._tree.create_node(tag=option.name, identifier=option.name, data=option, parent=parent)
 
+            self._insert_in_bfs_order(option)
+            self._phases[option.name] = option.get_training_phase()
+            self._partition_by_phase()
+
     def get_option(self, option_name):
         if option_name in self._tree.nodes:
             node = self._tree.nodes[option_name]
@@ -35,7 +53,44 @@ class SkillTree(object):
 
     def traverse(self):
         """ Breadth first search traversal of the skill-tree. """
-        return list(self._tree.expand_tree(mode=self._tree.WIDTH))
+        return [option.name for option in self._bfs_order]
+
+    def get_options_in_bfs_order(self):
+        return self._bfs_order
+
+    def get_options_in_phase(self, training_phase):
+        """ Options currently in `training_phase`, in BFS order. """
+        return self._options_by_phase[training_phase]
+
+    def update_training_phase(self, option):
+        """ Re-file `option` if its training phase changed (eg, after it was rolled out). """
+        if option.name not in self._phases:  # eg, the global option
+            return
+        training_phase = option.get_training_phase()
+        if self._phases[option.name] != training_phase:
+            self._phases[option.name] = training_phase
+            self._partition_by_phase()
+
+    def update_training_phases(self):
+        """ `update_training_phase` for every option, eg after their counters were restored from a checkpoint. """
+        for option in self.options:
+            self.update_training_phase(option)
+
+    def _insert_in_bfs_order(self, option):
+        # Level order with siblings sorted by name, the order of `Tree.expand_tree(mode=Tree.WIDTH)`
+        ranks = {other.name: rank for rank, other in enumerate(self._bfs_order)}
+
+        def sort_key(o):
+            parent_rank = ranks[o.parent.name] if o.parent is not None else -1
+            return self.get_depth(o), parent_rank, o.name
+
+        key = sort_key(option)
+        index = next((i for i, other in enumerate(self._bfs_order) if sort_key(other) > key), len(self._bfs_order))
+        self._bfs_order.insert(index, option)
+
+    def _partition_by_phase(self):
+        self._options_by_phase = {phase: [option for option in self._bfs_order if self._phases[option.name] == phase]
+                                  for phase in self.TRAINING_PHASES}
 
     def show(self):
         """ Visualize the graph by printing it to the terminal. """
@@ -60,65 +115,113 @@ def get_grid_states(mdp):
 
 
 def get_initiation_set_values(option):
-    values = []
-    x_low_lim, y_low_lim = option.overall_mdp.get_x_y_low_lims()
-    x_high_lim, y_high_lim = option.overall_mdp.get_x_y_high_lims()
-    for x in np.arange(x_low_lim, x_high_lim+1, 1):
-        for y in np.arange(y_low_lim, y_high_lim+1, 1):
-            pos = np.array((x, y))
-            init = option.is_init_true(pos)
-            if hasattr(option.overall_mdp.env, 'env'):
-                init = init and not option.overall_mdp.env.env._is_in_collision(pos)
-            values.append(init)
+    states = np.array(get_grid_states(option.overall_mdp))
+    return snapshot_initiation_set(option)(states).tolist()
+
+
+def snapshot_initiation_set(option):
+    """
+    `option.is_init_true` as a batched function of positions that only holds on to the current classifiers (or
+    rasters) of `option`: refits replace them rather than update them, so it can be evaluated later, off-thread.
+    Training keeps predicting with the same classifiers meanwhile, so that takes a `thread_safe` backend.
+    """
+    always_true = option.global_init or option.get_training_phase() == "gestation"
+    start_event = option.mdp.get_start_state_salient_event() if option.is_last_option else None
+    optimistic = option.optimistic_raster if option.optimistic_raster is not None else option.optimistic_classifier
+    pessimistic = option.pessimistic_raster if option.pessimistic_raster is not None else option.pessimistic_classifier
+    return partial(_classify_initiation_set, option.overall_mdp, always_true, start_event, optimistic, pessimistic)
+
+
+def _classify_initiation_set(mdp, always_true, start_event, optimistic, pessimistic, positions):
+    if always_true:
+        values = np.ones(len(positions), dtype=bool)
+    else:
+        features = mdp.extract_features_for_initiation_classifier(positions)
+        values = np.zeros(len(positions), dtype=bool)
+        for classifier in (optimistic, pessimistic):
+            if classifier is not None:
+                values |= classifier.predict(features) == 1
+        if start_event is not None:
+            values |= start_event(positions)
+
+    # The maze walls are static, so this only reads the env
+    if hasattr(mdp.env, 'env'):
+        values &= np.array([not mdp.env.env._is_in_collision(pos) for pos in positions], dtype=bool)
     return values
 
 def plot_one_class_initiation_classifier(option):
+    X = option.construct_feature_matrix(option.positive_examples)
+    _plot_one_class_boundary(plt.gca(), option.pessimistic_classifier, X, option.option_idx)
+
 
+def _plot_one_class_boundary(ax, classifier, X, option_idx):
     colors = ["blue", "yellow", "green", "red", "cyan", "brown"]
 
-    X = option.construct_feature_matrix(option.positive_examples)
     X0, X1 = X[:, 0], X[:, 1]
     xx, yy = make_meshgrid(X0, X1)
-    Z1 = option.pessimistic_classifier.decision_function(np.c_[xx.ravel(), yy.ravel()])
+    Z1 = classifier.decision_function(np.c_[xx.ravel(), yy.ravel()])
     Z1 = Z1.reshape(xx.shape)
 
-    color = colors[option.option_idx % len(colors)]
-    plt.contour(xx, yy, Z1, levels=[0], linewidths=2, colors=[color])
+    color = colors[option_idx % len(colors)]
+    ax.contour(xx, yy, Z1, levels=[0], linewidths=2, colors=[color])
 
 def plot_two_class_classifier(option, episode, experiment_name, plot_examples=True, seed=0):
-    states = get_grid_states(option.overall_mdp)
-    values = get_initiation_set_values(option)
+    _, plot_job = snapshot_two_class_classifier_plot(option, episode, experiment_name, plot_examples, seed)
+    plot_job()
+
+
+def snapshot_two_class_classifier_plot(option, episode, experiment_name, plot_examples=True, seed=0):
+    """
+    Copy the examples of `option` and snapshot its initiation set (see `snapshot_initiation_set`); returns the
+    path of the plot and a job that classifies the grid states and renders the plot from these snapshots only,
+    so that it can run off the training thread while the option keeps training.
+    """
+    states = np.array(get_grid_states(option.overall_mdp))
+    initiation_set = snapshot_initiation_set(option)
+
+    positive_examples = np.array(option.construct_feature_matrix(option.positive_examples))
+    negative_examples = np.array(option.construct_feature_matrix(option.negative_examples))
+
+    name = option.name if episode is None else option.name + f"_{experiment_name}_{episode}"
+    saving_path = os.path.join('results', experiment_name, 'initiation_set_plots', f'{name}_initiation_classifier_{seed}.png')
+
+    # Refits replace the classifier rather than update it, so the job can hold on to the current one
+    plot_job = partial(_render_two_class_classifier_plot, saving_path, option.name, option.option_idx, states,
+                       initiation_set, positive_examples, negative_examples, option.pessimistic_classifier,
+                       plot_examples)
+    return saving_path, plot_job
+
+
+def _render_two_class_classifier_plot(saving_path, option_name, option_idx, states, initiation_set,
+                                      positive_examples, negative_examples, pessimistic_classifier, plot_examples):
+    values = initiation_set(states)
+
+    fig = Figure()
+    ax = fig.add_subplot()
 
-    x = np.array([state[0] for state in states])
-    y = np.array([state[1] for state in states])
+    x, y = states[:, 0], states[:, 1]
     xi, yi = np.linspace(x.min(), x.max(), 1000), np.linspace(y.min(), y.max(), 1000)
     xx, yy = np.meshgrid(xi, yi)
     rbf = scipy.interpolate.Rbf(x, y, values, function="linear")
     zz = rbf(xx, yy)
-    plt.imshow(zz, vmin=min(values), vmax=max(values), extent=[x.min(), x.max(), y.min(), y.max()], origin="lower", alpha=0.6, cmap=plt.cm.coolwarm)
-    plt.colorbar()
+    image = ax.imshow(zz, vmin=min(values), vmax=max(values), extent=[x.min(), x.max(), y.min(), y.max()], origin="lower", alpha=0.6, cmap=plt.cm.coolwarm)
+    fig.colorbar(image, ax=ax)
 
     # Plot trajectories
-    positive_examples = option.construct_feature_matrix(option.positive_examples)
-    negative_examples = option.construct_feature_matrix(option.negative_examples)
-
     if positive_examples.shape[0] > 0 and plot_examples:
-        plt.scatter(positive_examples[:, 0], positive_examples[:, 1], label="positive", c="black", alpha=0.3, s=10)
+        ax.scatter(positive_examples[:, 0], positive_examples[:, 1], label="positive", c="black", alpha=0.3, s=10)
 
     if negative_examples.shape[0] > 0 and plot_examples:
-        plt.scatter(negative_examples[:, 0], negative_examples[:, 1], label="negative", c="lime", alpha=1.0, s=10)
+        ax.scatter(negative_examples[:, 0], negative_examples[:, 1], label="negative", c="lime", alpha=1.0, s=10)
 
-    if option.pessimistic_classifier is not None:
-        plot_one_class_initiation_classifier(option)
+    if pessimistic_classifier is not None:
+        _plot_one_class_boundary(ax, pessimistic_classifier, positive_examples, option_idx)
 
     # background_image = imageio.imread("four_room_domain.png")
     # plt.imshow(background_image, zorder=0, alpha=0.5, extent=[-2.5, 10., -2.5, 10.])
 
-    name = option.name if episode is None else option.name + f"_{experiment_name}_{episode}"
-    plt.title(f"{option.name} Initiation Set")
-    saving_path = os.path.join('results', experiment_name, 'initiation_set_plots', f'{name}_initiation_classifier_{seed}.png')
-    plt.savefig(saving_path)
-    plt.close()
+    ax.set_title(f"{option_name} Initiation Set")
+    fig.savefig(saving_path)
 
 
 def plot_initiation_distribution(option, mdp, episode, experiment_name, chunk_size=10000):
@@ -147,46 +250,70 @@ def plot_initiation_distribution(option, mdp, episode, experiment_name, chunk_si
 
 
 def make_chunked_goal_conditioned_value_function_plot(solver, goal, episode, seed, experiment_name, chunk_size=1000, replay_buffer=None, option_idx=None):
+    _, plot_job = snapshot_value_function_plot(solver, goal, episode, seed, experiment_name, chunk_size, replay_buffer, option_idx)
+    return plot_job()
+
+
+def snapshot_value_function_plot(solver, goal, episode, seed, experiment_name, chunk_size=1000, replay_buffer=None, option_idx=None):
+    """
+    Copy the replayed states and actions, and freeze a copy of the critic; returns the path of the plot and a job
+    that relabels the states with `goal`, evaluates them and renders the plot from these copies only, so that it
+    can run off the training thread while `solver` trains.
+    """
     replay_buffer = replay_buffer if replay_buffer is not None else solver.replay_buffer
 
-    goal = goal[:2]  # Extracting the position from the goal vector
+    goal = np.array(goal[:2])  # Extracting the position from the goal vector
 
-    # Take out the original goal and append the new goal
-    states = [exp[0] for exp in replay_buffer]
-    states = [state[:-2] for state in states]
-    states = np.array([np.concatenate((state, goal), axis=0) for state in states])
+    if hasattr(replay_buffer, "state"):
+        states = np.array(replay_buffer.state[:len(replay_buffer)])
+        actions = np.array(replay_buffer.action[:len(replay_buffer)])
+    else:
+        states = np.array([exp[0] for exp in replay_buffer])
+        actions = np.array([exp[1] for exp in replay_buffer])
 
-    actions = np.array([exp[1] for exp in replay_buffer])
+    if option_idx is None:
+        file_name = f"{solver.name}_value_function_seed_{seed}_episode_{episode}"
+    else:
+        file_name = f"{solver.name}_value_function_seed_{seed}_episode_{episode}_option_{option_idx}"
+    saving_path = os.path.join('results', experiment_name, 'value_function_plots', f'{file_name}.png')
+
+    plot_job = partial(_render_value_function_plot, saving_path, deepcopy(solver.critic), solver.device,
+                       states, actions, goal, chunk_size)
+    return saving_path, plot_job
 
+
+def _render_value_function_plot(saving_path, critic, device, states, actions, goal, chunk_size):
     # Chunk up the inputs so as to conserve GPU memory
     num_chunks = int(np.ceil(states.shape[0] / chunk_size))
 
     if num_chunks == 0:
         return 0.
 
+    # Take out the original goal and append the new goal
+    states = np.concatenate((states[:, :-2], np.repeat(goal[None, :], len(states), axis=0)), axis=1)
+
     state_chunks = np.array_split(states, num_chunks, axis=0)
     action_chunks = np.array_split(actions, num_chunks, axis=0)
     qvalues = np.zeros((states.shape[0],))
     current_idx = 0
 
+    critic.eval()
     for chunk_number, (state_chunk, action_chunk) in tqdm(enumerate(zip(state_chunks, action_chunks)), desc="Making VF plot"):  # type: (int, np.ndarray)
-        state_chunk = torch.from_numpy(state_chunk).float().to(solver.device)
-        action_chunk = torch.from_numpy(action_chunk).float().to(solver.device)
-        chunk_qvalues = solver.get_qvalues(state_chunk, action_chunk).cpu().numpy().squeeze(1)
+        state_chunk = torch.from_numpy(state_chunk).float().to(device)
+        action_chunk = torch.from_numpy(action_chunk).float().to(device)
+        with torch.no_grad():
+            q1, q2 = critic(state_chunk, action_chunk)
+        chunk_qvalues = torch.min(q1, q2).cpu().numpy().squeeze(1)
         current_chunk_size = len(state_chunk)
         qvalues[current_idx:current_idx + current_chunk_size] = chunk_qvalues
         current_idx += current_chunk_size
 
-    plt.scatter(states[:, 0], states[:, 1], c=qvalues)
-    plt.colorbar()
+    fig = Figure()
+    ax = fig.add_subplot()
+    scatter = ax.scatter(states[:, 0], states[:, 1], c=qvalues)
+    fig.colorbar(scatter, ax=ax)
 
-    if option_idx is None:
-        file_name = f"{solver.name}_value_function_seed_{seed}_episode_{episode}"
-    else:
-        file_name = f"{solver.name}_value_function_seed_{seed}_episode_{episode}_option_{option_idx}"
-    plt.title(f"VF Targeting {np.round(goal, 2)}")
-    saving_path = os.path.join('results', experiment_name, 'value_function_plots', f'{file_name}.png')
-    plt.savefig(saving_path)
-    plt.close()
+    ax.set_title(f"VF Targeting {np.round(goal, 2)}")
+    fig.savefig(saving_path)
 
     return qvalues.max()
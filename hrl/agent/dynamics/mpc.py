@@ -201,6 +201,9 @@ class MPC:
     def step(self, state, action, reward, next_state, done):
         self.replay_buffer.store(state, action, reward, next_state, done)
 
+    def batched_step(self, states, actions, rewards, next_states, dones):
+        self.replay_buffer.store_batch(states, actions, rewards, next_states, dones)
+
     def _preprocess_data(self):
         states = self.replay_buffer.obs_buf[:self.replay_buffer.size, :]
         actions = self.replay_buffer.act_buf[:self.replay_buffer.size, :]
@@ -20,6 +20,7 @@ class ReplayBuffer:
         self.rew_buf = np.zeros(size, dtype=np.float32)
         self.done_buf = np.zeros(size, dtype=np.float32)
         self.ptr, self.size, self.max_size = 0, 0, size
+        self.num_added = 0  # rows ever stored, including the overwritten ones
 
     def store(self, obs, act, rew, next_obs, done):
         self.obs_buf[self.ptr] = obs
@@ -29,6 +30,18 @@ class ReplayBuffer:
         self.done_buf[self.ptr] = done
         self.ptr = (self.ptr+1) % self.max_size
         self.size = min(self.size+1, self.max_size)
+        self.num_added += 1
+
+    def store_batch(self, obs, act, rew, next_obs, done):
+        idxs = (self.ptr + np.arange(len(obs))) % self.max_size
+        self.obs_buf[idxs] = obs
+        self.obs2_buf[idxs] = next_obs
+        self.act_buf[idxs] = act
+        self.rew_buf[idxs] = rew
+        self.done_buf[idxs] = done
+        self.ptr = (self.ptr+len(obs)) % self.max_size
+        self.size = min(self.size+len(obs), self.max_size)
+        self.num_added += len(obs)
 
     def sample_batch(self, batch_size=32):
         idxs = np.random.randint(0, self.size, size=batch_size)
@@ -2,8 +2,9 @@ import numpy as np
 import torch
 import torch.nn.functional as F
 
-from hrl.agent.td3.replay_buffer import ReplayBuffer
-from hrl.agent.td3.model import Actor, Critic, NormActor
+from hrl.agent.td3.replay_buffer import ReplayBuffer, PrioritizedReplayBuffer
+from hrl.agent.td3.model import Actor, Critic, NormActor, TwinCritic, NumpyActor
+from hrl.agent.td3.value_cache import ValueQueryCache
 from hrl.agent.td3.utils import *
 
 
@@ -27,7 +28,12 @@ class TD3(object):
             exploration_noise=0.1,
             lr_c=3e-4, lr_a=3e-4,
             device=torch.device("cuda"),
-            name="Global-TD3-Agent"
+            name="Global-TD3-Agent",
+            fused_update=False,
+            compile_update=False,
+            use_numpy_actor=False,
+            prioritized_replay=False,
+            value_cache_updates=0
     ):
 
         self.critic_learning_rate = lr_c
@@ -42,11 +48,17 @@ class TD3(object):
         self.target_actor = copy.deepcopy(self.actor)
         self.actor_optimizer = torch.optim.Adam(self.actor.parameters(), lr=self.actor_learning_rate)
 
-        self.critic = Critic(state_dim, action_dim).to(device)
+        if fused_update:
+            self.critic = TwinCritic(state_dim, action_dim).to(device)
+        else:
+            self.critic = Critic(state_dim, action_dim).to(device)
         self.target_critic = copy.deepcopy(self.critic)
         self.critic_optimizer = torch.optim.Adam(self.critic.parameters(), lr=self.critic_learning_rate)
 
-        self.replay_buffer = ReplayBuffer(state_dim, action_dim, device=device)
+        if prioritized_replay:
+            self.replay_buffer = PrioritizedReplayBuffer(state_dim, action_dim, device=device)
+        else:
+            self.replay_buffer = ReplayBuffer(state_dim, action_dim, device=device)
 
         self.max_action = max_action
         self.action_dim = action_dim
@@ -60,35 +72,79 @@ class TD3(object):
         self.device = device
         self.name = name
         self.use_output_normalization = use_output_normalization
+        self.fused_update = fused_update
+        self.compile_update = compile_update
+        self.use_numpy_actor = use_numpy_actor
+        self.prioritized_replay = prioritized_replay
 
         self.trained_options = []
 
         self.total_it = 0
+        self.num_actor_updates = 0
+
+        # NumPy copy of the actor, refreshed lazily whenever the actor has been updated
+        self._numpy_actor = None
+        self._numpy_actor_version = -1
+
+        # Memoized V(s, g) queries, invalidated every `value_cache_updates` TD3 updates (0 disables the cache)
+        self.value_cache = ValueQueryCache(invalidate_every=value_cache_updates) if value_cache_updates > 0 else None
+
+        self._critic_loss = self.compute_critic_loss
+        self._actor_loss = self.compute_actor_loss
+
+        if compile_update:
+            assert hasattr(torch, "compile"), "Compiling the TD3 update requires torch>=2.0"
+            self._critic_loss = torch.compile(self.compute_critic_loss)
+            self._actor_loss = torch.compile(self.compute_actor_loss)
 
     def act(self, state, evaluation_mode=False):
-        state = torch.FloatTensor(state.reshape(1, -1)).to(self.device)
-        selected_action = self.actor(state)
+        """ Select actions for a single state of shape (D,) or a batch of states of shape (N, D). """
+        is_batched = state.ndim == 2
+        states = state if is_batched else state[None, :]
 
-        if self.use_output_normalization:
-            selected_action = self.normalize_actions(selected_action)
+        if self.use_numpy_actor:
+            selected_action = self._numpy_act(states)
+        else:
+            with torch.inference_mode():
+                states = torch.as_tensor(states, dtype=torch.float32, device=self.device)
+                selected_action = self.actor(states)
+
+                if self.use_output_normalization:
+                    selected_action = self.normalize_actions(selected_action)
 
-        selected_action = selected_action.cpu().data.numpy().flatten()
-        noise = np.random.normal(0, self.max_action * self.epsilon, size=self.action_dim)
+                selected_action = selected_action.cpu().numpy()
+
+        noise = np.random.normal(0, self.max_action * self.epsilon, size=selected_action.shape)
         if not evaluation_mode:
             selected_action += noise
-        return selected_action.clip(-self.max_action, self.max_action)
+        selected_action = selected_action.clip(-self.max_action, self.max_action)
+        return selected_action if is_batched else selected_action[0]
+
+    def _numpy_act(self, states):
+        if self._numpy_actor is None or self._numpy_actor_version != self.num_actor_updates:
+            self.sync_numpy_actor()
+
+        actions = self._numpy_actor(states)
+
+        if self.use_output_normalization:
+            G = np.abs(actions).sum(axis=1, keepdims=True) / self.action_dim
+            actions = actions / np.maximum(G, 1.)
+
+        return actions
+
+    def sync_numpy_actor(self):
+        """ Copy the current actor weights into the NumPy evaluator. Call after loading actor weights. """
+        self._numpy_actor = NumpyActor(self.actor)
+        self._numpy_actor_version = self.num_actor_updates
 
     def normalize_actions(self, actions):
 
         if len(actions.shape) == 1:
             actions = actions.unsqueeze(0)
 
-        K = torch.tensor(self.action_dim).to(self.device)
-        G = torch.sum(torch.abs(actions), dim=1).view(-1, 1)
-        G = G / K
-
-        ones = torch.ones(G.size()).to(self.device)
-        G_mod = torch.where(G >= 1, G, ones)
+        G = torch.sum(torch.abs(actions), dim=1, keepdim=True)
+        G = G / self.action_dim
+        G_mod = G.clamp(min=1.)
 
         normalized_actions = actions / G_mod
 
@@ -104,8 +160,40 @@ class TD3(object):
         self.total_it += 1
 
         # Sample replay buffer - result is tensors
-        state, action, next_state, reward, done = replay_buffer.sample(batch_size)
+        if isinstance(replay_buffer, PrioritizedReplayBuffer):
+            state, action, next_state, reward, done, weights, indices = replay_buffer.sample(batch_size)
+        else:
+            state, action, next_state, reward, done = replay_buffer.sample(batch_size)
+            weights, indices = None, None
+
+        critic_loss, td_errors = self._critic_loss(state, action, next_state, reward, done, weights)
+
+        if indices is not None:
+            replay_buffer.update_priorities(indices, td_errors.cpu().numpy().flatten())
+
+        # Optimize the critic
+        self.critic_optimizer.zero_grad()
+        critic_loss.backward()
+        self.critic_optimizer.step()
+
+        # Delayed policy updates
+        if self.total_it % self.policy_freq == 0:
+
+            # Compute actor loss
+            actor_loss = self._actor_loss(state)
+
+            # Optimize the actor
+            self.actor_optimizer.zero_grad()
+            actor_loss.backward()
+            self.actor_optimizer.step()
+            self.num_actor_updates += 1
+
+            # Update the frozen target models
+            self.soft_update(self.critic, self.target_critic)
+            self.soft_update(self.actor, self.target_actor)
 
+    def compute_critic_loss(self, state, action, next_state, reward, done, weights=None):
+        """ Twin-critic TD loss, optionally weighted per-sample by importance-sampling `weights`. """
         with torch.no_grad():
             # Select action according to policy and add clipped noise
             noise = (
@@ -129,31 +217,33 @@ class TD3(object):
         # Get current Q estimates
         current_Q1, current_Q2 = self.critic(state, action)
 
-        # Compute critic loss
-        critic_loss = F.mse_loss(current_Q1, target_Q) + F.mse_loss(current_Q2, target_Q)
+        # TD errors are used to update the priorities of the sampled transitions
+        td_errors = torch.max(torch.abs(current_Q1 - target_Q), torch.abs(current_Q2 - target_Q)).detach()
 
-        # Optimize the critic
-        self.critic_optimizer.zero_grad()
-        critic_loss.backward()
-        self.critic_optimizer.step()
+        # Compute critic loss
+        if weights is None:
+            critic_loss = F.mse_loss(current_Q1, target_Q) + F.mse_loss(current_Q2, target_Q)
+        else:
+            critic_loss = (weights * (current_Q1 - target_Q) ** 2).mean() + \
+                          (weights * (current_Q2 - target_Q) ** 2).mean()
 
-        # Delayed policy updates
-        if self.total_it % self.policy_freq == 0:
+        return critic_loss, td_errors
 
-            # Compute actor loss
-            actor_loss = -self.critic.Q1(state, self.actor(state)).mean()
+    def compute_actor_loss(self, state):
+        return -self.critic.Q1(state, self.actor(state)).mean()
 
-            # Optimize the actor
-            self.actor_optimizer.zero_grad()
-            actor_loss.backward()
-            self.actor_optimizer.step()
+    @torch.no_grad()
+    def soft_update(self, network, target_network):
+        """ Polyak averaging with one multi-tensor kernel per op instead of a Python loop over parameters.
 
-            # Update the frozen target models
-            for param, target_param in zip(self.critic.parameters(), self.target_critic.parameters()):
-                target_param.data.copy_(self.tau * param.data + (1 - self.tau) * target_param.data)
-
-            for param, target_param in zip(self.actor.parameters(), self.target_actor.parameters()):
-                target_param.data.copy_(self.tau * param.data + (1 - self.tau) * target_param.data)
+        Computes tau * param + (1 - tau) * target_param in the same order as the
+        per-parameter update, so the resulting target weights are bit-identical.
+        """
+        params = list(network.parameters())
+        target_params = list(target_network.parameters())
+        scaled_params = torch._foreach_mul(params, self.tau)
+        torch._foreach_mul_(target_params, 1. - self.tau)
+        torch._foreach_add_(target_params, scaled_params)
 
     def update_epsilon(self):
         """ We are using fixed (default) epsilons for TD3 because tuning it is hard. """
@@ -171,6 +261,11 @@ class TD3(object):
     def get_values(self, states):
         """ Get the values associated with the input states. """
 
+        if self.value_cache is not None and isinstance(states, np.ndarray):
+            return self.value_cache.query(states, self.total_it, self._get_values)
+        return self._get_values(states)
+
+    def _get_values(self, states):
         if isinstance(states, np.ndarray):
             states = torch.as_tensor(states).float().to(self.device)
 
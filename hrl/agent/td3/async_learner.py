@@ -0,0 +1,174 @@
+import time
+import queue
+from collections import defaultdict
+
+import numpy as np
+import torch
+
+from hrl.agent.td3.TD3AgentClass import TD3
+from hrl.utils import get_worker_context
+from hrl.agent.td3.utils import get_state, set_state, to_cpu
+
+
+class AsyncTD3Learner(object):
+    """
+    Runs the TD3 gradient updates of every option in a separate learner process.
+
+    The acting process keeps a `RemoteTD3` copy of every agent for action selection and value queries. Their
+    transitions are batched and pushed through a bounded queue (so that acting cannot run arbitrarily far ahead
+    of learning); the learner replays them into its own agents with the same update-to-transition ratio as
+    `TD3.step` and publishes the updated networks back every `publish_every` gradient updates per agent.
+    `sync` must be called periodically by the acting process to flush transitions and load published weights.
+
+    Args:
+        publish_every (int): gradient updates of an agent between two weight publications
+        send_every (int): transitions buffered per agent before they are pushed to the learner
+        max_queued_batches (int): capacity of the transition queue; `push` blocks when the learner lags behind
+        num_threads (int): torch threads of the learner process (0 keeps the torch default)
+    """
+    def __init__(self, publish_every=100, send_every=256, max_queued_batches=64, num_threads=0):
+        self.send_every = send_every
+
+        context = get_worker_context()
+        self._transition_queue = context.Queue(maxsize=max_queued_batches)
+        self._weight_queue = context.Queue()
+        self._process = context.Process(target=_learner_worker,
+                                        args=(self._transition_queue, self._weight_queue,
+                                              publish_every, num_threads),
+                                        daemon=True)
+        self._process.start()
+
+        self._agents = {}
+        self._pending = defaultdict(list)
+
+        # Total gradient updates of the learner as of its last publication, see `get_learning_throughput`
+        self.num_learner_updates = 0
+        self._last_report = (time.time(), 0)
+
+    def make_agent(self, **td3_kwargs):
+        agent = RemoteTD3(learner=self, **td3_kwargs)
+        assert agent.name not in self._agents, f"TD3 agent {agent.name} already exists"
+        self._agents[agent.name] = agent
+        return agent
+
+    def push(self, agent, state, action, reward, next_state, is_terminal):
+        if not agent.is_registered:
+            # Registered lazily so that the learner starts from the weights the agent was initialized with
+            self._transition_queue.put(("add", agent.name, agent.td3_kwargs, get_state(agent)))
+            agent.is_registered = True
+
+        pending = self._pending[agent.name]
+        pending.append((state, action, reward, next_state, is_terminal))
+        if len(pending) >= self.send_every:
+            self._send(agent.name)
+
+    def sync(self):
+        """ Push all buffered transitions and load the most recently published weights of every agent. """
+        for name in list(self._pending):
+            if len(self._pending[name]) > 0:
+                self._send(name)
+
+        latest = {}
+        while True:
+            try:
+                name, network_state, num_learner_updates = self._weight_queue.get_nowait()
+            except queue.Empty:
+                break
+            latest[name] = network_state
+            self.num_learner_updates = num_learner_updates
+
+        for name, network_state in latest.items():
+            self._agents[name].load_network_state(network_state)
+
+    def get_learning_throughput(self):
+        """ Gradient updates per second in the learner since the last call. """
+        last_time, last_updates = self._last_report
+        now = time.time()
+        self._last_report = (now, self.num_learner_updates)
+        return (self.num_learner_updates - last_updates) / max(now - last_time, 1e-8)
+
+    def close(self):
+        self.sync()
+        self._transition_queue.put(("close",))
+        self._process.join()
+
+    def _send(self, name):
+        states, actions, rewards, next_states, dones = zip(*self._pending[name])
+        batch = (np.array(states), np.array(actions), np.array(rewards), np.array(next_states), np.array(dones))
+        self._transition_queue.put(("transitions", name, batch))
+        self._pending[name] = []
+
+
+class RemoteTD3(TD3):
+    """
+    Acting-side copy of a TD3 agent trained by an `AsyncTD3Learner`.
+
+    `step` forwards transitions to the learner instead of training; they are also kept in the local replay
+    buffer so that value-function plots and checkpoints see the same data as the synchronous agent.
+    """
+    def __init__(self, learner, **td3_kwargs):
+        super(RemoteTD3, self).__init__(**td3_kwargs)
+        self.learner = learner
+        self.td3_kwargs = td3_kwargs
+        self.is_registered = False
+
+    def step(self, state, action, reward, next_state, is_terminal):
+        self.replay_buffer.add(state, action, reward, next_state, is_terminal)
+        self.learner.push(self, state, action, reward, next_state, is_terminal)
+
+    def load_network_state(self, network_state):
+        self.actor.load_state_dict(network_state["actor"])
+        self.critic.load_state_dict(network_state["critic"])
+        self.target_actor.load_state_dict(network_state["target_actor"])
+        self.target_critic.load_state_dict(network_state["target_critic"])
+
+        # The counters version the NumPy actor and the value cache
+        self.total_it = network_state["total_it"]
+        self.num_actor_updates = network_state["num_actor_updates"]
+        self._numpy_actor = None
+
+
+def get_network_state(td3_agent):
+    """ The parts of `get_state` needed for acting and value queries (ie, without the optimizers). """
+    return {
+        "actor": to_cpu(td3_agent.actor.state_dict()),
+        "critic": to_cpu(td3_agent.critic.state_dict()),
+        "target_actor": to_cpu(td3_agent.target_actor.state_dict()),
+        "target_critic": to_cpu(td3_agent.target_critic.state_dict()),
+        "total_it": td3_agent.total_it,
+        "num_actor_updates": td3_agent.num_actor_updates,
+    }
+
+
+def _learner_worker(transition_queue, weight_queue, publish_every, num_threads):
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+
+    agents = {}
+    last_published = {}
+    num_updates = 0
+
+    while True:
+        message = transition_queue.get()
+        command = message[0]
+
+        if command == "add":
+            _, name, td3_kwargs, state = message
+            agents[name] = TD3(**td3_kwargs)
+            set_state(agents[name], state)
+            last_published[name] = agents[name].total_it
+        elif command == "transitions":
+            _, name, batch = message
+            agent = agents[name]
+            updates_before = agent.total_it
+            for state, action, reward, next_state, done in zip(*batch):
+                agent.step(state, action, reward, next_state, done)
+            num_updates += agent.total_it - updates_before
+
+            if agent.total_it - last_published[name] >= publish_every:
+                weight_queue.put((name, get_network_state(agent), num_updates))
+                last_published[name] = agent.total_it
+        elif command == "close":
+            break
+        else:
+            raise NotImplementedError(command)
@@ -1,3 +1,4 @@
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -34,6 +35,30 @@ class NormActor(nn.Module):
         return a
 
 
+class NumpyActor(object):
+    """ NumPy snapshot of an `Actor` or `NormActor` used for low-latency inference on CPU.
+
+    For a 256-wide MLP, three small BLAS calls are much cheaper than building a
+    tensor and dispatching through autograd on every environment step.
+    """
+    def __init__(self, actor):
+        self.layers = [(layer.weight.detach().cpu().numpy().T.copy(), layer.bias.detach().cpu().numpy().copy())
+                       for layer in (actor.l1, actor.l2, actor.l3)]
+        self.max_action = getattr(actor, "max_action", None)
+
+    def __call__(self, states):
+        (w1, b1), (w2, b2), (w3, b3) = self.layers
+        states = np.asarray(states, dtype=np.float32)
+
+        a = np.maximum(states @ w1 + b1, 0.)
+        a = np.maximum(a @ w2 + b2, 0.)
+        a = a @ w3 + b3
+
+        if self.max_action is not None:
+            return self.max_action * np.tanh(a)
+        return a
+
+
 class Critic(nn.Module):
     def __init__(self, state_dim, action_dim):
         super(Critic, self).__init__()
@@ -68,3 +93,56 @@ class Critic(nn.Module):
         q1 = self.l3(q1)
         return q1
 
+
+
+class TwinCritic(nn.Module):
+    """ Critic that computes Q1 and Q2 in a single pass over the shared input.
+
+    The first layers of the two heads see the same `sa` input, so they are held
+    as one 512-wide linear layer (rows [:256] belong to Q1, rows [256:] to Q2).
+    Every output unit is still the same dot product as in `Critic`, which keeps
+    the forward pass and the gradients bit-identical in float32.
+    """
+    def __init__(self, state_dim, action_dim, hidden_dim=256):
+        super(TwinCritic, self).__init__()
+
+        self.hidden_dim = hidden_dim
+
+        # Shared input projection for Q1 and Q2
+        self.l1 = nn.Linear(state_dim + action_dim, 2 * hidden_dim)
+
+        # Q1 architecture
+        self.l2 = nn.Linear(hidden_dim, hidden_dim)
+        self.l3 = nn.Linear(hidden_dim, 1)
+
+        # Q2 architecture
+        self.l5 = nn.Linear(hidden_dim, hidden_dim)
+        self.l6 = nn.Linear(hidden_dim, 1)
+
+    def forward(self, state, action):
+        sa = torch.cat([state, action], 1)
+
+        h = F.relu(self.l1(sa))
+        h1, h2 = h.split(self.hidden_dim, dim=1)
+
+        q1 = F.relu(self.l2(h1))
+        q1 = self.l3(q1)
+
+        q2 = F.relu(self.l5(h2))
+        q2 = self.l6(q2)
+        return q1, q2
+
+    def Q1(self, state, action):
+        sa = torch.cat([state, action], 1)
+
+        q1 = F.relu(F.linear(sa, self.l1.weight[:self.hidden_dim], self.l1.bias[:self.hidden_dim]))
+        q1 = F.relu(self.l2(q1))
+        q1 = self.l3(q1)
+        return q1
+
+    def load_critic_state_dict(self, state_dict):
+        """ Load the weights of a `Critic` (separate l1/l4 input layers) into this module. """
+        state_dict = dict(state_dict)
+        state_dict["l1.weight"] = torch.cat([state_dict["l1.weight"], state_dict.pop("l4.weight")])
+        state_dict["l1.bias"] = torch.cat([state_dict["l1.bias"], state_dict.pop("l4.bias")])
+        self.load_state_dict(state_dict)
@@ -10,6 +10,7 @@ class ReplayBuffer(object):
 
 		self.ptr = 0
 		self.size = 0
+		self.num_added = 0  # rows ever added, including the overwritten ones
 
 		self.state = np.zeros((max_size, state_dim))
 		self.action = np.zeros((max_size, action_dim))
@@ -28,6 +29,7 @@ class ReplayBuffer(object):
 
 		self.ptr = (self.ptr + 1) % self.max_size
 		self.size = min(self.size + 1, self.max_size)
+		self.num_added += 1
 
 
 	def sample(self, batch_size):
@@ -52,9 +54,105 @@ class ReplayBuffer(object):
 	def clear(self):
 		self.ptr = 0
 		self.size = 0
+		self.num_added = 0
 
 		self.state = np.zeros((self.max_size, self.state_dim))
 		self.action = np.zeros((self.max_size, self.action_dim))
 		self.next_state = np.zeros((self.max_size, self.state_dim))
 		self.reward = np.zeros((self.max_size, 1))
 		self.done = np.zeros((self.max_size, 1))
+
+
+class SumTree(object):
+	"""
+	Array-backed binary sum-tree over `capacity` leaf priorities.
+	Node i stores the sum of nodes 2i and 2i+1; leaves live at [capacity, 2 * capacity).
+	Both prefix-sum sampling and priority updates are O(log n) and are vectorized over a batch.
+	"""
+	def __init__(self, capacity):
+		self.capacity = 1
+		while self.capacity < capacity:
+			self.capacity *= 2
+		self.depth = int(np.log2(self.capacity))
+		self.tree = np.zeros(2 * self.capacity)
+
+	def total(self):
+		return self.tree[1]
+
+	def __getitem__(self, indices):
+		return self.tree[self.capacity + np.asarray(indices)]
+
+	def update(self, indices, priorities):
+		nodes = self.capacity + np.asarray(indices)
+		self.tree[nodes] = priorities
+
+		for _ in range(self.depth):
+			nodes = np.unique(nodes // 2)
+			self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+	def find(self, values):
+		""" Return the leaf index whose prefix-sum interval contains each of `values`. """
+		values = np.array(values, dtype=np.float64)
+		nodes = np.ones(values.shape[0], dtype=np.int64)
+
+		for _ in range(self.depth):
+			left = 2 * nodes
+			go_right = values > self.tree[left]
+			values = np.where(go_right, values - self.tree[left], values)
+			nodes = np.where(go_right, left + 1, left)
+
+		return nodes - self.capacity
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+	"""
+	Proportional prioritized experience replay (Schaul et al., 2016).
+	`sample` additionally returns importance-sampling weights and the sampled indices,
+	which are passed back to `update_priorities` along with the new TD errors.
+	"""
+	def __init__(self, state_dim, action_dim, max_size=int(1e6), device=torch.device("cuda"),
+				 alpha=0.6, beta=0.4, beta_increment=1e-6, eps=1e-6):
+		super(PrioritizedReplayBuffer, self).__init__(state_dim, action_dim, max_size=max_size, device=device)
+
+		self.alpha = alpha
+		self.beta = beta
+		self.beta_increment = beta_increment
+		self.eps = eps
+
+		self.tree = SumTree(max_size)
+		self.max_priority = 1.
+
+	def add(self, state, action, reward, next_state, done):
+		self.tree.update([self.ptr], [self.max_priority ** self.alpha])
+		super(PrioritizedReplayBuffer, self).add(state, action, reward, next_state, done)
+
+	def sample(self, batch_size):
+		# Stratified sampling: one uniform draw from each of `batch_size` equal slices of the total priority
+		segment = self.tree.total() / batch_size
+		values = (np.arange(batch_size) + np.random.uniform(size=batch_size)) * segment
+		ind = np.minimum(self.tree.find(values), self.size - 1)
+
+		probabilities = self.tree[ind] / self.tree.total()
+		weights = (self.size * probabilities) ** (-self.beta)
+		weights = weights / weights.max()
+		self.beta = min(1., self.beta + self.beta_increment)
+
+		return (
+			torch.FloatTensor(self.state[ind]).to(self.device),
+			torch.FloatTensor(self.action[ind]).to(self.device),
+			torch.FloatTensor(self.next_state[ind]).to(self.device),
+			torch.FloatTensor(self.reward[ind]).to(self.device),
+			torch.FloatTensor(self.done[ind]).to(self.device),
+			torch.FloatTensor(weights.reshape(-1, 1)).to(self.device),
+			ind
+		)
+
+	def update_priorities(self, indices, td_errors):
+		priorities = np.abs(td_errors) + self.eps
+		self.max_priority = max(self.max_priority, priorities.max())
+		self.tree.update(indices, priorities ** self.alpha)
+
+	def clear(self):
+		super(PrioritizedReplayBuffer, self).clear()
+		self.tree = SumTree(self.max_size)
+		self.max_priority = 1.
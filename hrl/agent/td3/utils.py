@@ -16,11 +16,50 @@ def save(td3_agent, filename):
 def load(td3_agent, filename):
     td3_agent.critic.load_state_dict(torch.load(filename + "_critic"))
     td3_agent.critic_optimizer.load_state_dict(torch.load(filename + "_critic_optimizer"))
-    td3_agent.critic_target = copy.deepcopy(td3_agent.critic)
+    td3_agent.target_critic = copy.deepcopy(td3_agent.critic)
 
     td3_agent.actor.load_state_dict(torch.load(filename + "_actor"))
     td3_agent.actor_optimizer.load_state_dict(torch.load(filename + "_actor_optimizer"))
-    td3_agent.actor_target = copy.deepcopy(td3_agent.actor)
+    td3_agent.target_actor = copy.deepcopy(td3_agent.actor)
+
+
+def get_state(td3_agent):
+    """ Snapshot of the networks, optimizers and counters of `td3_agent` (tensors are copied to the CPU). """
+    return {
+        "actor": to_cpu(td3_agent.actor.state_dict()),
+        "critic": to_cpu(td3_agent.critic.state_dict()),
+        "target_actor": to_cpu(td3_agent.target_actor.state_dict()),
+        "target_critic": to_cpu(td3_agent.target_critic.state_dict()),
+        "actor_optimizer": to_cpu(td3_agent.actor_optimizer.state_dict()),
+        "critic_optimizer": to_cpu(td3_agent.critic_optimizer.state_dict()),
+        "total_it": td3_agent.total_it,
+        "num_actor_updates": td3_agent.num_actor_updates,
+    }
+
+
+def set_state(td3_agent, state):
+    td3_agent.actor.load_state_dict(state["actor"])
+    td3_agent.critic.load_state_dict(state["critic"])
+    td3_agent.target_actor.load_state_dict(state["target_actor"])
+    td3_agent.target_critic.load_state_dict(state["target_critic"])
+    td3_agent.actor_optimizer.load_state_dict(state["actor_optimizer"])
+    td3_agent.critic_optimizer.load_state_dict(state["critic_optimizer"])
+    td3_agent.total_it = state["total_it"]
+    td3_agent.num_actor_updates = state["num_actor_updates"]
+
+    # Force the NumPy actor (if any) to pick up the restored weights
+    td3_agent._numpy_actor = None
+
+
+def to_cpu(obj):
+    """ Recursively copy every tensor in a (nested) state dict to the CPU. """
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().cpu().clone()
+    if isinstance(obj, dict):
+        return {key: to_cpu(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(to_cpu(value) for value in obj)
+    return obj
 
 
 def make_chunked_value_function_plot(solver, episode, seed, experiment_name, chunk_size=1000, replay_buffer=None):
@@ -0,0 +1,136 @@
+import os
+import csv
+import time
+import socket
+import argparse
+
+import numpy as np
+
+from hrl.agent.dsc.initiation_raster import InitiationRaster
+from hrl.agent.dsc.classifier_backends import CLASSIFIER_BACKENDS, make_classifier_backend
+
+
+# Initiation-set-like data: positives inside a disk in a 10x10 maze, negatives around it; queries cover the maze
+MAZE_LOW, MAZE_HIGH = np.array((-2., -2.)), np.array((10., 10.))
+REGION_CENTER, REGION_RADIUS = np.array((4., 4.)), 2.
+
+CSV_FIELDS = ("host", "num_cpus", "classifier", "backend", "raster", "num_examples",
+              "fit_time", "predict_time", "single_predict_time", "agreement")
+
+
+def sample_disk(num_examples, radius, rng):
+    angles = rng.uniform(0., 2. * np.pi, size=num_examples)
+    radii = radius * np.sqrt(rng.uniform(size=num_examples))
+    return REGION_CENTER + np.stack((radii * np.cos(angles), radii * np.sin(angles)), axis=1)
+
+
+def make_dataset(classifier_type, num_examples, rng):
+    positives = sample_disk(num_examples, REGION_RADIUS, rng)
+    if classifier_type == "one_class":
+        return positives, None
+
+    negatives = sample_disk(num_examples, 2. * REGION_RADIUS, rng)
+    negatives = negatives[np.linalg.norm(negatives - REGION_CENTER, axis=1) > REGION_RADIUS]
+    X = np.concatenate((positives, negatives))
+    Y = np.concatenate((np.ones(len(positives)), np.zeros(len(negatives))))
+    return X, Y
+
+
+def fit_classifier(backend_name, classifier_type, X, Y, raster_resolution, num_kernel_features):
+    backend = make_classifier_backend(backend_name, num_kernel_features)
+
+    if classifier_type == "one_class":
+        classifier = backend.one_class(nu=0.1)
+        classifier.fit(X)
+    else:
+        classifier = backend.two_class(class_weight="balanced")
+        classifier.fit(X, Y)
+
+    if raster_resolution > 0:
+        return InitiationRaster(classifier, MAZE_LOW, MAZE_HIGH, raster_resolution)
+    return classifier
+
+
+def timed(fn, *args):
+    start_time = time.time()
+    result = fn(*args)
+    return result, time.time() - start_time
+
+
+def benchmark(backend_name, classifier_type, num_examples, queries, reference_predictions, args):
+    rng = np.random.RandomState(args.seed)
+    X, Y = make_dataset(classifier_type, num_examples, rng)
+
+    classifier, fit_time = timed(fit_classifier, backend_name, classifier_type, X, Y,
+                                 args.raster_resolution, args.num_kernel_features)
+    predictions, predict_time = timed(lambda: classifier.predict(queries) == 1)
+    _, single_predict_time = timed(lambda: [classifier.predict(q[None, :]) for q in queries[:args.num_single_queries]])
+
+    return {
+        "host": socket.gethostname(),
+        "num_cpus": os.cpu_count(),
+        "classifier": classifier_type,
+        "backend": backend_name,
+        "raster": args.raster_resolution,
+        "num_examples": num_examples,
+        "fit_time": fit_time,
+        "predict_time": predict_time,
+        "single_predict_time": single_predict_time / args.num_single_queries,
+        "agreement": (predictions == reference_predictions).mean() if reference_predictions is not None else 1.,
+    }
+
+
+def get_available_backends(backend_names):
+    available = []
+    for backend_name in backend_names:
+        try:
+            make_classifier_backend(backend_name).one_class(nu=0.1)
+        except ImportError as e:
+            print(f"Skipping backend {backend_name}: {e}")
+            continue
+        available.append(backend_name)
+    return available
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", type=str, nargs="+", default=list(CLASSIFIER_BACKENDS),
+                        choices=list(CLASSIFIER_BACKENDS))
+    parser.add_argument("--reference_backend", type=str, default="sklearn", choices=list(CLASSIFIER_BACKENDS),
+                        help="agreement is measured against the predictions of this (exact) backend")
+    parser.add_argument("--classifier_types", type=str, nargs="+", default=["one_class", "two_class"],
+                        choices=["one_class", "two_class"])
+    parser.add_argument("--num_examples", type=int, nargs="+", default=[500, 2000, 8000])
+    parser.add_argument("--num_queries", type=int, default=100000)
+    parser.add_argument("--num_single_queries", type=int, default=1000)
+    parser.add_argument("--raster_resolution", type=float, default=0.,
+                        help="also wrap every fitted classifier in an InitiationRaster of this cell size")
+    parser.add_argument("--num_kernel_features", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default="", help="optional csv file the results are appended to")
+    args = parser.parse_args()
+
+    backends = get_available_backends(args.backends)
+    queries = np.random.RandomState(args.seed + 1).uniform(MAZE_LOW, MAZE_HIGH, size=(args.num_queries, 2))
+
+    results = []
+    for classifier_type in args.classifier_types:
+        for n in args.num_examples:
+            X, Y = make_dataset(classifier_type, n, np.random.RandomState(args.seed))
+            reference = fit_classifier(args.reference_backend, classifier_type, X, Y, 0., args.num_kernel_features)
+            reference_predictions = reference.predict(queries) == 1
+
+            for backend_name in backends:
+                result = benchmark(backend_name, classifier_type, n, queries, reference_predictions, args)
+                results.append(result)
+                print(f"[{classifier_type} | n={n}] {backend_name}: fit {result['fit_time']:.3f}s | "
+                      f"predict {result['predict_time']:.3f}s | single predict {1e6 * result['single_predict_time']:.1f}us | "
+                      f"agreement {result['agreement']:.4f}")
+
+    if args.output:
+        write_header = not os.path.exists(args.output)
+        with open(args.output, "a") as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            if write_header:
+                writer.writeheader()
+            writer.writerows(results)
@@ -0,0 +1,162 @@
+"""
+Run `python -m hrl` over a grid of configs and seeds on a local pool of worker processes.
+
+    python -m hrl.experiments.run_seeds --seeds 0 1 2 --configs umaze_dsc.json umaze_dst.json \
+        --num_workers 6 --threads_per_job 2 -- --environment antmaze-umaze-v0 --use_value_function ...
+
+Arguments after `--` are passed to every job. Each config is a json dict of extra `hrl.__main__` arguments
+(true for flags); its experiment name defaults to the file name. Every job runs in its own directory,
+<runs_dir>/<experiment_name>/seed_<seed>, and once all jobs have finished their `log_file_<seed>.jsonl`
+metrics logs are gathered into <runs_dir>/summary.pkl.
+"""
+import os
+import sys
+import json
+import pickle
+import argparse
+import itertools
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from hrl.metrics_log import read_metrics_log
+
+
+# Thread pools that would otherwise each default to one thread per core, in every concurrent job
+THREAD_ENV_VARIABLES = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def load_config(path):
+    with open(path) as f:
+        config = json.load(f)
+    config.setdefault("experiment_name", os.path.splitext(os.path.basename(path))[0])
+    return config
+
+
+def config_to_argv(config):
+    argv = []
+    for key, value in config.items():
+        if value is True:
+            argv.append(f"--{key}")
+        elif value is False or value is None:
+            continue
+        elif isinstance(value, (list, tuple)):
+            argv += [f"--{key}"] + [str(v) for v in value]
+        else:
+            argv += [f"--{key}", str(value)]
+    return argv
+
+
+def get_job_dir(runs_dir, experiment_name, seed):
+    return os.path.abspath(os.path.join(runs_dir, experiment_name, f"seed_{seed}"))
+
+
+def get_log_path(job_dir, results_dir, experiment_name, seed):
+    return os.path.join(job_dir, results_dir, experiment_name, f"log_file_{seed}.jsonl")
+
+
+def run_job(config, seed, common_argv, runs_dir, threads_per_job):
+    experiment_name = config["experiment_name"]
+    job_dir = get_job_dir(runs_dir, experiment_name, seed)
+    os.makedirs(job_dir, exist_ok=True)
+
+    argv = [sys.executable, "-u", "-m", "hrl"] + common_argv + config_to_argv(config)
+    argv += ["--seed", str(seed), "--num_threads", str(threads_per_job)]
+
+    env = dict(os.environ)
+    env.update({variable: str(threads_per_job) for variable in THREAD_ENV_VARIABLES})
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [REPO_ROOT, env.get("PYTHONPATH")]))
+
+    print(f"[{experiment_name} | seed {seed}] starting in {job_dir}")
+    with open(os.path.join(job_dir, "stdout.log"), "w") as stdout:
+        return_code = subprocess.call(argv, cwd=job_dir, env=env, stdout=stdout, stderr=subprocess.STDOUT)
+    print(f"[{experiment_name} | seed {seed}] finished with return code {return_code}")
+
+    return return_code
+
+
+def summarize(configs, seeds, runs_dir, results_dir="results"):
+    """
+    Per config: the log of every seed plus mean/std of the evaluation success rate over seeds.
+    `results_dir` is the --results_dir of the jobs, unless their config sets its own.
+    """
+    summary = {}
+    for config in configs:
+        experiment_name = config["experiment_name"]
+        config_results_dir = config.get("results_dir", results_dir)
+
+        logs = {}
+        for seed in seeds:
+            log_path = get_log_path(get_job_dir(runs_dir, experiment_name, seed), config_results_dir,
+                                    experiment_name, seed)
+            if os.path.exists(log_path):
+                logs[seed] = read_metrics_log(log_path)
+
+        # Only keep evaluation episodes that every finished seed reached
+        episodes = sorted(set.intersection(*[{episode for episode in log if "success" in log[episode]}
+                                             for log in logs.values()])) if len(logs) > 0 else []
+        successes = np.array([[logs[seed][episode]["success"] for episode in episodes] for seed in logs])
+
+        summary[experiment_name] = {
+            "seeds": sorted(logs),
+            "missing_seeds": [seed for seed in seeds if seed not in logs],
+            "episodes": episodes,
+            "success_mean": successes.mean(axis=0) if len(logs) > 0 else np.array([]),
+            "success_std": successes.std(axis=0) if len(logs) > 0 else np.array([]),
+            "logs": logs,
+        }
+
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seeds", type=int, nargs="+", required=True)
+    parser.add_argument("--configs", type=str, nargs="*", default=[],
+                        help="json files of per-config arguments; without configs, one job per seed is run with "
+                             "the common arguments only (which must then include --experiment_name)")
+    parser.add_argument("--runs_dir", type=str, default="runs")
+    parser.add_argument("--threads_per_job", type=int, default=1,
+                        help="cap on the torch/BLAS threads of every job")
+    parser.add_argument("--num_workers", type=int, default=0,
+                        help="number of concurrent jobs (default: cores // threads_per_job)")
+    args, common_argv = parser.parse_known_args()
+
+    if len(common_argv) > 0 and common_argv[0] == "--":
+        common_argv = common_argv[1:]
+
+    if len(args.configs) > 0:
+        configs = [load_config(path) for path in args.configs]
+    else:
+        name_parser = argparse.ArgumentParser(add_help=False)
+        name_parser.add_argument("--experiment_name", type=str, required=True)
+        name_args, common_argv = name_parser.parse_known_args(common_argv)
+        configs = [{"experiment_name": name_args.experiment_name}]
+
+    # The jobs get --results_dir as is, it is only parsed to know where their logs end up
+    results_parser = argparse.ArgumentParser(add_help=False)
+    results_parser.add_argument("--results_dir", type=str, default="results")
+    results_args, _ = results_parser.parse_known_args(common_argv)
+
+    num_workers = args.num_workers or max(1, os.cpu_count() // args.threads_per_job)
+    jobs = list(itertools.product(configs, args.seeds))
+
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        return_codes = list(pool.map(lambda job: run_job(job[0], job[1], common_argv, args.runs_dir,
+                                                         args.threads_per_job), jobs))
+
+    summary = summarize(configs, args.seeds, args.runs_dir, results_args.results_dir)
+    with open(os.path.join(args.runs_dir, "summary.pkl"), "wb") as f:
+        pickle.dump(summary, f)
+
+    for experiment_name, result in summary.items():
+        final_success = result["success_mean"][-1] if len(result["episodes"]) > 0 else float("nan")
+        print(f"{experiment_name}: {len(result['seeds'])} seeds finished (missing {result['missing_seeds']}), "
+              f"final success {final_success:.3f}")
+
+    failed_jobs = [(config["experiment_name"], seed) for (config, seed), code in zip(jobs, return_codes) if code != 0]
+    if len(failed_jobs) > 0:
+        print(f"Failed jobs: {failed_jobs}")
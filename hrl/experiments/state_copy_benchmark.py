@@ -0,0 +1,61 @@
+"""
+Per-step cost of state handling in the control loops.
+
+Before: the loops took `deepcopy(mdp.cur_state)` on every step. Now the wrappers hand out a fresh observation
+array (one `np.array` copy in `step`) that is never modified in place, and the loops keep references to it.
+"""
+import time
+import argparse
+from copy import deepcopy
+
+import numpy as np
+
+
+def deepcopy_per_step(observations):
+    states = []
+    for observation in observations:
+        cur_state = observation                 # wrapper: `self.cur_state = next_state`
+        states.append(deepcopy(cur_state))      # loop: `state = deepcopy(self.mdp.cur_state)`
+    return states
+
+
+def fresh_array_per_step(observations):
+    states = []
+    for observation in observations:
+        cur_state = np.array(observation)       # wrapper: `next_state = np.array(next_state)`
+        states.append(cur_state)                # loop: `state = self.mdp.cur_state`
+    return states
+
+
+def reference_per_step(observations):
+    states = []
+    for observation in observations:
+        states.append(observation)
+    return states
+
+
+def timed(fn, observations):
+    start_time = time.perf_counter()
+    fn(observations)
+    return (time.perf_counter() - start_time) / len(observations)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--state_dims", type=int, nargs="+", default=[29, 31],
+                        help="29: antmaze observations, 31: observations augmented with a goal")
+    parser.add_argument("--num_steps", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    for state_dim in args.state_dims:
+        observations = list(rng.randn(args.num_steps, state_dim))
+
+        reference_time = timed(reference_per_step, observations)
+        deepcopy_time = timed(deepcopy_per_step, observations) - reference_time
+        fresh_array_time = timed(fresh_array_per_step, observations) - reference_time
+
+        print(f"[state_dim={state_dim}] deepcopy: {1e6 * deepcopy_time:.3f}us/step | "
+              f"fresh array: {1e6 * fresh_array_time:.3f}us/step | "
+              f"speedup: {deepcopy_time / max(fresh_array_time, 1e-12):.1f}x")
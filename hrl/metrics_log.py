@@ -0,0 +1,115 @@
+"""
+Append-only log of per-episode metrics, one json record per line:
+
+    {"episode": 12, "success": 1.0, "step-count": 87.0}
+
+An episode's metrics can be spread over several records; readers merge them, later records taking precedence.
+Appending costs O(1) per record (unlike re-pickling the whole log), and the file can be read while it is
+being written, eg to follow a live run.
+"""
+import os
+import json
+import time
+
+import numpy as np
+
+
+class MetricsLog(object):
+    """
+    Writer of a metrics log. Records are buffered and appended to the file every `flush_every` records or
+    `flush_interval` seconds, whichever comes first. The file is truncated when it is first written to, so a
+    new run never appends to the log of an old one (see `rewrite` to resume a run).
+    """
+    def __init__(self, path, flush_every=32, flush_interval=30.):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+
+        self._pending = []
+        self._file = None
+        self._open_mode = "w"
+        self._last_flush = time.time()
+
+    def write(self, episode, metrics):
+        self._pending.append(_to_line(episode, metrics))
+        if len(self._pending) >= self.flush_every or time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def rewrite(self, log):
+        """ Replace the file with the records of `log` ({episode: metrics}), eg after restoring a checkpoint. """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+        self._open_mode = "w"
+        self._pending = [_to_line(episode, metrics) for episode, metrics in sorted(log.items())]
+        self.flush()
+
+    def flush(self):
+        if self._file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._file = open(self.path, self._open_mode)
+            self._open_mode = "a"
+
+        self._file.writelines(self._pending)
+        self._file.flush()
+        self._pending = []
+        self._last_flush = time.time()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+        self._file = None
+
+
+def _to_line(episode, metrics):
+    return json.dumps({"episode": episode, **metrics}, default=_to_json) + "\n"
+
+
+def _to_json(value):
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    raise TypeError(f"{type(value)} is not json serializable")
+
+
+def stream_metrics_log(path):
+    """ Yield the records of a metrics log, skipping a last line that is still being written. """
+    with open(path) as f:
+        for line in f:
+            if line.endswith("\n"):
+                yield json.loads(line)
+
+
+def follow_metrics_log(path, poll_interval=1., timeout=None):
+    """
+    Like `stream_metrics_log`, but keep waiting for new records (as `tail -f` would), until no record has
+    been appended for `timeout` seconds (forever by default). Waits for the file to be created.
+    """
+    last_record_time = time.time()
+    while not os.path.exists(path):
+        if timeout is not None and time.time() - last_record_time > timeout:
+            return
+        time.sleep(poll_interval)
+
+    with open(path) as f:
+        partial_line = ""
+        while True:
+            line = f.readline()
+            if line.endswith("\n"):
+                last_record_time = time.time()
+                yield json.loads(partial_line + line)
+                partial_line = ""
+            else:
+                partial_line += line
+                if timeout is not None and time.time() - last_record_time > timeout:
+                    return
+                time.sleep(poll_interval)
+
+
+def read_metrics_log(path):
+    """ The whole log as {episode: metrics}, the layout of the `log` dict of the experiments. """
+    log = {}
+    for record in stream_metrics_log(path):
+        episode = record.pop("episode")
+        log.setdefault(episode, {}).update(record)
+    return log
@@ -1,9 +1,10 @@
 import os
-import pickle
 import argparse
 
 from matplotlib import pyplot as plt
 
+from hrl.metrics_log import stream_metrics_log, follow_metrics_log
+
 
 def parse_args():
 	parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -11,22 +12,22 @@ def parse_args():
 						help='a subdirectory name for the saved results')
 	parser.add_argument("--results_dir", type=str, default='results',
                         help='the name of the directory used to store results')
+	parser.add_argument('--seed', type=int, default=0,
+						help='the seed of the run to plot')
+	parser.add_argument('--follow', action='store_true', default=False,
+						help='keep redrawing the curve as a live run logs new evaluations')
 	args = parser.parse_args()
 	return args
 
 
 def plot_learning_curve(file_path):
-	# open logging file
-	with open(file_path, 'rb') as f:
-		logged_data = pickle.load(f)
-	# load data
+	# stream the evaluation records of the logging file
 	time_steps = []
 	success_rates = []
-	for step in logged_data:
-		step_data = logged_data[step]
-		if 'success' in step_data:
-			time_steps.append(step)
-			success_rates.append(step_data['success'])
+	for record in stream_metrics_log(file_path):
+		if 'success' in record:
+			time_steps.append(record['episode'])
+			success_rates.append(record['success'])
 	# plot
 	plt.figure()
 	plt.plot(time_steps, success_rates, 'o-')
@@ -36,11 +37,30 @@ def plot_learning_curve(file_path):
 	plt.show()
 
 
+def follow_learning_curve(file_path):
+	plt.ion()
+	plt.figure()
+	line, = plt.plot([], [], 'o-')
+	plt.title('learning curve')
+	plt.xlabel('time step')
+	plt.ylabel('success')
+	# redraw every time the run logs an evaluation
+	for record in follow_metrics_log(file_path):
+		if 'success' in record:
+			line.set_data(list(line.get_xdata()) + [record['episode']], list(line.get_ydata()) + [record['success']])
+			plt.gca().relim()
+			plt.gca().autoscale_view()
+			plt.pause(0.01)
+
+
 def main():
 	args = parse_args()
 
-	experiment_dir = os.path.join(args.results_dir, args.experiment_name, "log_file_0.pkl")
-	plot_learning_curve(experiment_dir)
+	log_file = os.path.join(args.results_dir, args.experiment_name, f"log_file_{args.seed}.jsonl")
+	if args.follow:
+		follow_learning_curve(log_file)
+	else:
+		plot_learning_curve(log_file)
 
 	img_save_path = os.path.join(args.results_dir, args.experiment_name, "learning_curve.png")
 	plt.savefig(img_save_path)
@@ -1,6 +1,7 @@
 import numpy as np
 from scipy.spatial import distance
-from sklearn.svm import OneClassSVM
+
+from hrl.agent.dsc.classifier_backends import make_classifier_backend
 
 
 class SalientEvent(object):
@@ -156,8 +157,9 @@ class SalientEvent(object):
 
 
 class LearnedSalientEvent(SalientEvent):
-    def __init__(self, state_set, event_idx, tolerance=0.6, intersection_event=False):
+    def __init__(self, state_set, event_idx, tolerance=0.6, intersection_event=False, classifier_backend="sklearn"):
         self.state_set = state_set
+        self.classifier_backend = make_classifier_backend(classifier_backend)
         self.classifier = self._classifier_on_state_set()
 
         SalientEvent.__init__(self, target_state=None, event_idx=event_idx,
@@ -190,7 +192,7 @@ class LearnedSalientEvent(SalientEvent):
 
     def _classifier_on_state_set(self):
         positions = np.array([state.position for state in self.state_set])
-        classifier = OneClassSVM(nu=0.01, gamma="scale")
+        classifier = self.classifier_backend.one_class(nu=0.01, gamma="scale")
         classifier.fit(positions)
         return classifier
 
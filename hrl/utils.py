@@ -1,4 +1,5 @@
 import os
+import multiprocessing
 
 
 def create_log_dir(experiment_name):
@@ -10,3 +11,12 @@ def create_log_dir(experiment_name):
     else:
         print("Successfully created the directory %s " % path)
     return path
+
+
+def get_worker_context():
+    """
+    Multiprocessing context of every worker process (learner, evaluators, classifier fitters, env pools).
+    Workers are spawned rather than forked: a forked child inherits the torch/CUDA state of its parent
+    (threads, CUDA context, locks held at fork time), which can deadlock or crash it.
+    """
+    return multiprocessing.get_context("spawn")
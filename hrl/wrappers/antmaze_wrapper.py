@@ -1,5 +1,3 @@
-from copy import deepcopy
-
 import numpy as np
 import torch
 
@@ -68,6 +66,7 @@ class D4RLAntMazeWrapper(GoalConditionedMDPWrapper):
 	
 	def step(self, action):
 		next_state, reward, done, info = self.env.step(action)
+		next_state = np.array(next_state)  # the env may reuse its observation buffer
 		reward, done = self.reward_func(next_state, self.get_current_goal())
 		self.cur_state = next_state
 		self.cur_done = done
@@ -87,12 +86,13 @@ class D4RLAntMazeWrapper(GoalConditionedMDPWrapper):
 	def extract_features_for_initiation_classifier(self, states):
 		"""
 		for antmaze, the features are the x, y coordinates (first 2 dimensions)
+		of a single state (D,) or of a batch of states (N, D)
 		"""
 		assert isinstance(states, np.ndarray)
 		features = states
 		if "push" in self.unwrapped.spec.id:
-			return features[:4]
-		return features[:2]
+			return features[..., :4]
+		return features[..., :2]
 	
 	def set_xy(self, position):
 		""" Used at test-time only. """
@@ -101,7 +101,7 @@ class D4RLAntMazeWrapper(GoalConditionedMDPWrapper):
 		obs = np.concatenate((np.array(position), self.init_state[2:]), axis=0)
 		self.cur_state = obs
 		self.cur_done = False
-		self.init_state = deepcopy(self.cur_state)
+		self.init_state = self.cur_state
 
     # --------------------------------
     # Used for visualizations only
@@ -145,3 +145,14 @@ class D4RLAntMazeWrapper(GoalConditionedMDPWrapper):
 		position in the antmaze is the x, y coordinates
 		"""
 		return state[:2]
+
+
+def make_antmaze_mdp(environment, goal_state, use_dense_reward=False, seed=0):
+	""" Build and seed a D4RLAntMazeWrapper; module-level so that it can be shipped to worker processes. """
+	import gym
+	import d4rl  # registers the antmaze environments with gym
+
+	env = gym.make(environment)
+	env.seed(seed)
+	env.action_space.seed(seed)
+	return D4RLAntMazeWrapper(env, start_state=np.array((0, 0)), goal_state=goal_state, use_dense_reward=use_dense_reward)
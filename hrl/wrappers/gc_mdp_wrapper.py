@@ -1,5 +1,4 @@
 from abc import abstractmethod
-from copy import deepcopy
 from hrl.salient_event.SalientEventClass import SalientEvent
 import numpy as np
 from gym import Wrapper
@@ -11,6 +10,9 @@ class GoalConditionedMDPWrapper(Wrapper):
     user must specify a start and goal state, and a goal tolerance that represents
     an ball around the goal state.
     All the methods in the class should be batched
+
+    Observations (`cur_state`, `init_state` and the states returned by `reset`/`step`) are fresh arrays
+    that the wrapper never modifies in place, so callers can hold on to them without copying.
     """
     def __init__(self, env, start_state, goal_state, goal_tolerance=0.6):
         super().__init__(env)
@@ -21,7 +23,7 @@ class GoalConditionedMDPWrapper(Wrapper):
         self.goal_tolerance = np.asarray(goal_tolerance)
 
         # set initial states
-        self.cur_state = deepcopy(self.reset())
+        self.cur_state = self.reset()
         self.cur_done = False
 
     def get_start_state_salient_event(self):
@@ -49,8 +51,8 @@ class GoalConditionedMDPWrapper(Wrapper):
         pass
 
     def reset(self):
-        self.init_state = self.env.reset()
-        self.cur_state = deepcopy(self.init_state)
+        self.init_state = np.array(self.env.reset())
+        self.cur_state = self.init_state
         self.cur_done = False
         return self.init_state
     
@@ -59,6 +61,7 @@ class GoalConditionedMDPWrapper(Wrapper):
         overwrite the step function for gc MDP.
         """
         next_state, reward, done, info = self.env.step(action)
+        next_state = np.array(next_state)  # the env may reuse its observation buffer
         self.cur_state = next_state
         self.cur_done = done
         return next_state, reward, done, info
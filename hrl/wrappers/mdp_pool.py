@@ -0,0 +1,126 @@
+import numpy as np
+
+from hrl.utils import get_worker_context
+
+
+class GoalConditionedMDPPool(object):
+    """
+    `num_envs` copies of a GoalConditionedMDPWrapper, each stepped in its own subprocess.
+
+    Observations and actions are exchanged through shared-memory arrays of shape (num_envs, D);
+    only the (small) rewards, dones and infos go through the pipes. `reset`, `step` and `set_xy`
+    are batched over the envs and return copies of the shared observation buffer.
+
+    Args:
+        env_fn (callable): picklable function that builds one seeded GoalConditionedMDPWrapper, `env_fn(seed)`
+        num_envs (int)
+        state_dim (int)
+        action_dim (int)
+        seed (int): env i is built with seed `seed + i`
+    """
+    def __init__(self, env_fn, num_envs, state_dim, action_dim, seed=0):
+        self.num_envs = num_envs
+        self.state_dim = state_dim
+        self.action_dim = action_dim
+
+        context = get_worker_context()
+        self._shared_states = context.RawArray("d", num_envs * state_dim)
+        self._shared_actions = context.RawArray("d", num_envs * action_dim)
+        self.states = np.frombuffer(self._shared_states, dtype=np.float64).reshape(num_envs, state_dim)
+        self.actions = np.frombuffer(self._shared_actions, dtype=np.float64).reshape(num_envs, action_dim)
+
+        self._remotes, self._processes = [], []
+        for i in range(num_envs):
+            remote, worker_remote = context.Pipe()
+            process = context.Process(target=_worker,
+                                      args=(worker_remote, env_fn, seed + i, i,
+                                            self._shared_states, self._shared_actions, state_dim, action_dim),
+                                      daemon=True)
+            process.start()
+            worker_remote.close()
+            self._remotes.append(remote)
+            self._processes.append(process)
+
+        self._remotes[0].send(("get_action_space", None))
+        self.action_space = self._remotes[0].recv()
+
+    def reset(self):
+        self._broadcast("reset")
+        return self.states.copy()
+
+    def step(self, actions, mask=None):
+        """
+        Step the envs selected by `mask` (all of them by default) with the rows of `actions`.
+
+        Returns:
+            next_states (np.ndarray): (num_envs, D); rows of envs that were not stepped are their current states
+            rewards (np.ndarray): (num_envs,), 0 for envs that were not stepped
+            dones (np.ndarray): (num_envs,), False for envs that were not stepped
+            infos (list): info dicts, None for envs that were not stepped
+        """
+        mask = np.ones(self.num_envs, dtype=bool) if mask is None else mask
+        self.actions[mask] = actions[mask]
+
+        indices = np.flatnonzero(mask)
+        for i in indices:
+            self._remotes[i].send(("step", None))
+
+        rewards = np.zeros(self.num_envs)
+        dones = np.zeros(self.num_envs, dtype=bool)
+        infos = [None] * self.num_envs
+        for i in indices:
+            rewards[i], dones[i], infos[i] = self._remotes[i].recv()
+
+        return self.states.copy(), rewards, dones, infos
+
+    def set_xy(self, positions):
+        """ Teleport env i to `positions[i]`. """
+        for remote, position in zip(self._remotes, positions):
+            remote.send(("set_xy", position))
+        for remote in self._remotes:
+            remote.recv()
+        return self.states.copy()
+
+    def sample_actions(self):
+        return np.stack([self.action_space.sample() for _ in range(self.num_envs)])
+
+    def close(self):
+        for remote in self._remotes:
+            remote.send(("close", None))
+        for process in self._processes:
+            process.join()
+
+    def _broadcast(self, command, data=None):
+        for remote in self._remotes:
+            remote.send((command, data))
+        return [remote.recv() for remote in self._remotes]
+
+
+def _worker(remote, env_fn, seed, index, shared_states, shared_actions, state_dim, action_dim):
+    np.random.seed(seed)
+    mdp = env_fn(seed)
+
+    states = np.frombuffer(shared_states, dtype=np.float64).reshape(-1, state_dim)
+    actions = np.frombuffer(shared_actions, dtype=np.float64).reshape(-1, action_dim)
+
+    while True:
+        command, data = remote.recv()
+
+        if command == "step":
+            next_state, reward, done, info = mdp.step(actions[index].copy())
+            states[index] = next_state
+            remote.send((reward, done, info))
+        elif command == "reset":
+            states[index] = mdp.reset()
+            remote.send(None)
+        elif command == "set_xy":
+            mdp.set_xy(data)
+            states[index] = mdp.cur_state
+            remote.send(None)
+        elif command == "get_action_space":
+            remote.send(mdp.action_space)
+        elif command == "close":
+            remote.close()
+            break
+        else:
+            raise NotImplementedError(command)
@@ -0,0 +1,95 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+import torch
+
+from hrl.agent.dsc.checkpoint import ExperimentCheckpointer, TD3_BUFFER_FIELDS
+from hrl.agent.td3.replay_buffer import ReplayBuffer
+
+
+def make_buffer(max_size=10):
+    return ReplayBuffer(state_dim=2, action_dim=1, max_size=max_size, device=torch.device("cpu"))
+
+
+def add_rows(buffer, num_rows):
+    for _ in range(num_rows):
+        row = float(buffer.num_added)
+        buffer.add([row, -row], [row], row, [row + 1, -row - 1], 0.)
+
+
+def save(checkpointer, buffer):
+    """ What `ExperimentCheckpointer.save` does for each replay buffer, without an experiment around it. """
+    buffer_chunks, buffer_progress = [], {}
+    payload = {"buffers": {"td3": checkpointer._snapshot_buffer("td3", buffer, TD3_BUFFER_FIELDS,
+                                                                buffer_chunks, buffer_progress)}}
+    checkpointer._write(payload, buffer_chunks, buffer_progress)
+    return buffer_chunks
+
+
+def restore(checkpointer):
+    with open(checkpointer.checkpoint_path, "rb") as f:
+        payload = pickle.load(f)
+
+    buffer = make_buffer()
+    ExperimentCheckpointer(exp=None, saving_dir=checkpointer.saving_dir)._restore_buffer("td3", buffer,
+                                                                                        payload["buffers"]["td3"])
+    return buffer
+
+
+def assert_same_buffers(restored, buffer):
+    assert (restored.ptr, restored.size, restored.num_added) == (buffer.ptr, buffer.size, buffer.num_added)
+    for field in TD3_BUFFER_FIELDS:
+        assert np.array_equal(getattr(restored, field)[:buffer.size], getattr(buffer, field)[:buffer.size])
+
+
+@pytest.mark.parametrize("rows_between_saves", [[3, 4, 2], [6, 7, 0, 5, 9], [25, 3], [10, 10, 1]])
+def test_restored_buffer_matches_the_saved_one(tmp_path, rows_between_saves):
+    checkpointer = ExperimentCheckpointer(exp=None, saving_dir=str(tmp_path))
+    buffer = make_buffer(max_size=10)
+
+    for num_rows in rows_between_saves:
+        add_rows(buffer, num_rows)
+        save(checkpointer, buffer)
+        assert_same_buffers(restore(checkpointer), buffer)
+
+        # Chunks whose rows have all been overwritten are deleted
+        num_rows_on_disk = sum(len(np.load(path)["state"]) for path in tmp_path.glob("replay/*.npz"))
+        assert num_rows_on_disk < 2 * buffer.max_size
+
+
+def test_wrapped_buffer_only_writes_the_new_rows(tmp_path):
+    checkpointer = ExperimentCheckpointer(exp=None, saving_dir=str(tmp_path))
+    buffer = make_buffer(max_size=10)
+    add_rows(buffer, 8)
+    save(checkpointer, buffer)
+
+    add_rows(buffer, 4)  # wraps around: positions 8, 9, 0, 1
+    chunks = save(checkpointer, buffer)
+    assert [arrays["state"][:, 0].tolist() for _, arrays in chunks] == [[8., 9.], [10., 11.]]
+
+    assert save(checkpointer, buffer) == []
+    assert_same_buffers(restore(checkpointer), buffer)
+
+
+def test_failed_write_does_not_advance_the_saved_rows(tmp_path, monkeypatch):
+    checkpointer = ExperimentCheckpointer(exp=None, saving_dir=str(tmp_path))
+    buffer = make_buffer(max_size=10)
+    add_rows(buffer, 3)
+    save(checkpointer, buffer)
+
+    def failing_savez(*args, **kwargs):
+        raise OSError("disk full")
+
+    add_rows(buffer, 4)
+    with monkeypatch.context() as patch:
+        patch.setattr(np, "savez", failing_savez)
+        with pytest.raises(OSError):
+            save(checkpointer, buffer)
+
+    add_rows(buffer, 2)
+    chunks = save(checkpointer, buffer)
+    assert [arrays["state"][:, 0].tolist() for _, arrays in chunks] == [[3., 4., 5., 6., 7., 8.]]
+    assert_same_buffers(restore(checkpointer), buffer)
+    assert len(os.listdir(os.path.join(str(tmp_path), "replay"))) == 2
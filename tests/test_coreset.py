@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from hrl.agent.dsc.coreset import select_coreset, _get_cell_ids
+
+
+def naive_k_center(X, max_size, first_index):
+    """ Farthest-point traversal, recomputing every distance to the coreset from scratch. """
+    indices = [first_index]
+    while len(indices) < max_size:
+        distances = np.linalg.norm(X[:, None, :] - X[None, indices, :], axis=2).min(axis=1)
+        indices.append(int(np.argmax(distances)))
+    return sorted(indices)
+
+
+def naive_cells(X, low, cell_size):
+    """ Group the rows by the tuple of their grid coordinates. """
+    cells = {}
+    for i, row in enumerate(X):
+        cells.setdefault(tuple(np.floor((row - low) / cell_size).astype(int)), []).append(i)
+    return sorted(cells.values())
+
+
+def group_by(cell_ids):
+    groups = {}
+    for i, cell_id in enumerate(cell_ids.tolist()):
+        groups.setdefault(cell_id, []).append(i)
+    return sorted(groups.values())
+
+
+@pytest.mark.parametrize("num_rows,max_size", [(200, 10), (500, 64)])
+def test_k_center_matches_the_naive_traversal(num_rows, max_size):
+    X = np.random.RandomState(0).uniform(-3, 3, size=(num_rows, 2))
+    first_index = np.random.RandomState(7).randint(num_rows)  # the first draw of `select_coreset(seed=7)`
+
+    indices = select_coreset(X, max_size, method="k_center", seed=7)
+    assert indices.tolist() == naive_k_center(X, max_size, first_index)
+
+
+@pytest.mark.parametrize("num_features,cell_size", [(2, 0.3), (29, 1e-6)])  # 29 tiny cells overflow int64 ids
+def test_cell_ids_group_the_rows_like_the_grid_coordinates(num_features, cell_size):
+    X = np.random.RandomState(1).uniform(0, 1, size=(300, num_features))
+    X[100:150] = X[:50]  # some shared cells
+    low = X.min(axis=0)
+
+    assert group_by(_get_cell_ids(X, low, cell_size)) == naive_cells(X, low, cell_size)
+
+
+def test_grid_coreset_keeps_one_point_per_occupied_cell():
+    rng = np.random.RandomState(2)
+    centers = np.array([[0., 0.], [5., 0.], [0., 5.], [5., 5.], [10., 10.]])
+    X = np.concatenate([center + rng.normal(scale=0.05, size=(100, 2)) for center in centers])
+
+    indices = select_coreset(X, max_size=20, method="grid", seed=3)
+
+    assert 5 <= len(indices) <= 20 and len(np.unique(indices)) == len(indices)
+    nearest_centers = np.linalg.norm(X[indices][:, None] - centers[None], axis=2).argmin(axis=1)
+    assert set(nearest_centers.tolist()) == set(range(len(centers)))  # every cluster is represented
+    assert np.array_equal(indices, select_coreset(X, max_size=20, method="grid", seed=3))
+
+
+@pytest.mark.parametrize("method", ["grid", "k_center"])
+def test_small_inputs_and_disabled_caps_keep_every_row(method):
+    X = np.random.RandomState(4).uniform(size=(30, 2))
+    assert select_coreset(X, max_size=30, method=method).tolist() == list(range(30))
+    assert select_coreset(X, max_size=0, method=method).tolist() == list(range(30))
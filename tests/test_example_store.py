@@ -0,0 +1,72 @@
+import copy
+
+import numpy as np
+import pytest
+
+from hrl.agent.dsc.example_store import ExampleStore
+
+
+def make_trajectories(num_trajectories, num_features=2, seed=0):
+    rng = np.random.RandomState(seed)
+    return [rng.normal(size=(rng.randint(1, 40), num_features)) for _ in range(num_trajectories)]
+
+
+def test_store_matches_a_list_of_trajectories():
+    trajectories = make_trajectories(30)
+    store = ExampleStore(initial_capacity=8)  # grows several times
+
+    for trajectory in trajectories:
+        store.append(trajectory)
+
+    assert len(store) == len(trajectories)
+    for idx in (0, 7, -1, -len(trajectories)):
+        assert np.array_equal(store[idx], trajectories[idx])
+    assert all(np.array_equal(a, b) for a, b in zip(store, trajectories))
+    assert np.array_equal(store.feature_matrix(), np.concatenate(trajectories))
+
+    with pytest.raises(IndexError):
+        store[len(trajectories)]
+
+
+def test_views_are_read_only_and_copies_are_independent():
+    trajectories = make_trajectories(5)
+    store = ExampleStore(initial_capacity=4)
+    for trajectory in trajectories[:3]:
+        store.append(trajectory)
+
+    with pytest.raises(ValueError):
+        store[0][0, 0] = 1.
+    with pytest.raises(ValueError):
+        store.feature_matrix()[0, 0] = 1.
+
+    snapshot = copy.copy(store)
+    for trajectory in trajectories[3:]:
+        store.append(trajectory)
+
+    assert len(snapshot) == 3 and len(store) == 5
+    assert np.array_equal(snapshot.feature_matrix(), np.concatenate(trajectories[:3]))
+    assert np.array_equal(store.feature_matrix(), np.concatenate(trajectories))
+
+
+def test_empty_store():
+    store = ExampleStore()
+    assert len(store) == 0 and list(store) == []
+    assert store.feature_matrix().shape == (0, 0)
+
+
+def test_side_store_returns_the_full_states(tmp_path):
+    trajectories = make_trajectories(6, num_features=5, seed=1)
+    store = ExampleStore(side_store_path=str(tmp_path / "states.bin"), initial_capacity=4)
+    for trajectory in trajectories:
+        store.append(trajectory[:, :2], states=trajectory)
+
+    for idx in range(-1, len(trajectories)):
+        assert np.array_equal(store.get_states(idx), trajectories[idx])
+        assert np.array_equal(store[idx], trajectories[idx][:, :2])
+
+
+def test_get_states_requires_a_side_store():
+    store = ExampleStore()
+    store.append(np.zeros((2, 2)))
+    with pytest.raises(AssertionError):
+        store.get_states(0)
@@ -0,0 +1,62 @@
+import numpy as np
+
+from hrl.agent.dsc.initiation_raster import InitiationRaster
+
+
+class DiskClassifier(object):
+    """ +1 inside the disk of radius 2 around (1, 1), -1 outside (the sklearn/thundersvm convention). """
+    def __init__(self):
+        self.num_predicted_rows = 0
+
+    def predict(self, X):
+        X = np.asarray(X)
+        self.num_predicted_rows += len(X)
+        return np.where(self.distance_to_boundary(X) < 0, 1, -1)
+
+    @staticmethod
+    def distance_to_boundary(X):
+        return np.linalg.norm(X - np.array([1., 1.]), axis=1) - 2.
+
+
+def naive_predict(classifier, low, high, resolution, X):
+    """ The exact classifier at the nearest cell center, found by scanning every center; exact outside. """
+    xs = np.arange(low[0], high[0] + resolution, resolution)
+    ys = np.arange(low[1], high[1] + resolution, resolution)
+    centers = np.array([(x, y) for x in xs for y in ys])
+
+    predictions = []
+    for point in X:
+        if np.all(point >= low - resolution / 2) and np.all(point < high + resolution / 2):
+            point = centers[np.argmin(np.abs(centers - point).max(axis=1))]
+        predictions.append(int(classifier.predict([point])[0] == 1))
+    return np.array(predictions)
+
+
+def test_raster_matches_the_nearest_cell_center():
+    classifier = DiskClassifier()
+    low, high, resolution = np.array([-2., -1.]), np.array([4., 3.]), 0.25
+    raster = InitiationRaster(classifier, low, high, resolution)
+
+    X = np.random.RandomState(0).uniform(-3, 5, size=(500, 2))  # partly outside of the extents
+    assert np.array_equal(raster.predict(X), naive_predict(classifier, low, high, resolution, X))
+
+
+def test_raster_agrees_with_the_classifier_away_from_the_boundary():
+    classifier = DiskClassifier()
+    raster = InitiationRaster(classifier, (-2., -2.), (4., 4.), resolution=0.1)
+
+    X = np.random.RandomState(1).uniform(-2, 4, size=(2000, 2))
+    far = np.abs(classifier.distance_to_boundary(X)) > 0.1
+    assert np.array_equal(raster.predict(X[far]), classifier.predict(X[far]) == 1)
+
+
+def test_queries_inside_the_extents_are_lookups():
+    classifier = DiskClassifier()
+    raster = InitiationRaster(classifier, (-2., -2.), (4., 4.), resolution=0.5)
+    num_built_rows = classifier.num_predicted_rows
+
+    raster.predict(np.random.RandomState(2).uniform(-2, 4, size=(100, 2)))
+    assert classifier.num_predicted_rows == num_built_rows
+
+    raster.predict([[10., 10.], [0., 0.]])
+    assert classifier.num_predicted_rows == num_built_rows + 1
@@ -0,0 +1,68 @@
+import threading
+
+import numpy as np
+
+from hrl.metrics_log import MetricsLog, follow_metrics_log, read_metrics_log, stream_metrics_log
+
+
+def test_read_log_matches_the_merged_dict(tmp_path):
+    path = str(tmp_path / "log.jsonl")
+    metrics_log = MetricsLog(path, flush_every=3)
+    rng = np.random.RandomState(0)
+
+    expected = {}  # the dict the experiments used to pickle
+    for episode in range(20):
+        metrics = {"success": float(rng.rand() < 0.5), "step-count": np.float64(rng.randint(200))}
+        if episode % 4 == 0:
+            metrics["eval-success"] = np.float32(0.5)
+        metrics_log.write(episode, metrics)
+        expected.setdefault(episode, {}).update(metrics)
+
+    metrics_log.write(3, {"eval-success": 1.})  # a later record of an earlier episode
+    expected[3]["eval-success"] = 1.
+    metrics_log.close()
+
+    assert read_metrics_log(path) == expected
+
+
+def test_stream_skips_a_line_that_is_still_being_written(tmp_path):
+    path = tmp_path / "log.jsonl"
+    path.write_text('{"episode": 0, "success": 1.0}\n{"episode": 1, "succ')
+    assert list(stream_metrics_log(str(path))) == [{"episode": 0, "success": 1.0}]
+
+
+def test_follow_yields_records_as_they_are_appended(tmp_path):
+    path = str(tmp_path / "log.jsonl")
+
+    def write_slowly():
+        with open(path, "w") as f:
+            f.write('{"episode": 0, "success": 1.0}\n{"episode": 1, ')
+            f.flush()
+            threading.Event().wait(0.2)
+            f.write('"success": 0.0}\n')
+            f.flush()
+
+    writer = threading.Timer(0.1, write_slowly)  # starts before the file exists
+    writer.start()
+    records = list(follow_metrics_log(path, poll_interval=0.02, timeout=0.5))
+    writer.join()
+
+    assert records == [{"episode": 0, "success": 1.0}, {"episode": 1, "success": 0.0}]
+
+
+def test_new_logs_truncate_and_reopened_logs_append(tmp_path):
+    path = str(tmp_path / "log.jsonl")
+    old_log = MetricsLog(path)
+    old_log.write(0, {"success": 1.})
+    old_log.close()
+
+    metrics_log = MetricsLog(path)
+    metrics_log.write(5, {"success": 0.})
+    metrics_log.close()
+    metrics_log.write(6, {"success": 1.})
+    metrics_log.close()
+    assert read_metrics_log(path) == {5: {"success": 0.}, 6: {"success": 1.}}
+
+    metrics_log.rewrite({1: {"success": 1.}, 0: {"success": 0.}})  # eg, resuming from a checkpoint
+    metrics_log.close()
+    assert [record["episode"] for record in stream_metrics_log(path)] == [0, 1]
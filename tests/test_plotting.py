@@ -0,0 +1,207 @@
+import os
+import time
+import threading
+
+import numpy as np
+import pytest
+
+from hrl.agent.dsc.plotting import PlottingWorker
+from hrl.agent.dsc.MBOptionClass import ModelBasedOption
+from hrl.agent.dsc.classifier_backends import CLASSIFIER_BACKENDS, make_classifier_backend
+from hrl.agent.dsc.utils import (get_grid_states, snapshot_initiation_set, snapshot_two_class_classifier_plot,
+                                 _classify_initiation_set)
+
+
+class CountingClassifier(object):
+    """ Inside the disk of radius 1.5 around `center`; counts its `predict` calls. """
+    def __init__(self, center):
+        self.center = np.array(center)
+        self.num_predict_calls = 0
+
+    def predict(self, features):
+        self.num_predict_calls += 1
+        return np.where(self._score(np.asarray(features)) > 0, 1, -1)
+
+    def decision_function(self, features):
+        return self._score(np.asarray(features))
+
+    def _score(self, features):
+        return 1.5 - np.linalg.norm(features - self.center, axis=1)
+
+
+class GridMDP(object):
+    def get_x_y_low_lims(self):
+        return -2, -2
+
+    def get_x_y_high_lims(self):
+        return 4, 4
+
+    def extract_features_for_initiation_classifier(self, states):
+        return states[..., :2]
+
+    def get_start_state_salient_event(self):
+        return lambda positions: np.linalg.norm(np.atleast_2d(positions), axis=-1) < 0.5
+
+
+class StubOption(object):
+    """ The attributes of a ModelBasedOption that the initiation-set plots read. """
+    def __init__(self, phase="initiation_done", is_last_option=False):
+        self.name = "option_1"
+        self.option_idx = 1
+        self.mdp = self.overall_mdp = GridMDP()
+        self.mdp.env = object()  # no wrapped maze env: no collision checks
+        self.global_init = False
+        self.phase = phase
+        self.is_last_option = is_last_option
+        self.optimistic_classifier = CountingClassifier((2., 2.))
+        self.pessimistic_classifier = CountingClassifier((0., 2.))
+        self.optimistic_raster = self.pessimistic_raster = None
+        self.positive_examples = np.random.RandomState(0).uniform(-1, 3, size=(20, 2))
+        self.negative_examples = np.random.RandomState(1).uniform(-1, 3, size=(5, 2))
+
+    def get_training_phase(self):
+        return self.phase
+
+    def construct_feature_matrix(self, examples):
+        return examples
+
+    def is_init_true(self, state):
+        """ The per-state rule of `ModelBasedOption.is_init_true`. """
+        if self.global_init or self.get_training_phase() == "gestation":
+            return True
+        if self.is_last_option and self.mdp.get_start_state_salient_event()(state):
+            return True
+        return self.optimistic_classifier.predict([state])[0] == 1 or self.pessimistic_classifier.predict([state])[0] == 1
+
+
+@pytest.mark.parametrize("phase,is_last_option", [("initiation_done", False), ("initiation_done", True),
+                                                  ("gestation", False)])
+def test_initiation_set_snapshot_matches_is_init_true(phase, is_last_option):
+    option = StubOption(phase, is_last_option)
+    states = np.array(get_grid_states(option.mdp))
+
+    expected = [option.is_init_true(state) for state in states]
+    assert snapshot_initiation_set(option)(states).tolist() == expected
+
+
+def test_initiation_set_snapshot_keeps_classifiers_of_the_snapshot():
+    option = StubOption()
+    initiation_set = snapshot_initiation_set(option)
+    snapshot_classifier = option.optimistic_classifier
+
+    option.optimistic_classifier = CountingClassifier((-10., -10.))  # a refit swaps in a new classifier
+    initiation_set(np.array(get_grid_states(option.mdp)))
+
+    assert snapshot_classifier.num_predict_calls == 1
+    assert option.optimistic_classifier.num_predict_calls == 0
+
+
+def test_enqueueing_initiation_set_plot_does_not_classify(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(os.path.join("results", "test", "initiation_set_plots"))
+
+    option = StubOption()
+    worker = PlottingWorker(max_queued_jobs=2)
+    gate = threading.Event()
+    worker.submit("gate", gate.wait)
+
+    worker.submit(*snapshot_two_class_classifier_plot(option, episode=1, experiment_name="test"))
+    assert option.optimistic_classifier.num_predict_calls == 0
+    assert option.pessimistic_classifier.num_predict_calls == 0
+
+    gate.set()
+    worker.wait()
+    assert option.optimistic_classifier.num_predict_calls > 0
+    assert os.path.exists(os.path.join("results", "test", "initiation_set_plots",
+                                       "option_1_test_1_initiation_classifier_0.png"))
+
+
+def test_worker_replaces_jobs_writing_the_same_file_and_drops_the_oldest():
+    worker = PlottingWorker(max_queued_jobs=2)
+    gate = threading.Event()
+    rendered = []
+
+    worker.submit("running", lambda: (gate.wait(), rendered.append("running")))
+    time.sleep(0.1)  # let the worker pick up the first job
+
+    worker.submit("a", lambda: rendered.append("a1"))
+    worker.submit("a", lambda: rendered.append("a2"))  # replaces a1
+    worker.submit("b", lambda: rendered.append("b"))
+    worker.submit("c", lambda: rendered.append("c"))  # queue full: drops a2
+
+    gate.set()
+    worker.wait()
+    assert rendered == ["running", "b", "c"]
+    assert worker.num_dropped_jobs == 2
+
+
+def test_worker_reraises_job_errors_in_the_caller():
+    worker = PlottingWorker(max_queued_jobs=1)
+    worker.submit("error", lambda: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        worker.wait()
+
+    rendered = []
+    worker.submit("after", lambda: rendered.append("after"))
+    worker.wait()
+    assert rendered == ["after"]
+
+
+class BufferedClassifier(CountingClassifier):
+    """ Keeps its predictions on the instance between the call and the read, as the thundersvm wrapper does. """
+    def predict(self, features):
+        self._labels = super(BufferedClassifier, self).predict(features)
+        time.sleep(1e-4)
+        return self._labels
+
+
+def classify_concurrently(classifier, num_iterations=100):
+    """
+    Classify a grid in a plotting thread while training predicts one state at a time with the same pessimistic
+    classifier; returns the number of results that differ from the serial ones (or that raised).
+    """
+    option = ModelBasedOption.__new__(ModelBasedOption)
+    option.global_init = False
+    option.num_goal_hits, option.gestation_period = 2, 2
+    option.pessimistic_classifier, option.pessimistic_raster = classifier, None
+
+    mdp = GridMDP()
+    mdp.env = object()
+    grid = np.random.RandomState(0).uniform(-2, 4, size=(500, 2))
+    states = grid[:20]
+
+    expected_grid = _classify_initiation_set(mdp, False, None, None, classifier, grid)
+    expected_states = [option.batched_pessimistic_is_init_true(state[None]) for state in states]
+    num_mismatches = [0]
+
+    def check(get_result, expected):
+        try:
+            if not np.array_equal(get_result(), expected):
+                num_mismatches[0] += 1
+        except Exception:
+            num_mismatches[0] += 1
+
+    def plot():
+        for _ in range(num_iterations):
+            check(lambda: _classify_initiation_set(mdp, False, None, None, classifier, grid), expected_grid)
+
+    plotting_thread = threading.Thread(target=plot)
+    plotting_thread.start()
+    while plotting_thread.is_alive():
+        for state, expected in zip(states, expected_states):
+            check(lambda: option.batched_pessimistic_is_init_true(state[None]), expected)
+    plotting_thread.join()
+
+    return num_mismatches[0]
+
+
+@pytest.mark.parametrize("backend", [name for name, backend in CLASSIFIER_BACKENDS.items() if backend.thread_safe])
+def test_thread_safe_backends_classify_concurrently_with_training(backend):
+    X = np.random.RandomState(1).normal(loc=1., size=(200, 2))
+    classifier = make_classifier_backend(backend, num_kernel_features=64).one_class(nu=0.1).fit(X)
+
+    assert classify_concurrently(classifier) == 0
+
+
+def test_concurrent_classification_detects_classifiers_that_share_their_output():
+    assert classify_concurrently(BufferedClassifier((0., 2.)), num_iterations=20) > 0
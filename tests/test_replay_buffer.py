@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+import torch
+
+from hrl.agent.td3.replay_buffer import SumTree, PrioritizedReplayBuffer
+
+
+def naive_find(priorities, values):
+    """ Linear scan: the first leaf whose cumulative priority reaches each value. """
+    return np.searchsorted(np.cumsum(priorities), values, side="left")
+
+
+def make_buffer(num_rows, max_size=100, **kwargs):
+    buffer = PrioritizedReplayBuffer(state_dim=2, action_dim=1, max_size=max_size, device=torch.device("cpu"),
+                                     **kwargs)
+    for i in range(num_rows):
+        buffer.add([i, -i], [0.], 0., [i + 1, -i - 1], 0.)
+    return buffer
+
+
+@pytest.mark.parametrize("capacity", [1, 7, 64, 100])
+def test_sum_tree_find_matches_the_prefix_sums(capacity):
+    rng = np.random.RandomState(capacity)
+    tree = SumTree(capacity)
+    priorities = rng.uniform(0.1, 2., size=capacity)
+    tree.update(np.arange(capacity), priorities)
+
+    values = rng.uniform(0, priorities.sum(), size=1000)
+    assert np.isclose(tree.total(), priorities.sum())
+    assert np.array_equal(tree.find(values), naive_find(priorities, values))
+
+
+def test_sum_tree_updates_keep_every_node_the_sum_of_its_children():
+    rng = np.random.RandomState(0)
+    tree = SumTree(50)
+    priorities = np.zeros(tree.capacity)
+
+    for _ in range(20):
+        indices = rng.randint(0, 50, size=8)
+        new_priorities = rng.uniform(0., 3., size=8)
+        tree.update(indices, new_priorities)
+        for index, priority in zip(indices, new_priorities):  # the last write to a repeated index wins
+            priorities[index] = priority
+
+        assert np.allclose(tree[np.arange(50)], priorities[:50])
+        internal_nodes = np.arange(1, tree.capacity)
+        assert np.allclose(tree.tree[internal_nodes], tree.tree[2 * internal_nodes] + tree.tree[2 * internal_nodes + 1])
+
+        values = rng.uniform(0, priorities.sum(), size=200)
+        assert np.array_equal(tree.find(values), naive_find(priorities, values))
+
+
+def test_new_transitions_get_the_max_priority_and_updates_follow_the_td_errors():
+    buffer = make_buffer(num_rows=4, alpha=0.5, eps=1e-2)
+    assert np.allclose(buffer.tree[np.arange(4)], 1.)
+
+    buffer.update_priorities(np.array([1, 3]), np.array([-3., 0.]))
+    assert np.allclose(buffer.tree[np.arange(4)], [1., (3. + 1e-2) ** 0.5, 1., (1e-2) ** 0.5])
+    assert buffer.max_priority == 3. + 1e-2
+
+    buffer.add([9., 9.], [0.], 0., [9., 9.], 0.)
+    assert np.isclose(buffer.tree[4], (3. + 1e-2) ** 0.5)
+
+
+def test_sampling_frequencies_follow_the_priorities():
+    np.random.seed(0)
+    buffer = make_buffer(num_rows=5)
+    priorities = np.array([1., 2., 3., 4., 10.])
+    buffer.tree.update(np.arange(5), priorities)
+
+    counts = np.zeros(5)
+    for _ in range(500):
+        *_, indices = buffer.sample(batch_size=20)
+        counts += np.bincount(indices, minlength=5)
+
+    assert np.allclose(counts / counts.sum(), priorities / priorities.sum(), atol=0.01)
+
+
+def test_importance_sampling_weights_and_beta_annealing():
+    np.random.seed(1)
+    buffer = make_buffer(num_rows=10, beta=0.4, beta_increment=0.25)
+    priorities = np.random.uniform(0.5, 5., size=10)
+    buffer.tree.update(np.arange(10), priorities)
+
+    for beta in (0.4, 0.65, 0.9, 1., 1.):
+        assert np.isclose(buffer.beta, beta)
+        *_, weights, indices = buffer.sample(batch_size=8)
+
+        # w_i = (N P(i)) ^ -beta, normalized by the largest weight of the batch
+        expected = (10 * priorities[indices] / priorities.sum()) ** (-beta)
+        assert np.allclose(weights.numpy().ravel(), expected / expected.max(), rtol=1e-5)
+        assert weights.max().item() == pytest.approx(1.)
@@ -0,0 +1,75 @@
+import random
+
+from treelib import Tree
+
+from hrl.agent.dsc.utils import SkillTree
+
+
+class StubOption(object):
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        self.phase = "gestation"
+
+    def get_training_phase(self):
+        return self.phase
+
+    def __repr__(self):
+        return self.name
+
+
+def naive_bfs_order(skill_tree):
+    """ What `act` used to do on every decision: walk the treelib tree level by level. """
+    return [skill_tree.get_option(name) for name in skill_tree._tree.expand_tree(mode=Tree.WIDTH)]
+
+
+def naive_options_in_phase(skill_tree, training_phase):
+    return [option for option in naive_bfs_order(skill_tree) if option.get_training_phase() == training_phase]
+
+
+def grow_random_tree(seed, num_options=40):
+    rng = random.Random(seed)
+    root = StubOption("goal-option")
+    skill_tree = SkillTree(options=[root])
+    options = [root]
+
+    for i in range(1, num_options):
+        option = StubOption(f"option-{i}", parent=rng.choice(options))
+        skill_tree.add_node(option)
+        options.append(option)
+
+        for rolled_out_option in rng.sample(options, min(3, len(options))):
+            if rng.random() < 0.3:
+                rolled_out_option.phase = "initiation_done"
+                skill_tree.update_training_phase(rolled_out_option)
+
+        yield skill_tree, options
+
+
+def test_cached_bfs_order_and_phases_match_the_tree_traversal():
+    for seed in range(5):
+        for skill_tree, _ in grow_random_tree(seed):
+            assert skill_tree.get_options_in_bfs_order() == naive_bfs_order(skill_tree)
+            assert skill_tree.traverse() == [option.name for option in naive_bfs_order(skill_tree)]
+            for training_phase in SkillTree.TRAINING_PHASES:
+                assert skill_tree.get_options_in_phase(training_phase) == \
+                       naive_options_in_phase(skill_tree, training_phase)
+
+
+def test_phase_changes_are_picked_up_by_update_training_phases():
+    *_, (skill_tree, options) = grow_random_tree(seed=0, num_options=10)
+    for option in options:  # eg, counters restored from a checkpoint
+        option.phase = "initiation_done" if option.phase == "gestation" else "gestation"
+
+    skill_tree.update_training_phases()
+    for training_phase in SkillTree.TRAINING_PHASES:
+        assert skill_tree.get_options_in_phase(training_phase) == naive_options_in_phase(skill_tree, training_phase)
+
+
+def test_options_outside_of_the_tree_are_ignored():
+    skill_tree = SkillTree(options=[StubOption("goal-option")])
+    global_option = StubOption("global-option")
+    global_option.phase = "initiation_done"
+
+    skill_tree.update_training_phase(global_option)
+    assert skill_tree.get_options_in_phase("initiation_done") == []
@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from hrl.agent.dsc.example_store import ExampleStore
+from hrl.agent.dsc.MBOptionClass import ModelBasedOption
+
+
+class DiskClassifier(object):
+    """ Pessimistic region: the disk of radius 1 around the origin. """
+    def predict(self, features):
+        return np.where(np.linalg.norm(np.asarray(features), axis=1) < 1., 1, -1)
+
+
+def make_option(num_goal_hits):
+    option = ModelBasedOption.__new__(ModelBasedOption)
+    option.global_init = False
+    option.num_goal_hits = num_goal_hits
+    option.gestation_period = 2
+    option.classifier_version = 0
+    option._subgoal_cache = None
+    option.pessimistic_classifier = DiskClassifier()
+    option.pessimistic_raster = None
+    option.target_salient_event = SimpleNamespace(tolerance=0.1)
+    option.positive_examples = ExampleStore()
+    option.positive_examples.append(np.array([[0., 0.], [0.5, 0.], [0.95, 0.], [3., 3.]]))
+    return option
+
+
+def test_subgoal_rows_match_the_uncached_classification():
+    option = make_option(num_goal_hits=2)
+    valid_rows, inside_rows = option.get_subgoal_rows()
+    expected_valid, expected_inside = option._classify_subgoal_candidates(option.positive_examples.feature_matrix())
+
+    assert valid_rows.tolist() == expected_valid.tolist() == [True, True, False, False]
+    assert inside_rows.tolist() == expected_inside.tolist() == [True, True, True, False]
+
+
+def test_subgoal_rows_are_reclassified_when_the_option_leaves_gestation():
+    option = make_option(num_goal_hits=0)
+    valid_rows, inside_rows = option.get_subgoal_rows()
+    assert valid_rows.all() and inside_rows.all()
+
+    option.num_goal_hits = 2  # initiation_done, without a refit (ie, without a new classifier_version)
+    valid_rows, inside_rows = option.get_subgoal_rows()
+    assert valid_rows.tolist() == [True, True, False, False]
+    assert inside_rows.tolist() == [True, True, True, False]
+
+
+def test_subgoal_rows_classify_new_examples_incrementally():
+    option = make_option(num_goal_hits=2)
+    option.get_subgoal_rows()
+
+    option.positive_examples.append(np.array([[0., 0.5], [2., 0.]]))
+    valid_rows, inside_rows = option.get_subgoal_rows()
+    assert valid_rows.tolist() == [True, True, False, False, True, False]
+    assert inside_rows.tolist() == [True, True, True, False, True, False]
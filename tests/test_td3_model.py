@@ -0,0 +1,39 @@
+import torch
+
+from hrl.agent.td3.model import Critic, TwinCritic
+
+
+def make_critics(state_dim=29, action_dim=8):
+    torch.manual_seed(0)
+    critic = Critic(state_dim, action_dim)
+    twin_critic = TwinCritic(state_dim, action_dim)
+    twin_critic.load_critic_state_dict(critic.state_dict())
+
+    state, action = torch.randn(64, state_dim), torch.randn(64, action_dim)
+    return critic, twin_critic, state, action
+
+
+def test_twin_critic_forward_and_q1_are_bit_identical():
+    critic, twin_critic, state, action = make_critics()
+
+    q1, q2 = critic(state, action)
+    twin_q1, twin_q2 = twin_critic(state, action)
+
+    assert torch.equal(q1, twin_q1) and torch.equal(q2, twin_q2)
+    assert torch.equal(critic.Q1(state, action), twin_critic.Q1(state, action))
+
+
+def test_twin_critic_gradients_are_bit_identical():
+    critic, twin_critic, state, action = make_critics()
+    target = torch.randn(64, 1)
+
+    for module in (critic, twin_critic):
+        q1, q2 = module(state, action)
+        (((q1 - target) ** 2).mean() + ((q2 - target) ** 2).mean()).backward()
+
+    # The shared input layer holds the Q1 rows first, then the Q2 rows
+    assert torch.equal(twin_critic.l1.weight.grad, torch.cat([critic.l1.weight.grad, critic.l4.weight.grad]))
+    assert torch.equal(twin_critic.l1.bias.grad, torch.cat([critic.l1.bias.grad, critic.l4.bias.grad]))
+    for name in ("l2", "l3", "l5", "l6"):
+        assert torch.equal(getattr(twin_critic, name).weight.grad, getattr(critic, name).weight.grad)
+        assert torch.equal(getattr(twin_critic, name).bias.grad, getattr(critic, name).bias.grad)
@@ -0,0 +1,67 @@
+import numpy as np
+
+from hrl.agent.td3.value_cache import ValueQueryCache
+
+
+class CountingValueFunction(object):
+    """ V(s, g) = sum of the coordinates; records the batches it evaluates. """
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, augmented_states):
+        self.batches.append(augmented_states.copy())
+        return augmented_states.sum(axis=1, keepdims=True).astype(np.float32)
+
+
+def test_query_matches_the_uncached_values():
+    value_fn = CountingValueFunction()
+    cache = ValueQueryCache(invalidate_every=100)
+    states = np.random.RandomState(0).uniform(-5, 5, size=(50, 4))
+
+    for batch in (states[:30], states[10:50], states[::3]):
+        values = cache.query(batch, version=0, value_fn=value_fn)
+        assert values.shape == (len(batch), 1)
+        assert np.allclose(values, batch.sum(axis=1, keepdims=True))
+
+    evaluated = np.concatenate(value_fn.batches)
+    assert len(evaluated) == len(np.unique(evaluated, axis=0)) == 50
+    assert (cache.hits, cache.misses) == (len(states[10:30]) + len(states[::3]), 50)
+
+
+def test_repeated_rows_are_evaluated_once_per_batch():
+    value_fn = CountingValueFunction()
+    cache = ValueQueryCache(invalidate_every=100)
+    states = np.array([[0., 1.], [2., 3.], [0., 1.], [0., 1.0001], [2., 3.]])
+
+    values = cache.query(states, version=0, value_fn=value_fn)
+
+    assert values.ravel().tolist() == [1., 5., 1., 1., 5.]  # rows equal up to `resolution` share a value
+    assert len(value_fn.batches) == 1 and value_fn.batches[0].tolist() == [[0., 1.], [2., 3.]]
+    assert (cache.hits, cache.misses) == (0, 5)
+
+
+def test_cache_is_dropped_every_invalidate_every_updates():
+    value_fn = CountingValueFunction()
+    cache = ValueQueryCache(invalidate_every=10)
+    states = np.array([[0., 1.], [2., 3.]])
+
+    cache.query(states, version=3, value_fn=value_fn)
+    cache.query(states, version=9, value_fn=value_fn)
+    assert len(value_fn.batches) == 1
+
+    cache.query(states, version=10, value_fn=value_fn)
+    assert len(value_fn.batches) == 2
+
+
+def test_large_batches_and_full_caches():
+    value_fn = CountingValueFunction()
+    cache = ValueQueryCache(invalidate_every=10, max_entries=3, max_query_size=4)
+    states = np.arange(10.).reshape(5, 2)
+
+    assert np.allclose(cache.query(states, version=0, value_fn=value_fn), states.sum(axis=1, keepdims=True))
+    assert len(cache) == 0  # bypassed the cache
+
+    cache.query(states[:4], version=0, value_fn=value_fn)
+    assert len(cache) == 3
+    cache.query(states[:1], version=0, value_fn=value_fn)  # the oldest entry was evicted
+    assert value_fn.batches[-1].tolist() == [[0., 1.]]